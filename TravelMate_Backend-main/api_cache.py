@@ -0,0 +1,258 @@
+# Two-tier (memory LRU + SQLite) TTL cache for external API responses
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+# Default time-to-live per source, in seconds. Overridable with CACHE_TTL_<SOURCE>.
+DEFAULT_TTLS = {
+    "maps": 24 * 3600,            # Place lists change slowly
+    "wikipedia": 7 * 24 * 3600,   # Extracts change even slower
+    "gemini": 24 * 3600,
+}
+DEFAULT_TTL = 3600
+
+
+def normalize(value, case_sensitive=False):
+    """Normalizes request parameters so that trivially different calls share a cache entry."""
+    if isinstance(value, str):
+        value = re.sub(r"\s+", " ", value).strip()
+        return value if case_sensitive else value.casefold()
+    if isinstance(value, (list, tuple)):
+        return [normalize(v, case_sensitive) for v in value]
+    if isinstance(value, dict):
+        return {str(k): normalize(v, case_sensitive) for k, v in sorted(value.items())}
+    return value
+
+
+def make_key(*args, case_sensitive=False, **kwargs):
+    """Builds a stable cache key from normalized positional and keyword arguments."""
+    payload = json.dumps(normalize([args, kwargs], case_sensitive), sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Response cache with an in-memory LRU tier in front of an optional on-disk SQLite tier.
+
+    Entries expire after a per-source TTL. Values must be JSON-serializable.
+    The SQLite tier survives restarts and is shared by all workers on the host.
+    """
+
+    def __init__(self, path=None, max_entries=1024, max_disk_entries=100000, ttls=None):
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = defaultdict(lambda: {"hits": 0, "disk_hits": 0, "misses": 0})
+
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " source TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (source, key))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            self._conn.commit()
+
+    def ttl(self, source):
+        return float(os.getenv(f"CACHE_TTL_{source.upper()}", self.ttls.get(source, DEFAULT_TTL)))
+
+    def _remember(self, source, key, value, expires_at):
+        self._memory[(source, key)] = (value, expires_at)
+        self._memory.move_to_end((source, key))
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _get_memory(self, source, key, now):
+        entry = self._memory.get((source, key))
+        if entry is not None:
+            if entry[1] > now:
+                self._memory.move_to_end((source, key))
+                self.stats[source]["hits"] += 1
+                return True, entry[0]
+            del self._memory[(source, key)]
+        return False, None
+
+    def get_memory(self, source, key):
+        """Looks up the in-memory tier only, so it never blocks on disk I/O. A miss is not counted."""
+        with self._lock:
+            return self._get_memory(source, key, time.time())
+
+    def get(self, source, key):
+        """Returns (True, value) on a hit and (False, None) on a miss."""
+        now = time.time()
+        with self._lock:
+            hit, value = self._get_memory(source, key, now)
+            if hit:
+                return True, value
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM responses WHERE source = ? AND key = ? AND expires_at > ?",
+                    (source, key, now),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE responses SET accessed_at = ? WHERE source = ? AND key = ?", (now, source, key)
+                    )
+                    self._conn.commit()
+                    value = json.loads(row[0])
+                    self._remember(source, key, value, row[1])
+                    self.stats[source]["hits"] += 1
+                    self.stats[source]["disk_hits"] += 1
+                    return True, value
+
+            self.stats[source]["misses"] += 1
+            return False, None
+
+    def set(self, source, key, value):
+        now = time.time()
+        expires_at = now + self.ttl(source)
+        with self._lock:
+            self._remember(source, key, value, expires_at)
+            if self._conn is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (source, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (source, key, json.dumps(value), expires_at, now),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict_disk(now)
+            self._conn.commit()
+
+    def _evict_disk(self, now):
+        """Drops expired rows, then the least recently used rows beyond max_disk_entries."""
+        self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        self._conn.execute(
+            "DELETE FROM responses WHERE rowid IN ("
+            " SELECT rowid FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+
+    def clear(self, source=None):
+        with self._lock:
+            if source is None:
+                self._memory.clear()
+            else:
+                for entry in [k for k in self._memory if k[0] == source]:
+                    del self._memory[entry]
+            if self._conn is not None:
+                if source is None:
+                    self._conn.execute("DELETE FROM responses")
+                else:
+                    self._conn.execute("DELETE FROM responses WHERE source = ?", (source,))
+                self._conn.commit()
+
+    def get_stats(self):
+        """Returns {source: {"hits", "disk_hits", "misses", "hit_rate"}}."""
+        with self._lock:
+            stats = {}
+            for source, counters in self.stats.items():
+                total = counters["hits"] + counters["misses"]
+                stats[source] = dict(counters, hit_rate=counters["hits"] / total if total else 0.0)
+            return stats
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Returns the process-wide cache, configured from the environment:
+        CACHE_PATH          SQLite file for the disk tier (default "api_cache.sqlite3"; empty disables it)
+        CACHE_MAX_ENTRIES   Size of the in-memory LRU tier (default 1024)
+        CACHE_TTL_<SOURCE>  TTL override in seconds, e.g. CACHE_TTL_MAPS=3600
+    """
+    global _cache, _cache_pid
+    with _cache_lock:
+        # SQLite connections must not cross a fork, so each worker process opens its own
+        if _cache is None or _cache_pid != os.getpid():
+            _cache = ResponseCache(
+                path=os.getenv("CACHE_PATH", "api_cache.sqlite3") or None,
+                max_entries=int(os.getenv("CACHE_MAX_ENTRIES", 1024)),
+            )
+            _cache_pid = os.getpid()
+        return _cache
+
+
+def cached(source, case_sensitive=False, cache_if=None):
+    """
+    Decorator that serves a function's result from the response cache.
+
+    Args:
+        source (str): Cache namespace, which also selects the TTL ("maps", "wikipedia", "gemini").
+        case_sensitive (bool): Whether string arguments keep their case in the key.
+        cache_if (callable): Optional predicate; results for which it returns False are not stored.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def cache_key(*args, **kwargs):
+            # Bind against the signature so that defaulted and explicit arguments share a key
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return make_key(func.__name__, case_sensitive=case_sensitive, **bound.arguments)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = get_response_cache()
+            key = cache_key(*args, **kwargs)
+            hit, value = cache.get(source, key)
+            if hit:
+                return value
+            value = func(*args, **kwargs)
+            if cache_if is None or cache_if(value):
+                cache.set(source, key, value)
+            return value
+        wrapper.uncached = func
+        wrapper.cache_source = source
+        wrapper.cache_key = cache_key
+        wrapper.cache_if = cache_if
+        return wrapper
+    return decorator
+
+
+def cached_like(cached_func):
+    """
+    Decorator for an async variant of a @cached function: results are read from and stored
+    under the same keys, so the sync and async code paths share cache entries.
+
+    Memory hits are served on the event loop; the SQLite tier is read and written on a worker
+    thread, so disk I/O never blocks other requests.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache = get_response_cache()
+            key = cached_func.cache_key(*args, **kwargs)
+            hit, value = cache.get_memory(cached_func.cache_source, key)
+            if not hit:
+                hit, value = await asyncio.to_thread(cache.get, cached_func.cache_source, key)
+            if hit:
+                return value
+            value = await func(*args, **kwargs)
+            if cached_func.cache_if is None or cached_func.cache_if(value):
+                await asyncio.to_thread(cache.set, cached_func.cache_source, key, value)
+            return value
+        wrapper.uncached = func
+        return wrapper
+    return decorator
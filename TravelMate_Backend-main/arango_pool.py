@@ -0,0 +1,148 @@
+# Process-wide ArangoDB client and graph handle, shared by all requests of a worker
+
+import atexit
+import os
+import threading
+import time
+
+import nx_arangodb as nxadb
+from arango import ArangoClient
+from arango.http import DefaultHTTPClient
+
+from metrics import log
+
+DEFAULT_HOST = "https://72f3bc481376.arangodb.cloud:8529"
+DEFAULT_GRAPH_NAME = "TravelMate"
+
+
+class GraphManager:
+    """
+    Owns one ArangoClient (with a pooled HTTP session), one authenticated db handle and
+    one nxadb.Graph per process, so requests no longer pay for TLS, auth and graph metadata.
+
+    Credentials and tuning are read from the environment, using the same variable names
+    as nx-arangodb:
+        DATABASE_HOST, DATABASE_USERNAME, DATABASE_PASSWORD, DATABASE_NAME
+        DATABASE_POOL_SIZE            HTTP connections kept alive per host (default 10)
+        DATABASE_REQUEST_TIMEOUT      Seconds before an HTTP request to ArangoDB times out (default 60)
+        DATABASE_HEALTHCHECK_SECONDS  Minimum interval between health checks (default 30)
+        GRAPH_NAME                    Name of the knowledge graph (default "TravelMate")
+    """
+
+    def __init__(self, host=None, username=None, password=None, db_name=None, graph_name=None,
+                 pool_size=None, request_timeout=None, healthcheck_interval=None):
+        self.host = host or os.getenv("DATABASE_HOST", DEFAULT_HOST)
+        self.username = username or os.getenv("DATABASE_USERNAME", "root")
+        self.password = password or os.getenv("DATABASE_PASSWORD")
+        self.db_name = db_name or os.getenv("DATABASE_NAME", "_system")
+        self.graph_name = graph_name or os.getenv("GRAPH_NAME", DEFAULT_GRAPH_NAME)
+        self.pool_size = int(pool_size or os.getenv("DATABASE_POOL_SIZE", 10))
+        self.request_timeout = float(request_timeout or os.getenv("DATABASE_REQUEST_TIMEOUT", 60))
+        self.healthcheck_interval = float(healthcheck_interval or os.getenv("DATABASE_HEALTHCHECK_SECONDS", 30))
+
+        if not self.password:
+            raise ValueError("No ArangoDB password provided. Set the DATABASE_PASSWORD environment variable")
+
+        self._lock = threading.RLock()
+        self._client = None
+        self._db = None
+        self._graph = None
+        self._last_healthy = 0.0
+        self.reconnects = 0
+
+    def _connect(self):
+        http_client = DefaultHTTPClient(
+            request_timeout=self.request_timeout,
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+        )
+        self._client = ArangoClient(hosts=self.host, http_client=http_client)
+        self._db = self._client.db(self.db_name, username=self.username, password=self.password, verify=True)
+        self._graph = nxadb.Graph(name=self.graph_name, db=self._db)
+        self._last_healthy = time.monotonic()
+
+    def _close(self):
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception as e:
+                log.warning(f"Error closing ArangoDB client: {str(e)}")
+        self._client = self._db = self._graph = None
+
+    def is_healthy(self):
+        """Pings the server; returns False instead of raising if it cannot be reached."""
+        if self._db is None:
+            return False
+        try:
+            self._db.version()
+            return True
+        except Exception as e:
+            log.warning(f"ArangoDB health check failed: {str(e)}")
+            return False
+
+    def _ensure_connected(self):
+        if self._db is None:
+            self._connect()
+            return
+        if time.monotonic() - self._last_healthy < self.healthcheck_interval:
+            return
+        if self.is_healthy():
+            self._last_healthy = time.monotonic()
+        else:
+            self.reconnect()
+
+    def reconnect(self):
+        """Drops the current client and builds a fresh one."""
+        with self._lock:
+            self._close()
+            self.reconnects += 1
+            self._connect()
+
+    @property
+    def db(self):
+        with self._lock:
+            self._ensure_connected()
+            return self._db
+
+    @property
+    def graph(self):
+        with self._lock:
+            self._ensure_connected()
+            return self._graph
+
+    def shutdown(self):
+        """Closes the pooled HTTP connections. Safe to call more than once."""
+        with self._lock:
+            self._close()
+
+
+_manager = None
+_manager_pid = None
+_manager_lock = threading.Lock()
+
+
+def get_graph_manager() -> GraphManager:
+    """
+    Returns the GraphManager of the current process, creating it on first use.
+
+    The owning pid is tracked so that a worker forked from a preloaded master (gunicorn --preload)
+    never reuses the parent's sockets.
+    """
+    global _manager, _manager_pid
+    with _manager_lock:
+        if _manager is None or _manager_pid != os.getpid():
+            _manager = GraphManager()
+            _manager_pid = os.getpid()
+        return _manager
+
+
+def shutdown_graph_manager():
+    """Shutdown hook: closes the process-wide manager if one was created."""
+    global _manager
+    with _manager_lock:
+        if _manager is not None and _manager_pid == os.getpid():
+            _manager.shutdown()
+        _manager = None
+
+
+atexit.register(shutdown_graph_manager)
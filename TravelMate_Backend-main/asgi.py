@@ -0,0 +1,327 @@
+# ASGI serving path: the same API routes and JSON contracts as the Flask app, with outbound
+# Maps and Gemini calls on a shared async connection pool
+#
+# Usage:
+#   uvicorn asgi:app --port 5000 --workers 2
+#
+# A worker awaits Maps and Gemini responses without holding a thread, so it can keep hundreds of
+# LLM calls in flight. Graph retrieval and registry access stay synchronous (python-arango, SQLite)
+# and run on Starlette's thread pool; background builds still run on the build job queue.
+
+import asyncio
+import contextlib
+import json
+import os
+import time
+
+import aiohttp
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import main
+from api_cache import cached_like
+from singleflight import coalesced
+from http_pool import HTTP_TIMEOUT, GEMINI_TIMEOUT
+from json_stream import JsonArrayStream
+from metrics import get_metrics, inc, log, new_trace_id, span
+from outbound import get_scheduler
+from tsv_stream import iter_sse_texts
+
+_client = None
+
+# Failures worth retrying in the outbound scheduler, besides 429 and 5xx answers
+RETRY_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+
+def get_async_client() -> aiohttp.ClientSession:
+    """
+    Returns the worker's shared aiohttp session, created on first use inside the event loop.
+    Its pool holds up to ASYNC_HTTP_MAX_CONNECTIONS connections (default 512).
+    """
+    global _client
+    if _client is None:
+        _client = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", 512))),
+            timeout=aiohttp.ClientTimeout(connect=HTTP_TIMEOUT[0], sock_read=HTTP_TIMEOUT[1]),
+        )
+    return _client
+
+
+async def close_async_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+# ----------------------------------------------------------------Async outbound calls----------------------------------------------------------------------
+
+@cached_like(main.get_maps_places)
+@coalesced("maps")
+async def get_maps_places(location, search_text="Most Popular places in "):
+    inc("travelmate_outbound_requests_total", service="maps")
+    with span("maps_fetch", location=location):
+        async with get_scheduler().request_async(
+                "maps", lambda: get_async_client().get(main.maps_search_url(location, search_text)),
+                retry_on=RETRY_ERRORS) as search_response:
+            if search_response.status != 200:
+                raise Exception(
+                    f"Failed to fetch search results. Received: {search_response.status} {search_response.reason}"
+                )
+            search_data = await search_response.json()
+    return main.maps_results(search_data)
+
+
+@cached_like(main.call_gemini_api)
+@coalesced("gemini", case_sensitive=True)
+async def call_gemini_api(prompt):
+    """
+    Async variant of main.call_gemini_api.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("No Gemini API key provided. Set the GEMINI_API_KEY environment variable")
+
+    main.count_prompt(prompt)
+    async with get_scheduler().request_async("gemini", lambda: get_async_client().post(
+        f"{main.GEMINI_API_BASE}/models/{main.GEMINI_MODEL}:generateContent",
+        headers={"Content-Type": "application/json"},
+        params={"key": api_key},
+        json=main.gemini_request_body(prompt),
+        timeout=aiohttp.ClientTimeout(connect=GEMINI_TIMEOUT[0], sock_read=GEMINI_TIMEOUT[1]),
+    ), retry_on=RETRY_ERRORS) as response:
+        if response.status != 200:
+            raise Exception(f"Failed to call Gemini API. Received: {response.status} {response.reason} - {await response.text()}")
+        response_json = await response.json()
+    return main.gemini_response_text(response_json)
+
+
+async def stream_gemini_api(prompt):
+    """
+    Async variant of main.stream_gemini_api: yields the generated text as it arrives.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("No Gemini API key provided. Set the GEMINI_API_KEY environment variable")
+
+    main.count_prompt(prompt)
+    async with get_scheduler().request_async("gemini", lambda: get_async_client().post(
+        f"{main.GEMINI_API_BASE}/models/{main.GEMINI_MODEL}:streamGenerateContent",
+        headers={"Content-Type": "application/json"},
+        params={"key": api_key, "alt": "sse"},
+        json=main.gemini_request_body(prompt),
+        timeout=aiohttp.ClientTimeout(connect=GEMINI_TIMEOUT[0], sock_read=GEMINI_TIMEOUT[1]),
+    ), retry_on=RETRY_ERRORS) as response:
+        if response.status != 200:
+            raise Exception(f"Failed to call Gemini API. Received: {response.status} {response.reason} - {await response.text()}")
+        async for line in response.content:
+            for text in iter_sse_texts([line]):
+                yield text
+
+
+async def wait_for_build(job, timeout):
+    """Polls a build job without blocking a thread; returns True if it finished within `timeout`."""
+    deadline = time.monotonic() + timeout
+    while not job.done.is_set():
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(0.1)
+    return True
+
+
+# ----------------------------------------------------------------Routes----------------------------------------------------------------------
+
+async def get_places(request):
+    names = await run_in_threadpool(lambda: main.city_registry().names())
+    return JSONResponse(names)
+
+
+async def top_places(request):
+    """
+    Same contract as the Flask /api/top-places endpoint.
+    """
+    try:
+        user_data = await request.json()
+    except ValueError:
+        user_data = None
+    if not user_data:
+        return JSONResponse({"error": "No user data provided"}, status_code=400)
+
+    destination_name = user_data['destination']
+    G = await run_in_threadpool(lambda: main.get_graph_manager().graph)
+    existing_city_names = main.city_registry()
+
+    build_job = None
+    is_registered = await run_in_threadpool(lambda: destination_name in existing_city_names)
+    if not is_registered:
+        build_job = main.build_queue().submit(destination_name)
+        wait_seconds = float(user_data.get("waitSeconds", os.getenv("BUILD_WAIT_SECONDS", 0)))
+        if not await wait_for_build(build_job, min(wait_seconds, main.MAX_BUILD_WAIT_SECONDS)):
+            G = None
+    # A city is registered only once its graph is built, so unlike the sync path there is
+    # nothing left for fetch_or_create_city to do here
+
+    places_google_maps = await get_maps_places(destination_name, "Most Popular places in ")
+    plan = await run_in_threadpool(main.plan_top_k_places, user_data, G, places_google_maps)
+    places = plan["result"]
+    if places is None:
+        try:
+            with span("gemini_ranking", candidates=len(plan["places_ext"])):
+                json_list_of_places = await call_gemini_api(plan["prompt"])
+            places = main.finish_top_k_places(plan, json_list_of_places)
+        except Exception as e:
+            log.warning(f"Error calling Gemini API: {str(e)}")
+            places = plan["places_ext"]  # Return all places if API call fails
+
+    response = {"places": places}
+    if build_job is not None:
+        response["buildJob"] = build_job.to_dict()
+    return JSONResponse(response)
+
+
+async def api_create_build_job(request):
+    """Same contract as the Flask POST /api/build-jobs endpoint."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data or not data.get("destination"):
+        return JSONResponse({"error": "Missing required parameter: destination"}, status_code=400)
+
+    job = main.build_queue().submit(data["destination"])
+    return JSONResponse(job.to_dict(), status_code=202)
+
+
+async def api_build_job_status(request):
+    """Same contract as the Flask GET /api/build-jobs/<job_id> endpoint."""
+    job = main.build_queue().get(request.path_params["job_id"])
+    if job is None:
+        return JSONResponse({"error": "Unknown build job"}, status_code=404)
+    return JSONResponse(job.to_dict())
+
+
+async def api_event_planner(request):
+    """Same contract as the Flask /api/event-planner endpoint."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data:
+        return JSONResponse({"error": "No data provided"}, status_code=400)
+
+    selected_places = data.get("selectedPlaces", "")
+    user_input = data.get("userInput", "")
+    if not selected_places or not user_input:
+        return JSONResponse({"error": "Missing required parameters: selectedPlaces or userInput"}, status_code=400)
+
+    try:
+        plan = main.plan_event_planner(selected_places, user_input, main.plan_event_route(data), main.event_planner_mode(data))
+        if plan["result"] is not None:
+            return JSONResponse(plan["result"])
+        return JSONResponse(main.finish_event_planner(plan, await call_gemini_api(plan["prompt"])))
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def api_event_planner_stream(request):
+    """Same contract as the Flask /api/event-planner/stream endpoint (NDJSON, one event per line)."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data:
+        return JSONResponse({"error": "No data provided"}, status_code=400)
+
+    selected_places = data.get("selectedPlaces", "")
+    user_input = data.get("userInput", "")
+    if not selected_places or not user_input:
+        return JSONResponse({"error": "Missing required parameters: selectedPlaces or userInput"}, status_code=400)
+
+    async def generate():
+        try:
+            plan = main.plan_event_planner(selected_places, user_input, main.plan_event_route(data),
+                                           main.event_planner_mode(data))
+            if plan["result"] is not None:
+                for event in plan["result"]:
+                    yield json.dumps(event) + "\n"
+                return
+
+            parser = JsonArrayStream()
+            event_list = []
+            async for text in stream_gemini_api(plan["prompt"]):
+                for event in parser.feed(text):
+                    event_list.append(event)
+                    yield json.dumps(event) + "\n"
+                if parser.finished:
+                    break
+            main.finish_streamed_event_planner(plan, event_list, parser)
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
+
+
+async def city_graph(request):
+    """
+    Same contract as the Flask /api/graph/<city_name> endpoint.
+    """
+    def int_param(name, default=None):
+        try:
+            return int(request.query_params[name])
+        except (KeyError, ValueError):
+            return default
+
+    try:
+        export = await run_in_threadpool(main.city_graph_export, request.path_params["city_name"])
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+    if export is None:
+        return JSONResponse({"error": "Unknown city"}, status_code=404)
+    return JSONResponse(main.page(export, int_param("level"), max(0, int_param("offset", 0)), int_param("limit")))
+
+
+async def metrics(request):
+    return PlainTextResponse(get_metrics().render(), media_type="text/plain; version=0.0.4")
+
+
+class TraceMiddleware:
+    """Starts a trace id for every HTTP request, so its spans can be correlated in the logs."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            new_trace_id()
+        await self.app(scope, receive, send)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    if os.getenv("PREFETCH_CITIES"):
+        await run_in_threadpool(main.prefetch_cities)
+    yield
+    await close_async_client()
+
+
+app = Starlette(
+    routes=[
+        Route("/api/places", get_places, methods=["GET"]),
+        Route("/api/top-places", top_places, methods=["POST"]),
+        Route("/api/build-jobs", api_create_build_job, methods=["POST"]),
+        Route("/api/build-jobs/{job_id}", api_build_job_status, methods=["GET"]),
+        Route("/api/event-planner", api_event_planner, methods=["POST"]),
+        Route("/api/event-planner/stream", api_event_planner_stream, methods=["POST"]),
+        Route("/api/graph/{city_name}", city_graph, methods=["GET"]),
+        Route("/metrics", metrics, methods=["GET"]),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+        Middleware(TraceMiddleware),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,111 @@
+# Benchmark: per-place shortest-path loop vs. multi-source bounded BFS
+#
+# Usage: python benchmarks/bench_retrieval.py [--nodes 10000] [--places 20]
+
+import argparse
+import os
+import sys
+import time
+from random import Random
+
+import networkx as nx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from graph_retrieval import get_path_records, format_path_sentence  # noqa: E402
+
+
+class CountingDict(dict):
+    """Dict that counts key lookups, as a proxy for nxadb round trips."""
+
+    lookups = 0
+
+    def __getitem__(self, key):
+        CountingDict.lookups += 1
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        CountingDict.lookups += 1
+        return super().get(key, default)
+
+
+class CountingGraph(nx.Graph):
+    """nx.Graph whose node and adjacency lookups are counted."""
+
+    node_dict_factory = CountingDict
+    adjlist_outer_dict_factory = CountingDict
+
+
+def synthetic_graph(n_nodes, avg_degree, seed):
+    rng = Random(seed)
+    G = CountingGraph()
+    relations = ["LOCATED_IN", "BUILT_IN", "KNOWN_FOR", "DESIGNED_BY", "NEARBY_ATTRACTION", "TRAVEL_TIP"]
+    types = ["Attraction", "Landmark", "Event", "Year", "Culture", "TravelTip"]
+    for i in range(n_nodes):
+        G.add_node(f"node_{i}", key=f"node_{i}", name=f"Node {i}", type=rng.choice(types))
+    for _ in range(n_nodes * avg_degree // 2):
+        u, v = rng.randrange(n_nodes), rng.randrange(n_nodes)
+        if u != v:
+            G.add_edge(f"node_{u}", f"node_{v}", relation=rng.choice(relations), attributes="{}")
+    return G
+
+
+def legacy_retrieval(G, place_keys):
+    """The loop previously inlined in get_top_k_places."""
+    results = []
+    for place_key in place_keys:
+        for path_length in range(1, 4):
+            for node in nx.single_source_shortest_path_length(G, place_key, cutoff=path_length):
+                if node != place_key:
+                    path = nx.shortest_path(G, place_key, node)
+                    relationships = []
+                    for j in range(len(path) - 1):
+                        edge_data = G.get_edge_data(path[j], path[j + 1])
+                        if edge_data and 'relation' in edge_data:
+                            relationships.append(edge_data['relation'])
+                    start_node_type = G.nodes.get(place_key, {}).get('type', 'unknown type')
+                    end_node_name = G.nodes.get(node, {}).get('name', 'unknown')
+                    end_node_type = G.nodes.get(node, {}).get('type', 'unknown type')
+                    results.append(f'Node "{place_key}, a {start_node_type}" is connected to '
+                                   f'Node "{end_node_name}, a {end_node_type}" by the '
+                                   f'relationships: "{", ".join(relationships)}".')
+    return results
+
+
+def bfs_retrieval(G, place_keys):
+    records = get_path_records(G, place_keys, max_depth=3)
+    results = [format_path_sentence(key, record) for key in place_keys for record in records.get(key, [])]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark knowledge graph neighbourhood retrieval")
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--degree", type=int, default=4)
+    parser.add_argument("--places", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    G = synthetic_graph(args.nodes, args.degree, args.seed)
+    place_keys = [f"node_{i}" for i in Random(args.seed).sample(range(args.nodes), args.places)]
+    print(f"Graph: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges; {len(place_keys)} places")
+
+    CountingDict.lookups = 0
+    start = time.perf_counter()
+    legacy = legacy_retrieval(G, place_keys)
+    legacy_time = time.perf_counter() - start
+    legacy_lookups = CountingDict.lookups
+
+    CountingDict.lookups = 0
+    start = time.perf_counter()
+    bfs = bfs_retrieval(G, place_keys)
+    bfs_time = time.perf_counter() - start
+    bfs_lookups = CountingDict.lookups
+
+    print(f"legacy loop : {legacy_time:8.3f}s  {len(legacy):7d} sentences  {legacy_lookups:9d} graph lookups")
+    print(f"bounded BFS : {bfs_time:8.3f}s  {len(bfs):7d} sentences  {bfs_lookups:9d} graph lookups")
+    print(f"speedup     : {legacy_time / max(bfs_time, 1e-9):8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+# Offline benchmark suite: cold city build, warm city lookup, concurrent users and graph sizes
+#
+# Usage:
+#   python benchmarks/bench_suite.py --output bench.json
+#   python benchmarks/bench_suite.py --scenarios graph_sizes --sizes 100,1000,10000,100000
+#   python benchmarks/bench_suite.py --latency-gemini 1.5 --latency-maps 0.2 --users 50
+#
+# Maps, Wikipedia and Gemini are replaced by in-process fakes with injected latency
+# (benchmarks/fake_services.py), and ArangoDB by an in-memory NetworkX graph that counts node
+# and adjacency lookups as a proxy for round trips. Caches, the city registry and the node index
+# live in a temporary directory, so every run starts cold. Results are printed as JSON.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from random import Random
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_retrieval import CountingDict, CountingGraph, synthetic_graph  # noqa: E402
+from fake_gemini_server import RELATIONS, TYPES  # noqa: E402
+from fake_services import FakeServices, install  # noqa: E402
+
+SCENARIOS = ["cold_build", "warm_lookup", "concurrent_users", "graph_sizes"]
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {}
+    return {
+        "count": len(latencies),
+        "p50": round(statistics.median(latencies), 4),
+        "p95": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 4),
+        "max": round(latencies[-1], 4),
+        "mean": round(statistics.fmean(latencies), 4),
+    }
+
+
+def stats_delta(before, after):
+    """Stage timings and counters accumulated between two Metrics.get_stats() snapshots."""
+    stages = {}
+    for stage, totals in after["stages"].items():
+        previous = before["stages"].get(stage, {"count": 0, "seconds": 0.0})
+        if totals["count"] > previous["count"]:
+            stages[stage] = {"count": totals["count"] - previous["count"],
+                             "seconds": round(totals["seconds"] - previous["seconds"], 4)}
+    counters = {name: value - before["counters"].get(name, 0) for name, value in after["counters"].items()
+                if value != before["counters"].get(name, 0)}
+    return {"stages": stages, "counters": counters}
+
+
+def top_places_payload(city, description):
+    return {"destination": city, "source": "Benchmark", "departureDate": "2026-03-01",
+            "returnDate": "2026-03-04", "budget": "50000", "description": description}
+
+
+class Harness:
+    """The Flask app wired to the fakes and an in-memory graph."""
+
+    def __init__(self, services):
+        import main
+
+        self.main = main
+        self.services = install(main, services)
+        self.graph = CountingGraph()
+        main.get_graph_manager = lambda: types.SimpleNamespace(graph=self.graph)
+        self.client = main.app.test_client()
+
+    @contextlib.contextmanager
+    def measure(self, result):
+        """Adds the stage timings, counters, fake service calls and graph lookups of the block to `result`."""
+        metrics = self.main.get_metrics()
+        before, calls, lookups = metrics.get_stats(), dict(self.services.calls), CountingDict.lookups
+        yield
+        result.update(stats_delta(before, metrics.get_stats()))
+        result["service_calls"] = {name: count - calls.get(name, 0) for name, count in self.services.calls.items()
+                                   if count != calls.get(name, 0)}
+        result["graph_lookups"] = CountingDict.lookups - lookups
+
+    def top_places(self, city, description, client=None):
+        start = time.perf_counter()
+        response = (client or self.client).post("/api/top-places", json=dict(
+            top_places_payload(city, description), waitSeconds=self.main.MAX_BUILD_WAIT_SECONDS))
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200 or not response.get_json().get("places"):
+            raise RuntimeError(f"/api/top-places failed with {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return elapsed
+
+
+# ----------------------------------------------------------------Scenarios----------------------------------------------------------------------
+
+def cold_build(harness, args):
+    """First request for cities nobody has asked for yet: extraction, ingestion, indexing and ranking."""
+    result = {"cities": args.cities}
+    latencies = []
+    with harness.measure(result):
+        for i in range(args.cities):
+            latencies.append(harness.top_places(f"Coldcity {i}", "history and architecture"))
+    result["latency"] = summarize(latencies)
+    result["graph"] = {"nodes": harness.graph.number_of_nodes(), "edges": harness.graph.number_of_edges()}
+    return result
+
+
+def warm_lookup(harness, args):
+    """Requests for an already built city, with new descriptions (LLM call) and repeated ones (prompt cache)."""
+    city = "Warmcity"
+    harness.main.build_city(city)
+    result = {"iterations": args.iterations}
+    for name, description in (("new_description", "traveller {i} who loves history"),
+                              ("repeated_description", "traveller who loves history")):
+        latencies = []
+        section = {}
+        with harness.measure(section):
+            for i in range(args.iterations):
+                latencies.append(harness.top_places(city, description.format(i=i)))
+        section["latency"] = summarize(latencies)
+        result[name] = section
+    return result
+
+
+def concurrent_users(harness, args):
+    """`users` users ranking places for the same built city at once, each with their own description."""
+    city = "Busycity"
+    harness.main.build_city(city)
+    result = {"users": args.users, "requests": args.users * args.requests_per_user}
+
+    def user(i):
+        client = harness.main.app.test_client()
+        return [harness.top_places(city, f"user {i} request {j} likes museums", client)
+                for j in range(args.requests_per_user)]
+
+    peak_before = harness.services.peak_in_flight["gemini"]
+    harness.services.peak_in_flight["gemini"] = 0
+    with harness.measure(result):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as executor:
+            latencies = [latency for latencies in executor.map(user, range(args.users)) for latency in latencies]
+        wall = time.perf_counter() - start
+    result["latency"] = summarize(latencies)
+    result["wall_seconds"] = round(wall, 4)
+    result["throughput_rps"] = round(len(latencies) / wall, 2)
+    result["peak_gemini_in_flight"] = harness.services.peak_in_flight["gemini"]
+    harness.services.peak_in_flight["gemini"] = max(peak_before, result["peak_gemini_in_flight"])
+    return result
+
+
+def synthetic_frame(n_nodes, avg_degree, seed):
+    """A knowledge DataFrame with about n_nodes distinct entities and n_nodes * avg_degree / 2 triples."""
+    rng = Random(seed)
+    rows = []
+    for _ in range(n_nodes * avg_degree // 2):
+        u, v = rng.randrange(n_nodes), rng.randrange(n_nodes)
+        if u != v:
+            rows.append((f"Node {u}", rng.choice(RELATIONS), f"Node {v}", "Attraction", rng.choice(TYPES), "{}"))
+    return pd.DataFrame(rows, columns=["Node_1", "Relation", "Node_2", "Node_1_Type", "Node_2_Type", "Attributes"])
+
+
+def graph_sizes(harness, args):
+    """Ingestion, batched traversal and summary materialization at each graph size."""
+    from graph_ingest import bulk_ingest
+    from graph_retrieval import get_retriever
+    from graph_summaries import materialize_summaries
+
+    results = []
+    for n_nodes in args.sizes:
+        entry = {"nodes": n_nodes}
+        df = synthetic_frame(n_nodes, args.avg_degree, args.seed)
+        G = CountingGraph()
+        start = time.perf_counter()
+        ingest = bulk_ingest(G, df)
+        entry["ingest"] = {"rows": len(df), "nodes_added": len(ingest.nodes), "edges_added": len(ingest.edges),
+                           "seconds": round(time.perf_counter() - start, 4)}
+
+        G = synthetic_graph(n_nodes, args.avg_degree, args.seed)
+        place_keys = [f"node_{i}" for i in Random(args.seed).sample(range(n_nodes), min(args.places, n_nodes))]
+        retriever = get_retriever(G, "networkx")
+        start = time.perf_counter()
+        records = retriever.retrieve(place_keys, max_depth=3)
+        entry["traversal"] = {"places": len(place_keys), "paths": sum(len(paths) for paths in records.values()),
+                              "round_trips": retriever.round_trips, "seconds": round(time.perf_counter() - start, 4)}
+
+        start = time.perf_counter()
+        count = materialize_summaries(G, place_keys)
+        entry["summaries"] = {"written": count, "seconds": round(time.perf_counter() - start, 4)}
+        results.append(entry)
+    return {"avg_degree": args.avg_degree, "sizes": results}
+
+
+# ----------------------------------------------------------------Runner----------------------------------------------------------------------
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline TravelMate benchmarks against local fakes")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {SCENARIOS}")
+    parser.add_argument("--latency-maps", type=float, default=0.05, help="Seconds per Maps call")
+    parser.add_argument("--latency-wikipedia", type=float, default=0.05, help="Seconds per Wikipedia call")
+    parser.add_argument("--latency-gemini", type=float, default=0.5, help="Seconds per Gemini call (first token when streaming)")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="Seconds between streamed Gemini events")
+    parser.add_argument("--places", type=int, default=20, help="Maps results per city, and places traversed per graph size")
+    parser.add_argument("--rows", type=int, default=200, help="TSV rows per Gemini extraction")
+    parser.add_argument("--cities", type=int, default=3, help="Cities built in the cold build scenario")
+    parser.add_argument("--iterations", type=int, default=10, help="Requests per warm lookup variant")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent users")
+    parser.add_argument("--requests-per-user", type=int, default=3)
+    parser.add_argument("--sizes", default="100,1000,10000,100000", help="Comma-separated graph sizes in nodes")
+    parser.add_argument("--avg-degree", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the application's own output")
+    args = parser.parse_args(argv)
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {sorted(unknown)}")
+    args.sizes = [int(size) for size in args.sizes.split(",")]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="travelmate-bench-")
+    os.environ.update({
+        "GEMINI_API_KEY": "bench",
+        "CACHE_PATH": os.path.join(workdir, "api_cache.sqlite3"),
+        "CITY_REGISTRY_PATH": os.path.join(workdir, "cities.sqlite3"),
+        "NODE_INDEX_PATH": os.path.join(workdir, "node_index.sqlite3"),
+    })
+    if not args.verbose:
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    services = FakeServices(places=args.places, rows=args.rows, chunk_delay=args.chunk_delay, seed=args.seed,
+                            latency={"maps": args.latency_maps, "wikipedia": args.latency_wikipedia,
+                                     "gemini": args.latency_gemini})
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "verbose")},
+        "scenarios": {},
+    }
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+        harness = Harness(services)
+        for name in args.scenarios:
+            start = time.perf_counter()
+            result = globals()[name](harness, args)
+            result["seconds"] = round(time.perf_counter() - start, 4)
+            report["scenarios"][name] = result
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# Local stand-in for the Gemini API, serving canned knowledge-graph TSV (or, for event planner
+# prompts, a JSON itinerary) with configurable latency
+#
+# Usage:
+#   python benchmarks/fake_gemini_server.py --port 8765 --rows 200 --chunk-delay 0.05
+#   GEMINI_API_BASE=http://127.0.0.1:8765/v1 GEMINI_API_KEY=test python main.py
+
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import Random
+
+HEADER = "Node_1\tRelation\tNode_2\tNode_1_Type\tNode_2_Type\tAttributes"
+RELATIONS = ["LOCATED_IN", "BUILT_IN", "KNOWN_FOR", "DESIGNED_BY", "NEARBY_ATTRACTION", "TRAVEL_TIP",
+             "RECOMMENDED_ACTIVITY", "BEST_VISITED_IN", "HISTORIC_IMPORTANCE", "INFLUENCED_BY"]
+TYPES = ["Location", "Year", "Architect", "CulturalAspect", "RecommendedActivity", "TravelTip"]
+
+
+def fake_tsv(rows, attractions=10, seed=42):
+    """A fenced TSV completion shaped like the real extraction output."""
+    rng = Random(seed)
+    lines = ["```tsv", HEADER]
+    for i in range(rows):
+        attraction = f"Attraction {i % attractions}"
+        target = f"Entity {rng.randrange(rows)}"
+        attributes = json.dumps({"note": f"fact {i}"})
+        lines.append(f"{attraction}\t{rng.choice(RELATIONS)}\t{target}\tAttraction\t{rng.choice(TYPES)}\t{attributes}")
+    lines.append("```")
+    return "\n".join(lines) + "\n"
+
+
+def fake_itinerary(events=6):
+    """A fenced JSON itinerary shaped like the event planner output."""
+    plan = [{
+        "place_id": i,
+        "name": f"Attraction {i}",
+        "details": f"Spend the {'morning' if i % 2 == 0 else 'afternoon'} at Attraction {i}; {{braces}} and [brackets] are fine.",
+        "timing": f"{9 + i}:00 AM to {10 + i}:30 AM",
+        "Famous Activity": "Photoshoots",
+        "total_duration": "1-2 hours",
+        "recommended_transport": "Taxi",
+        "additional_notes": "Carry water.",
+    } for i in range(events)]
+    return "Here is your plan:\n```json\n" + json.dumps(plan, indent=2) + "\n```\n"
+
+
+def make_handler(text, chunk_size, chunk_delay, first_token_delay, itinerary_text=None):
+    class GeminiHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            reply_text = text
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if itinerary_text and b"event planner" in body:
+                reply_text = itinerary_text
+            time.sleep(first_token_delay)
+            if ":streamGenerateContent" in self.path:
+                self.stream(reply_text)
+            elif ":generateContent" in self.path:
+                time.sleep(chunk_delay * (len(reply_text) // chunk_size))
+                body = json.dumps({"candidates": [{"content": {"parts": [{"text": reply_text}], "role": "model"}}]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_error(404)
+
+        def stream(self, text):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for start in range(0, len(text), chunk_size):
+                event = {"candidates": [{"content": {"parts": [{"text": text[start:start + chunk_size]}], "role": "model"}}]}
+                payload = f"data: {json.dumps(event)}\r\n\r\n".encode()
+                self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+                self.wfile.flush()
+                time.sleep(chunk_delay)
+            self.wfile.write(b"0\r\n\r\n")
+
+    return GeminiHandler
+
+
+def serve(port=8765, rows=200, chunk_size=200, chunk_delay=0.05, first_token_delay=0.5, events=6):
+    """Starts the fake server; returns it so callers can run serve_forever() in a thread."""
+    handler = make_handler(fake_tsv(rows), chunk_size, chunk_delay, first_token_delay, fake_itinerary(events))
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gemini generateContent/streamGenerateContent server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=200, help="Characters of text per streamed event")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="Seconds between streamed events")
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--events", type=int, default=6, help="Events in the itinerary served to event planner prompts")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.rows, args.chunk_size, args.chunk_delay, args.first_token_delay, args.events)
+    print(f"Fake Gemini API listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+# In-process stand-ins for Google Maps, Wikipedia and Gemini, with injected latency
+#
+# install() swaps main's pooled HTTP session for a FakeServices instance, so the real request building,
+# caching, batching and parsing code runs unchanged against canned responses.
+
+import ast
+import json
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from random import Random
+
+from fake_gemini_server import HEADER, RELATIONS, TYPES, fake_itinerary
+
+
+class FakeResponse:
+    """The subset of requests.Response used by main.py."""
+
+    def __init__(self, payload=None, lines=None, on_close=None):
+        self.status_code = 200
+        self.reason = "OK"
+        self.headers = {}
+        self._payload = payload
+        self._lines = lines
+        self._on_close = on_close
+        self.text = json.dumps(payload) if payload is not None else ""
+
+    def json(self):
+        return self._payload
+
+    def iter_lines(self, decode_unicode=False):
+        yield from self._lines or []
+
+    def close(self):
+        if self._on_close is not None:
+            self._on_close()
+            self._on_close = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeServices:
+    """
+    Canned Maps, Wikipedia and Gemini responses.
+
+    Every city has `places` Maps results named "<City> Attraction <i>". The Gemini extraction
+    answers with `rows` TSV rows about those places, rankings pick the first `ranked` places
+    named in the prompt, and event planner prompts get an itinerary.
+
+    Args:
+        latency (dict): Seconds per call for "maps", "wikipedia" and "gemini" (time to the first
+            token when streaming).
+        chunk_delay (float): Seconds between streamed Gemini events.
+        chunk_size (int): Characters of text per streamed Gemini event.
+    """
+
+    def __init__(self, places=20, rows=200, ranked=5, latency=None, chunk_delay=0.0, chunk_size=400, seed=42):
+        self.places = places
+        self.rows = rows
+        self.ranked = ranked
+        self.latency = dict({"maps": 0.0, "wikipedia": 0.0, "gemini": 0.0}, **(latency or {}))
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self._lock = threading.Lock()
+        self.calls = defaultdict(int)
+        self.in_flight = defaultdict(int)
+        self.peak_in_flight = defaultdict(int)
+
+    def place_names(self, city):
+        return [f"{city} Attraction {i}" for i in range(self.places)]
+
+    def _enter(self, service):
+        with self._lock:
+            self.calls[service] += 1
+            self.in_flight[service] += 1
+            self.peak_in_flight[service] = max(self.peak_in_flight[service], self.in_flight[service])
+        time.sleep(self.latency[service])
+
+    def _exit(self, service):
+        with self._lock:
+            self.in_flight[service] -= 1
+
+    def get_stats(self):
+        with self._lock:
+            return {"calls": dict(self.calls), "peak_in_flight": dict(self.peak_in_flight)}
+
+    # ------------------------------------------------------------Canned payloads
+
+    def maps_results(self, query):
+        city = query.split(" in ", 1)[-1]
+        return [{
+            "name": name,
+            "place_id": f"fake-{i}",
+            "formatted_address": f"{i} Main Road, {city}",
+            "rating": 4.0 + (i % 10) / 10,
+            "types": ["tourist_attraction", "point_of_interest"],
+            "geometry": {"location": {"lat": 12.9 + i / 200, "lng": 77.5 + i / 200}},
+        } for i, name in enumerate(self.place_names(city))]
+
+    def wikipedia_result(self, params):
+        if params.get("list") == "search":
+            return {"query": {"search": [{"title": params["srsearch"]}]}}
+        titles = params.get("titles", "").split("|")
+        pages = [{"title": title} for title in titles]
+        if params.get("prop") == "extracts":
+            for page in pages:
+                page["extract"] = f"{page['title']} is a well known landmark. " * 40
+        return {"query": {"pages": pages}}
+
+    def extraction_tsv(self, prompt):
+        city = prompt.split("tourist attractions in ", 1)[-1].split(",", 1)[0]
+        names = self.place_names(city)
+        rng = Random(f"{self.seed}-{city}")
+        lines = ["```tsv", HEADER]
+        for i in range(self.rows):
+            target = f"{city} Entity {rng.randrange(self.rows)}"
+            attributes = json.dumps({"note": f"fact {i}"})
+            lines.append(f"{names[i % len(names)]}\t{rng.choice(RELATIONS)}\t{target}\tAttraction\t{rng.choice(TYPES)}\t{attributes}")
+        lines.append("```")
+        return "\n".join(lines) + "\n"
+
+    def gemini_text(self, prompt):
+        if "knowledge graph in TSV format" in prompt:
+            return self.extraction_tsv(prompt)
+        if "event planner" in prompt:
+            return fake_itinerary()
+        listed = prompt.split("Total list of places:", 1)[-1].split("\n", 1)[0]
+        names = ast.literal_eval(listed.strip())[:self.ranked]
+        return "```json\n" + json.dumps(names) + "\n```"
+
+    # ------------------------------------------------------------Session interface
+
+    def get(self, url, params=None, timeout=None, **kwargs):
+        parsed = urllib.parse.urlparse(url)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        if "wikipedia.org" in parsed.netloc:
+            self._enter("wikipedia")
+            try:
+                return FakeResponse(self.wikipedia_result(dict(query, **(params or {}))))
+            finally:
+                self._exit("wikipedia")
+        self._enter("maps")
+        try:
+            return FakeResponse({"results": self.maps_results(query.get("query", "")), "status": "OK"})
+        finally:
+            self._exit("maps")
+
+    def post(self, url, stream=False, **kwargs):
+        prompt = kwargs["json"]["contents"][0]["parts"][0]["text"]
+        text = self.gemini_text(prompt)
+        self._enter("gemini")
+        if not stream:
+            self._exit("gemini")
+            return FakeResponse({"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]})
+        return FakeResponse(lines=self._sse_lines(text), on_close=lambda: self._exit("gemini"))
+
+    def _sse_lines(self, text):
+        for start in range(0, len(text), self.chunk_size):
+            event = {"candidates": [{"content": {"parts": [{"text": text[start:start + self.chunk_size]}], "role": "model"}}]}
+            yield "data: " + json.dumps(event)
+            yield ""
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+
+
+def install(main, services):
+    """Routes main's outbound HTTP calls to `services`."""
+    main.get_session = lambda: services
+    return services
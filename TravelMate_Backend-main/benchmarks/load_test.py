@@ -0,0 +1,204 @@
+# Load test of /api/top-places against local stub Maps and Gemini services
+#
+# Usage:
+#   python benchmarks/load_test.py --target asgi --requests 400 --concurrency 200 --llm-latency 2
+#   python benchmarks/load_test.py --target flask --requests 400 --concurrency 200 --llm-latency 2
+#
+# The outbound scheduler's Gemini limits apply to the server under test; set OUTBOUND_GEMINI_RATE=0
+# and raise OUTBOUND_GEMINI_CONCURRENCY to measure the server rather than the quota.
+#
+# The stub services, the server under test and the load generator run in separate processes.
+# The stub Gemini answers every prompt after --llm-latency seconds and reports how many calls
+# were in flight at once; the graph store is a local NetworkX graph. Every request uses a
+# distinct description, so the prompt and response caches miss and each one waits on the LLM.
+
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CITY = "Stubville"
+PLACES = [{"name": f"Stub Place {i}", "place_id": f"stub-{i}", "types": ["tourist_attraction"],
+           "geometry": {"location": {"lat": 12.0 + i / 100, "lng": 77.0 + i / 100}}} for i in range(20)]
+
+
+def make_stub_app(llm_latency):
+    """Stub Maps text search and Gemini generateContent endpoints, plus /stats."""
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    stats = {"in_flight": 0, "peak_in_flight": 0, "calls": 0}
+
+    async def maps(request):
+        return JSONResponse({"results": PLACES, "status": "OK"})
+
+    async def gemini(request):
+        await request.body()
+        stats["in_flight"] += 1
+        stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+        stats["calls"] += 1
+        await asyncio.sleep(llm_latency)
+        stats["in_flight"] -= 1
+        text = "```json\n" + json.dumps([place["name"] for place in PLACES[:5]]) + "\n```"
+        return JSONResponse({"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]})
+
+    async def report(request):
+        return JSONResponse({"llm_calls": stats["calls"], "peak_llm_in_flight": stats["peak_in_flight"]})
+
+    return Starlette(routes=[
+        Route("/maps/api/place/textsearch/json", maps),
+        Route("/v1/models/{model}:generateContent", gemini, methods=["POST"]),
+        Route("/stats", report),
+    ])
+
+
+def serve_stubs(port, llm_latency):
+    import uvicorn
+    uvicorn.run(make_stub_app(llm_latency), host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+
+def serve_target(name, port):
+    """Serves the app under test: the ASGI app on uvicorn or the Flask app on a threaded WSGI server."""
+    import networkx as nx
+    import main as app_main
+    # The graph store is a local in-memory graph, so the test measures the serving path only
+    graph = nx.Graph()
+    app_main.get_graph_manager = lambda: types.SimpleNamespace(graph=graph)
+    app_main.city_registry().add(CITY)
+    sys.stdout = io.StringIO()
+
+    if name == "asgi":
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.app, host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+    else:
+        from werkzeug.serving import make_server
+        server = make_server("127.0.0.1", port, app_main.app, threaded=True)
+        server.socket.listen(4096)
+        server.serve_forever()
+
+
+def start_process(target, *args):
+    process = multiprocessing.Process(target=target, args=args, daemon=True)
+    process.start()
+    return process
+
+
+async def wait_until_up(url, timeout=30):
+    import aiohttp
+
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as client:
+        while True:
+            try:
+                async with client.get(url) as response:
+                    await response.read()
+                return
+            except aiohttp.ClientError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+async def fetch_stats(url):
+    import aiohttp
+
+    async with aiohttp.ClientSession() as client:
+        async with client.get(url) as response:
+            return await response.json()
+
+
+async def run_load(base_url, requests, concurrency):
+    import aiohttp
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(client, i):
+        nonlocal errors
+        payload = {"destination": CITY, "source": "Nowhere", "departureDate": "2026-03-01",
+                   "returnDate": "2026-03-04", "budget": "50000", "description": f"load test traveller {i}"}
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                async with client.post(f"{base_url}/api/top-places", json=payload) as response:
+                    body = await response.json()
+                    if response.status != 200 or not body.get("places"):
+                        errors += 1
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=300)) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(requests)))
+        wall = time.perf_counter() - start
+    return latencies, errors, wall
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/top-places against local stub services")
+    parser.add_argument("--target", choices=["asgi", "flask"], default="asgi")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="Seconds the stub Gemini takes per call")
+    parser.add_argument("--stub-port", type=int, default=8766)
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="travelmate-load-")
+    os.environ.update({
+        "GEMINI_API_BASE": f"http://127.0.0.1:{args.stub_port}/v1",
+        "MAPS_API_BASE": f"http://127.0.0.1:{args.stub_port}/maps/api",
+        "GEMINI_API_KEY": "stub",
+        "CACHE_PATH": os.path.join(workdir, "api_cache.sqlite3"),
+        "CITY_REGISTRY_PATH": os.path.join(workdir, "cities.sqlite3"),
+        "NODE_INDEX_PATH": os.path.join(workdir, "node_index.sqlite3"),
+        "HTTP_POOL_SIZE": str(args.concurrency),
+    })
+
+    stub = start_process(serve_stubs, args.stub_port, args.llm_latency)
+    target = start_process(serve_target, args.target, args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+    asyncio.run(wait_until_up(f"{base_url}/api/places"))
+    latencies, errors, wall = asyncio.run(run_load(base_url, args.requests, args.concurrency))
+
+    stats = asyncio.run(fetch_stats(f"http://127.0.0.1:{args.stub_port}/stats"))
+    target.terminate()
+    stub.terminate()
+
+    print(json.dumps({
+        "target": args.target,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "llm_latency_seconds": args.llm_latency,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(args.requests / wall, 2),
+        "latency_p50": round(statistics.median(latencies), 3),
+        "latency_p95": round(percentile(latencies, 0.95), 3),
+        "latency_max": round(max(latencies), 3),
+        "llm_calls": stats["llm_calls"],
+        "peak_llm_in_flight": stats["peak_llm_in_flight"],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# Background knowledge-graph build jobs, so HTTP requests never block on city ingestion
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+from metrics import log
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class BuildJob:
+    """State of one city build. `done` is set once the job has succeeded or failed."""
+
+    def __init__(self, city, key):
+        self.id = uuid.uuid4().hex
+        self.city = city
+        self.key = key
+        self.status = QUEUED
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "city": self.city,
+            "status": self.status,
+            "error": self.error,
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+        }
+
+
+class BuildJobQueue:
+    """
+    Runs city builds on a bounded worker pool.
+
+    Submitting a city that already has a queued or running job returns that job instead of
+    starting a second build, so concurrent requests for the same new city trigger one build.
+
+    Args:
+        build_fn (callable): Called with the city name; builds and registers its knowledge graph.
+        key_fn (callable): Normalizes city names for deduplication.
+        max_workers (int): Number of builds that may run at once.
+        history (int): Number of finished jobs kept for status lookups.
+    """
+
+    def __init__(self, build_fn: Callable[[str], None], key_fn: Callable[[str], str] = None,
+                 max_workers: int = 2, history: int = 500):
+        self.build_fn = build_fn
+        self.key_fn = key_fn or (lambda city: city.strip().casefold())
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kg-build")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, BuildJob] = {}
+        self._active: Dict[str, BuildJob] = {}
+
+    def submit(self, city: str) -> BuildJob:
+        """Enqueues a build for `city`, or returns the build already in flight for it."""
+        key = self.key_fn(city)
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None:
+                return job
+            job = BuildJob(city, key)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._trim_history()
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: BuildJob):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            self.build_fn(job.city)
+            job.status = SUCCEEDED
+        except Exception as e:
+            log.warning(f"Error building knowledge graph for '{job.city}': {str(e)}")
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+            job.done.set()
+
+    def _trim_history(self):
+        finished = [job for job in self._jobs.values() if not job.active]
+        for job in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: str) -> Optional[BuildJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find(self, city: str) -> Optional[BuildJob]:
+        """Returns the in-flight job for `city`, if any."""
+        with self._lock:
+            return self._active.get(self.key_fn(city))
+
+    def wait(self, job: BuildJob, timeout: Optional[float] = None) -> bool:
+        """Blocks up to `timeout` seconds; returns True if the job finished successfully."""
+        job.done.wait(timeout)
+        return job.status == SUCCEEDED
+
+    def prefetch(self, cities: Iterable[str]):
+        """Enqueues warm-up builds; returns the submitted jobs."""
+        return [self.submit(city) for city in cities if city.strip()]
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_queue = None
+_queue_pid = None
+_queue_lock = threading.Lock()
+
+
+def get_build_queue(build_fn: Callable[[str], None], key_fn: Callable[[str], str] = None) -> BuildJobQueue:
+    """
+    Returns the process-wide build queue, creating it on first use.
+    The pool size is read from BUILD_WORKERS (default 2).
+    """
+    global _queue, _queue_pid
+    with _queue_lock:
+        if _queue is None or _queue_pid != os.getpid():
+            _queue = BuildJobQueue(build_fn, key_fn, max_workers=int(os.getenv("BUILD_WORKERS", 2)))
+            _queue_pid = os.getpid()
+        return _queue
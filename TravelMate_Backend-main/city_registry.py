@@ -0,0 +1,231 @@
+# Registry of cities that have a knowledge graph, with per-city build metadata
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from graph_ingest import sanitize_key
+
+
+class CityRegistry:
+    """
+    SQLite-backed set of registered cities with an in-memory index.
+
+    Names are matched by their sanitize_key, so "Bombay " and "bombay" are the same city.
+    Lookups are served from memory; the index is reloaded only when another connection
+    (e.g. another worker process) has committed a change, which SQLite reports cheaply
+    through `PRAGMA data_version`. Writes are single transactions, so they are atomic and
+    serialized across processes by SQLite's own file locking.
+
+    Args:
+        path (str): SQLite database file.
+        seed_file (str): Legacy existing_places.json, imported once into an empty registry.
+    """
+
+    def __init__(self, path: str, seed_file: Optional[str] = None):
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cities ("
+            " key TEXT PRIMARY KEY, name TEXT NOT NULL, created_at REAL NOT NULL,"
+            " built_at REAL, last_refresh REAL, node_count INTEGER, edge_count INTEGER,"
+            " version INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Fingerprints of the Wikipedia extract each place was last extracted from, for incremental refreshes
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS place_fingerprints ("
+            " city TEXT NOT NULL, key TEXT NOT NULL, name TEXT NOT NULL, fingerprint TEXT NOT NULL,"
+            " updated_at REAL NOT NULL, PRIMARY KEY (city, key))"
+        )
+        # Cities a process has claimed to warm up, so server workers starting together build each once
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS prefetch_claims (key TEXT PRIMARY KEY, claimed_at REAL NOT NULL)"
+        )
+        self._index: Dict[str, dict] = {}
+        self._data_version = None
+        if seed_file:
+            self._seed(seed_file)
+        self._reload()
+
+    def _seed(self, seed_file):
+        if not os.path.exists(seed_file):
+            return
+        if self._conn.execute("SELECT COUNT(*) FROM cities").fetchone()[0]:
+            return
+        with open(seed_file, "r") as file:
+            places = json.load(file)
+        now = time.time()
+        with self._transaction():
+            for place in places:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO cities (key, name, created_at) VALUES (?, ?, ?)",
+                    (sanitize_key(place["name"]), place["name"].strip(), now),
+                )
+
+    def _transaction(self):
+        conn = self._conn
+
+        class Transaction:
+            def __enter__(self):
+                # IMMEDIATE takes the write lock up front, so concurrent writers queue instead of failing
+                conn.execute("BEGIN IMMEDIATE")
+
+            def __exit__(self, exc_type, exc, tb):
+                conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+        return Transaction()
+
+    def _reload(self):
+        rows = self._conn.execute(
+            "SELECT key, name, created_at, built_at, last_refresh, node_count, edge_count, version"
+            " FROM cities ORDER BY created_at, rowid"
+        ).fetchall()
+        columns = ["key", "name", "created_at", "built_at", "last_refresh", "node_count", "edge_count", "version"]
+        self._index = {row[0]: dict(zip(columns, row)) for row in rows}
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _refresh_if_changed(self):
+        if self._conn.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+            self._reload()
+
+    def __contains__(self, name) -> bool:
+        with self._lock:
+            self._refresh_if_changed()
+            return sanitize_key(name) in self._index
+
+    def names(self) -> List[str]:
+        """Display names of all registered cities, in registration order."""
+        with self._lock:
+            self._refresh_if_changed()
+            return [city["name"] for city in self._index.values()]
+
+    def get(self, name) -> Optional[dict]:
+        """Metadata of a city, or None if it is not registered."""
+        with self._lock:
+            self._refresh_if_changed()
+            city = self._index.get(sanitize_key(name))
+            return dict(city) if city else None
+
+    def add(self, name):
+        """Registers a city if it is not registered yet."""
+        with self._lock:
+            with self._transaction():
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO cities (key, name, created_at) VALUES (?, ?, ?)",
+                    (sanitize_key(name), name.strip(), time.time()),
+                )
+            self._reload()
+
+    def mark_built(self, name, node_count=None, edge_count=None):
+        """Registers a city (if needed) and records a completed graph build, bumping its version."""
+        now = time.time()
+        with self._lock:
+            with self._transaction():
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO cities (key, name, created_at) VALUES (?, ?, ?)",
+                    (sanitize_key(name), name.strip(), now),
+                )
+                self._conn.execute(
+                    "UPDATE cities SET built_at = ?, last_refresh = ?, node_count = ?, edge_count = ?,"
+                    " version = version + 1 WHERE key = ?",
+                    (now, now, node_count, edge_count, sanitize_key(name)),
+                )
+            self._reload()
+
+    def mark_refreshed(self, name, node_count=None, edge_count=None, changed=True):
+        """Records an incremental refresh; the version is bumped only if the graph changed."""
+        with self._lock:
+            with self._transaction():
+                self._conn.execute(
+                    "UPDATE cities SET last_refresh = ?, node_count = COALESCE(node_count, 0) + ?,"
+                    " edge_count = COALESCE(edge_count, 0) + ?, version = version + ? WHERE key = ?",
+                    (time.time(), node_count or 0, edge_count or 0, 1 if changed else 0, sanitize_key(name)),
+                )
+            self._reload()
+
+    def fingerprints(self, name) -> Dict[str, str]:
+        """{place_key: fingerprint} of the places recorded for a city."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, fingerprint FROM place_fingerprints WHERE city = ?", (sanitize_key(name),)
+            ).fetchall()
+        return dict(rows)
+
+    def set_fingerprints(self, name, fingerprints: Dict[str, tuple], retired: Iterable[str] = ()):
+        """
+        Records place fingerprints for a city and forgets retired places, in one transaction.
+
+        Args:
+            fingerprints (dict): {place_key: (place_name, fingerprint)}
+            retired (iterable): Place keys to forget
+        """
+        now = time.time()
+        city = sanitize_key(name)
+        with self._lock:
+            with self._transaction():
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO place_fingerprints (city, key, name, fingerprint, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    [(city, key, place_name, fingerprint, now) for key, (place_name, fingerprint) in fingerprints.items()],
+                )
+                self._conn.executemany(
+                    "DELETE FROM place_fingerprints WHERE city = ? AND key = ?", [(city, key) for key in retired]
+                )
+
+    def claim_prefetch(self, names: Iterable[str], ttl_seconds: float = 600) -> List[str]:
+        """
+        Claims unregistered cities for a warm-up build, in one transaction.
+
+        A city is claimed if it is not registered and no process claimed it within
+        `ttl_seconds`, so a build that died with its process is retried on a later start.
+
+        Returns:
+            list: The names this call claimed, deduplicated by key
+        """
+        now = time.time()
+        claimed = {}
+        with self._lock:
+            with self._transaction():
+                for name in names:
+                    key = sanitize_key(name)
+                    if not name.strip() or key in claimed:
+                        continue
+                    if self._conn.execute("SELECT 1 FROM cities WHERE key = ?", (key,)).fetchone():
+                        continue
+                    row = self._conn.execute("SELECT claimed_at FROM prefetch_claims WHERE key = ?", (key,)).fetchone()
+                    if row and now - row[0] < ttl_seconds:
+                        continue
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO prefetch_claims (key, claimed_at) VALUES (?, ?)", (key, now)
+                    )
+                    claimed[key] = name.strip()
+        return list(claimed.values())
+
+    def is_stale(self, name, max_age_seconds: float) -> bool:
+        """True if the city was never built or refreshed, or not within `max_age_seconds`."""
+        city = self.get(name)
+        if city is None:
+            return True
+        last = city["last_refresh"] or city["built_at"]
+        return last is None or time.time() - last > max_age_seconds
+
+
+_registry = None
+_registry_pid = None
+_registry_lock = threading.Lock()
+
+
+def get_city_registry(seed_file: Optional[str] = None) -> CityRegistry:
+    """
+    Returns the process-wide registry, stored in CITY_REGISTRY_PATH (default "cities.sqlite3").
+    """
+    global _registry, _registry_pid
+    with _registry_lock:
+        if _registry is None or _registry_pid != os.getpid():
+            _registry = CityRegistry(os.getenv("CITY_REGISTRY_PATH", "cities.sqlite3"), seed_file)
+            _registry_pid = os.getpid()
+        return _registry
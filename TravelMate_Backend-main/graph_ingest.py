@@ -0,0 +1,241 @@
+# Bulk ingestion of extracted knowledge (TSV DataFrame) into the knowledge graph
+
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Frames of the nodes and edges actually added by one ingestion.
+IngestResult = namedtuple("IngestResult", ["nodes", "edges"])
+
+NODE_COLUMNS = ["key", "name", "type"]
+EDGE_COLUMNS = ["source", "target", "relation", "attributes", "source_place"]
+
+# Extraction column naming the place (node key) a row was extracted for; stored on edges as "source_place"
+SOURCE_PLACE = "Source_Place"
+
+
+def sanitize_key(name):
+    """Converts a name into a valid _key for ArangoDB."""
+    name = name.lower().strip()  # Ensure consistent casing and remove trailing spaces
+    name = re.sub(r'[^a-z0-9_-]', '_', name)  # Replace invalid characters
+    return name
+
+
+def sanitize_keys(names: pd.Series) -> pd.Series:
+    """Column-wise sanitize_key."""
+    return names.astype(str).str.lower().str.strip().str.replace(r'[^a-z0-9_-]', '_', regex=True)
+
+
+# ----------------------------------------------------------------Vectorized preparation----------------------------------------------------------------------
+
+def assign_source_places(df: pd.DataFrame, place_keys, current=None):
+    """
+    Records which of the extracted places each row belongs to, so a place's edges can later be
+    retired without touching edges other places' extractions added.
+
+    A row naming one of the places (Node_1 first) belongs to it. Gemini lists the rows of one
+    attraction together, so any other row belongs to the last place named before it.
+
+    Args:
+        place_keys (iterable): Node keys of the places the extraction was asked about.
+        current (str): Place of the last row of the previous batch, when ingesting a stream.
+
+    Returns:
+        tuple: (df with a Source_Place column, place of its last row)
+    """
+    place_keys = set(place_keys)
+    if len(place_keys) == 1:
+        current = next(iter(place_keys))
+    owners = []
+    for key_1, key_2 in zip(sanitize_keys(df['Node_1']), sanitize_keys(df['Node_2'])):
+        if key_1 in place_keys:
+            current = key_1
+        elif key_2 in place_keys:
+            current = key_2
+        owners.append(current)
+    return df.assign(**{SOURCE_PLACE: owners}), current
+
+
+def prepare_graph_frames(df: pd.DataFrame):
+    """
+    Turns the extraction DataFrame into deduplicated node and edge frames.
+
+    Nodes keep the name and type of their first occurrence (row by row, Node_1 before Node_2),
+    and edges are deduplicated as undirected pairs keeping the first relation, exactly as the
+    previous row-by-row has_node/has_edge checks did.
+
+    Returns:
+        tuple: (nodes, edges) DataFrames with NODE_COLUMNS and EDGE_COLUMNS.
+    """
+    df = df.reset_index(drop=True)
+    key_1 = sanitize_keys(df['Node_1'])
+    key_2 = sanitize_keys(df['Node_2'])
+
+    order = np.arange(len(df))
+    nodes = pd.concat([
+        pd.DataFrame({"key": key_1, "name": df['Node_1'], "type": df['Node_1_Type'], "order": order * 2}),
+        pd.DataFrame({"key": key_2, "name": df['Node_2'], "type": df['Node_2_Type'], "order": order * 2 + 1}),
+    ], ignore_index=True)
+    nodes = nodes.sort_values("order", kind="stable").drop_duplicates(subset="key")[NODE_COLUMNS]
+
+    attributes = df['Attributes'] if 'Attributes' in df.columns else pd.Series("{}", index=df.index)
+    source_place = df[SOURCE_PLACE] if SOURCE_PLACE in df.columns else pd.Series(None, index=df.index, dtype=object)
+    edges = pd.DataFrame({
+        "source": key_1,
+        "target": key_2,
+        "relation": df['Relation'],
+        "attributes": attributes,
+        "source_place": source_place,
+        "low": np.where(key_1 <= key_2, key_1, key_2),
+        "high": np.where(key_1 <= key_2, key_2, key_1),
+    })
+    edges = edges.drop_duplicates(subset=["low", "high"])[EDGE_COLUMNS]
+
+    return nodes.reset_index(drop=True), edges.reset_index(drop=True)
+
+
+# ----------------------------------------------------------------Backends----------------------------------------------------------------------
+
+def _undirected_pairs(edges: pd.DataFrame):
+    return set(zip(edges["source"], edges["target"])) | set(zip(edges["target"], edges["source"]))
+
+
+def _edge_attributes(row) -> dict:
+    attributes = {"relation": row.relation, "attributes": row.attributes}
+    if isinstance(row.source_place, str):
+        attributes["source_place"] = row.source_place
+    return attributes
+
+
+def ingest_networkx(G, nodes: pd.DataFrame, edges: pd.DataFrame) -> IngestResult:
+    """Adds the new nodes and edges to an in-memory NetworkX graph."""
+    new_nodes = nodes[~nodes["key"].isin(list(G.nodes))]
+    new_edges = edges[[not G.has_edge(u, v) for u, v in zip(edges["source"], edges["target"])]]
+
+    G.add_nodes_from((row.key, {"key": row.key, "name": row.name, "type": row.type})
+                     for row in new_nodes.itertuples(index=False))
+    G.add_edges_from((row.source, row.target, _edge_attributes(row)) for row in new_edges.itertuples(index=False))
+    return IngestResult(new_nodes, new_edges)
+
+
+def ingest_arango(db, node_collection: str, edge_collection: str, nodes: pd.DataFrame, edges: pd.DataFrame,
+                  batch_size: int = 1000) -> IngestResult:
+    """
+    Inserts the new nodes and edges with ArangoDB bulk imports.
+
+    Existing node keys and existing edges between the touched nodes are fetched with one AQL
+    query each, instead of one has_node/has_edge call per row.
+    """
+    existing_keys = set(db.aql.execute(
+        "FOR d IN @@collection FILTER d._key IN @keys RETURN d._key",
+        bind_vars={"@collection": node_collection, "keys": nodes["key"].tolist()},
+    ))
+    prefix = f"{node_collection}/"
+    node_ids = [prefix + key for key in nodes["key"]]
+    existing_pairs = {
+        (edge_from[len(prefix):], edge_to[len(prefix):])
+        for edge_from, edge_to in db.aql.execute(
+            "FOR e IN @@collection FILTER e._from IN @ids AND e._to IN @ids RETURN [e._from, e._to]",
+            bind_vars={"@collection": edge_collection, "ids": node_ids},
+        )
+    }
+    existing_pairs |= {(v, u) for u, v in existing_pairs}
+
+    new_nodes = nodes[~nodes["key"].isin(existing_keys)]
+    new_edges = edges[[(u, v) not in existing_pairs for u, v in zip(edges["source"], edges["target"])]]
+
+    if len(new_nodes):
+        db.collection(node_collection).import_bulk(
+            [{"_key": row.key, "key": row.key, "name": row.name, "type": row.type}
+             for row in new_nodes.itertuples(index=False)],
+            on_duplicate="ignore",
+            batch_size=batch_size,
+        )
+    if len(new_edges):
+        db.collection(edge_collection).import_bulk(
+            [{"_from": row.source, "_to": row.target, **_edge_attributes(row)}
+             for row in new_edges.itertuples(index=False)],
+            from_prefix=prefix,
+            to_prefix=prefix,
+            batch_size=batch_size,
+        )
+    return IngestResult(new_nodes, new_edges)
+
+
+def invalidate_nodes(G, keys):
+    """
+    Drops the given nodes and their adjacency from nxadb's local cache, so the next read of them
+    goes to ArangoDB. G is the graph shared by every request and build, so unlike G.clear() this
+    leaves the entries other threads are reading in place.
+    """
+    node_collection = G.default_node_type
+    ids = {f"{node_collection}/{key}" for key in keys}
+    nx_cache = getattr(G, "__networkx_cache__", None)
+    if nx_cache:
+        nx_cache.clear()
+    for cache in (G._node, G._adj):
+        # A full fetch would now miss new documents, so membership checks go back to the database
+        cache.FETCHED_ALL_DATA = cache.FETCHED_ALL_IDS = False
+        for node_id in ids:
+            cache.data.pop(node_id, None)
+
+
+def bulk_ingest(G, df: pd.DataFrame, batch_size: int = None) -> IngestResult:
+    """
+    Ingests an extraction DataFrame (Node_1, Relation, Node_2, Node_1_Type, Node_2_Type, Attributes)
+    into G, using ArangoDB bulk imports for nxadb graphs and add_*_from for in-memory graphs.
+
+    Returns:
+        IngestResult: Frames of the nodes and edges that were newly added.
+    """
+    batch_size = batch_size or int(os.getenv("INGEST_BATCH_SIZE", 1000))
+    nodes, edges = prepare_graph_frames(df)
+
+    db = getattr(G, "db", None)
+    if db is None:
+        return ingest_networkx(G, nodes, edges)
+
+    node_collection = G.default_node_type
+    edge_collection = G.edge_type_func(node_collection, node_collection)
+    result = ingest_arango(db, node_collection, edge_collection, nodes, edges, batch_size)
+    # nxadb keeps a local cache of what it has already read; drop the touched nodes so the new documents are seen
+    invalidate_nodes(G, set(result.nodes["key"]) | set(result.edges["source"]) | set(result.edges["target"]))
+    return result
+
+
+def retire_edges(G, place_keys) -> pd.DataFrame:
+    """
+    Removes the edges extracted for the given places (their "source_place"), keeping the nodes
+    and the edges other places' extractions added, even when they touch these places. Used
+    before re-extracting a place, so its edges are replaced.
+
+    Returns:
+        DataFrame: The removed edges, with "source" and "target" columns.
+    """
+    place_keys = list(dict.fromkeys(place_keys))
+    db = getattr(G, "db", None)
+    if db is None:
+        places = set(place_keys)
+        removed = [(u, v) for u, v, place in G.edges(data="source_place") if place in places]
+        G.remove_edges_from(removed)
+        return pd.DataFrame(removed, columns=["source", "target"])
+
+    node_collection = G.default_node_type
+    edge_collection = G.edge_type_func(node_collection, node_collection)
+    prefix = f"{node_collection}/"
+    # Sparse: edges ingested before provenance was recorded have no source_place
+    db.collection(edge_collection).add_persistent_index(fields=["source_place"], sparse=True)
+    removed = [
+        (edge_from[len(prefix):], edge_to[len(prefix):])
+        for edge_from, edge_to in db.aql.execute(
+            "FOR e IN @@collection FILTER e.source_place IN @places"
+            " REMOVE e IN @@collection RETURN [OLD._from, OLD._to]",
+            bind_vars={"@collection": edge_collection, "places": place_keys},
+        )
+    ]
+    # Drop both endpoints from nxadb's local cache so the removed edges are no longer seen
+    invalidate_nodes(G, set().union(*removed))
+    return pd.DataFrame(removed, columns=["source", "target"])
@@ -0,0 +1,194 @@
+# Per-city knowledge graph export: radial layout, compact columnar JSON and a version-keyed cache
+
+import math
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from graph_snapshot import StringTable
+
+
+def radial_layout(nodes: Dict[str, dict], edges: List[Tuple[str, str, Optional[str]]],
+                  sources: Iterable[str]) -> Dict[str, Tuple[float, float, int]]:
+    """
+    Hierarchical radial layout in O(n + m).
+
+    The city's places sit on the inner ring; every other node sits on ring `level` (its hop
+    distance from the nearest place), inside the angular sector of its BFS parent. Sectors are
+    proportional to subtree sizes and children are ordered by type, so nodes of the same type
+    cluster. Nodes not reachable from a place go on an outer ring.
+
+    Returns:
+        dict: {key: (x, y, level)} with coordinates in [-1, 1]
+    """
+    adjacency = {key: [] for key in nodes}
+    for u, v, _ in edges:
+        if u in adjacency and v in adjacency:
+            adjacency[u].append(v)
+            adjacency[v].append(u)
+
+    roots = sorted(key for key in dict.fromkeys(sources) if key in adjacency)
+    level = {key: 0 for key in roots}
+    children = {key: [] for key in nodes}
+    queue = deque(roots)
+    while queue:
+        node = queue.popleft()
+        for nbr in adjacency[node]:
+            if nbr not in level:
+                level[nbr] = level[node] + 1
+                children[node].append(nbr)
+                queue.append(nbr)
+
+    def sort_key(key):
+        return str(nodes[key].get("type") or ""), str(nodes[key].get("name") or key)
+
+    # Subtree sizes, children before parents (reverse BFS order)
+    size = {}
+    for node in sorted(level, key=level.get, reverse=True):
+        children[node].sort(key=sort_key)
+        size[node] = 1 + sum(size[child] for child in children[node])
+
+    depth = max(level.values(), default=0)
+    unreached = sorted((key for key in nodes if key not in level), key=sort_key)
+    rings = depth + (2 if unreached else 1)
+    positions = {}
+
+    total = sum(size[root] for root in roots)
+    stack = []
+    start = 0.0
+    for root in roots:
+        width = 2 * math.pi * size[root] / total
+        stack.append((root, start, width))
+        start += width
+    while stack:
+        node, start, width = stack.pop()
+        angle = start + width / 2
+        radius = (level[node] + 1) / rings
+        positions[node] = (round(radius * math.cos(angle), 4), round(radius * math.sin(angle), 4), level[node])
+        for child in children[node]:
+            child_width = width * size[child] / (size[node] - 1)
+            stack.append((child, start, child_width))
+            start += child_width
+
+    for i, key in enumerate(unreached):
+        angle = 2 * math.pi * i / len(unreached)
+        positions[key] = (round(math.cos(angle), 4), round(math.sin(angle), 4), depth + 1)
+    return positions
+
+
+def export_graph(nodes: Dict[str, dict], edges: List[Tuple[str, str, Optional[str]]], sources: Iterable[str]) -> dict:
+    """
+    Lays out a subgraph and encodes it as columnar arrays.
+
+    Nodes are ordered by level (places first), then by angle, so any prefix of the node arrays is
+    a coarse view of the graph. Node names, types and relations are interned into string tables.
+
+    Returns:
+        dict: {"names", "types", "relations": string tables,
+               "nodes": {"keys", "name", "type", "x", "y", "level"},
+               "edges": {"source", "target", "relation"}} with edges as node and relation indices
+    """
+    positions = radial_layout(nodes, edges, sources)
+    order = sorted(positions, key=lambda key: (positions[key][2], math.atan2(positions[key][1], positions[key][0])))
+    index = {key: i for i, key in enumerate(order)}
+    names, types, relations = StringTable(), StringTable(), StringTable()
+
+    edge_rows = sorted({(min(index[u], index[v]), max(index[u], index[v]), relations.intern(relation))
+                        for u, v, relation in edges if u in index and v in index and u != v},
+                       key=lambda row: (row[1], row[0]))
+    return {
+        "names": names.values,
+        "types": types.values,
+        "relations": relations.values,
+        "nodes": {
+            "keys": order,
+            "name": [names.intern(nodes[key].get("name")) for key in order],
+            "type": [types.intern(nodes[key].get("type")) for key in order],
+            "x": [positions[key][0] for key in order],
+            "y": [positions[key][1] for key in order],
+            "level": [positions[key][2] for key in order],
+        },
+        "edges": {
+            "source": [row[0] for row in edge_rows],
+            "target": [row[1] for row in edge_rows],
+            "relation": [row[2] for row in edge_rows],
+        },
+    }
+
+
+def page(export: dict, max_level: Optional[int] = None, offset: int = 0, limit: Optional[int] = None) -> dict:
+    """
+    Slices an export for level of detail and pagination.
+
+    Nodes up to `max_level` are kept, and `offset`/`limit` select a range of them. A page carries
+    the edges whose later endpoint is on it, so every edge arrives once and after both of its
+    endpoints. Node indices stay global across pages.
+
+    Returns:
+        dict: The sliced export, plus "offset", "total_nodes", "total_edges" and "next_offset"
+              (None on the last page)
+    """
+    nodes = export["nodes"]
+    levels = nodes["level"]
+    end = len(levels) if max_level is None else sum(1 for level in levels if level <= max_level)
+    stop = end if limit is None else min(end, offset + limit)
+    offset = min(offset, stop)
+
+    edges = export["edges"]
+    # Edges are sorted by their later endpoint, so the page's edges are one contiguous range
+    lo = next((i for i, target in enumerate(edges["target"]) if target >= offset), len(edges["target"]))
+    hi = next((i for i, target in enumerate(edges["target"]) if target >= stop), len(edges["target"]))
+    levelled_edges = sum(1 for target in edges["target"] if target < end)
+
+    return {
+        "names": export["names"],
+        "types": export["types"],
+        "relations": export["relations"],
+        "nodes": {column: values[offset:stop] for column, values in nodes.items()},
+        "edges": {column: values[lo:hi] for column, values in edges.items()},
+        "offset": offset,
+        "total_nodes": end,
+        "total_edges": levelled_edges,
+        "next_offset": stop if stop < end else None,
+    }
+
+
+class LayoutCache:
+    """LRU of city exports keyed by (city, version, depth), so a layout is computed once per graph version."""
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[dict]:
+        with self._lock:
+            export = self._entries.get(key)
+            if export is not None:
+                self._entries.move_to_end(key)
+            return export
+
+    def set(self, key: tuple, export: dict):
+        with self._lock:
+            # Older versions of the same city will never be asked for again
+            for stale in [entry for entry in self._entries if entry[0] == key[0] and entry != key]:
+                del self._entries[stale]
+            self._entries[key] = export
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_layout_cache() -> LayoutCache:
+    """Returns the process-wide layout cache, holding GRAPH_EXPORT_CACHE_SIZE cities (default 16)."""
+    global _cache, _cache_pid
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid():
+            _cache = LayoutCache(int(os.getenv("GRAPH_EXPORT_CACHE_SIZE", 16)))
+            _cache_pid = os.getpid()
+        return _cache
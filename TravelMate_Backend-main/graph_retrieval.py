@@ -0,0 +1,363 @@
+# Knowledge graph neighbourhood retrieval for the recommendation pipeline
+
+import os
+from collections import namedtuple
+from typing import Dict, Hashable, Iterable, List, Optional
+
+
+# A single retrieved path: source place -> target node, with the relation chain between them.
+PathRecord = namedtuple(
+    "PathRecord",
+    ["source", "source_type", "target", "target_name", "target_type", "relations"],
+)
+
+# ----------------------------------------------------------------Shared adjacency view----------------------------------------------------------------------
+
+class AdjacencyView:
+    """
+    Memoizes neighbour and node-attribute lookups on a graph for the lifetime of one request.
+
+    With nxadb every `G.adj[n]` and `G.nodes[n]` access may be a round trip to ArangoDB,
+    so each node is expanded at most once no matter how many sources reach it.
+    """
+
+    def __init__(self, G):
+        self.G = G
+        self.lookups = 0
+        self._adj: Dict[Hashable, List] = {}
+        self._nodes: Dict[Hashable, Dict] = {}
+
+    def neighbors(self, node):
+        """Return a list of (neighbor, relation) pairs for `node`."""
+        if node not in self._adj:
+            self.lookups += 1
+            self._adj[node] = [
+                (nbr, (data or {}).get("relation"))
+                for nbr, data in self.G.adj[node].items()
+            ]
+        return self._adj[node]
+
+    def node(self, node):
+        """Return the attribute dict of `node`, or None if it is not in the graph."""
+        if node not in self._nodes:
+            self.lookups += 1
+            try:
+                self._nodes[node] = dict(self.G.nodes[node])
+            except (KeyError, ValueError):
+                self._nodes[node] = None
+        return self._nodes[node]
+
+
+# ----------------------------------------------------------------Multi-source bounded BFS----------------------------------------------------------------------
+
+def extract_neighborhoods(G, sources: Iterable, max_depth: int = 3, view: Optional[AdjacencyView] = None) -> Dict:
+    """
+    Runs one bounded BFS per source, level-synchronously across all sources.
+
+    Every level expands the union of all frontiers, so a node reached from several places
+    is fetched from the graph only once. Parent pointers and edge relations are recorded
+    during the walk, so no follow-up `shortest_path` or `get_edge_data` calls are needed.
+
+    Args:
+        G (nx.Graph): Knowledge graph (NetworkX or nxadb).
+        sources (iterable): Node keys to start from. Keys not in the graph are skipped.
+        max_depth (int): Maximum number of hops to expand.
+        view (AdjacencyView): Optional shared view, to reuse lookups across calls.
+
+    Returns:
+        dict: {source: {node: (parent, relation, depth)}} for every node reachable within
+              `max_depth` hops, excluding the source itself.
+    """
+    view = view or AdjacencyView(G)
+    parents = {}
+    frontiers = {}
+    for source in dict.fromkeys(sources):
+        if view.node(source) is None:
+            continue
+        parents[source] = {source: (None, None, 0)}
+        frontiers[source] = [source]
+
+    for depth in range(1, max_depth + 1):
+        next_frontiers = {}
+        for source, frontier in frontiers.items():
+            seen = parents[source]
+            next_frontier = []
+            for node in frontier:
+                for nbr, relation in view.neighbors(node):
+                    if nbr not in seen:
+                        seen[nbr] = (node, relation, depth)
+                        next_frontier.append(nbr)
+            if next_frontier:
+                next_frontiers[source] = next_frontier
+        frontiers = next_frontiers
+        if not frontiers:
+            break
+
+    for source, seen in parents.items():
+        del seen[source]
+    return parents
+
+
+def relation_chain(tree: Dict, node) -> List[str]:
+    """Walks the parent pointers from `node` back to the source and returns the relations in source order."""
+    relations = []
+    while node in tree:
+        parent, relation, _ = tree[node]
+        if relation is not None:
+            relations.append(relation)
+        node = parent
+    relations.reverse()
+    return relations
+
+
+def get_path_records(G, sources: Iterable, max_depth: int = 3, view: Optional[AdjacencyView] = None) -> Dict[Hashable, List[PathRecord]]:
+    """
+    Returns one PathRecord per node reachable within `max_depth` hops of each source.
+
+    Sources missing from the graph are absent from the result.
+    """
+    view = view or AdjacencyView(G)
+    trees = extract_neighborhoods(G, sources, max_depth, view)
+    records = {}
+    for source, tree in trees.items():
+        source_type = view.node(source).get("type", "unknown type")
+        source_records = []
+        for node in tree:
+            data = view.node(node) or {}
+            source_records.append(PathRecord(
+                source=source,
+                source_type=source_type,
+                target=node,
+                target_name=data.get("name", "unknown"),
+                target_type=data.get("type", "unknown type"),
+                relations=relation_chain(tree, node),
+            ))
+        records[source] = source_records
+    return records
+
+
+def format_path_sentence(place_name: str, record: PathRecord) -> str:
+    """Formats a PathRecord as the sentence fed to the recommendation prompt."""
+    return (f'Node "{place_name}, a {record.source_type}" is connected to '
+            f'Node "{record.target_name}, a {record.target_type}" by the '
+            f'relationships: "{", ".join(record.relations)}".')
+
+
+# ----------------------------------------------------------------Retrieval backends----------------------------------------------------------------------
+
+class GraphRetriever:
+    """
+    Interface for fetching the 1..max_depth-hop neighbourhood of a batch of place keys.
+
+    Implementations count `round_trips`, the number of calls made to the graph store,
+    since that is what dominates retrieval latency against ArangoDB.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.round_trips = 0
+
+    def retrieve(self, place_keys: Iterable, max_depth: int = 3) -> Dict[Hashable, List[PathRecord]]:
+        """
+        Args:
+            place_keys (iterable): Sanitized node keys of the places to expand.
+            max_depth (int): Maximum number of hops to expand.
+
+        Returns:
+            dict: {place_key: [PathRecord, ...]} for every key present in the graph.
+        """
+        raise NotImplementedError
+
+    def fetch_subgraph(self, place_keys: Iterable, max_depth: int = 3):
+        """
+        Fetches the union of the BFS trees of depth `max_depth` rooted at each place key.
+
+        Every shortest path from a place to a node within `max_depth` hops lies in its tree, so
+        traversals from these places over the returned subgraph give the same results as over G.
+
+        Returns:
+            tuple: ({key: {"name": ..., "type": ...}}, [(u, v, relation), ...])
+        """
+        raise NotImplementedError
+
+    def fetch_induced_edges(self, keys: Iterable) -> List:
+        """
+        Fetches every edge between two of the given nodes, e.g. to complete the BFS trees of
+        fetch_subgraph into the subgraph they span.
+
+        Returns:
+            list: [(u, v, relation), ...], each edge once
+        """
+        raise NotImplementedError
+
+
+class NetworkXRetriever(GraphRetriever):
+    """Client-side multi-source BFS over any NetworkX-compatible graph, including an in-memory nx.Graph."""
+
+    name = "networkx"
+
+    def __init__(self, G):
+        super().__init__()
+        self.view = AdjacencyView(G)
+
+    def retrieve(self, place_keys, max_depth=3):
+        records = get_path_records(self.view.G, place_keys, max_depth, self.view)
+        self.round_trips = self.view.lookups
+        return records
+
+    def fetch_subgraph(self, place_keys, max_depth=3):
+        trees = extract_neighborhoods(self.view.G, place_keys, max_depth, self.view)
+        nodes = {}
+        edges = set()
+        for source, tree in trees.items():
+            for key in [source, *tree]:
+                data = self.view.node(key) or {}
+                nodes[key] = {"name": data.get("name", "unknown"), "type": data.get("type", "unknown type")}
+            for node, (parent, relation, _) in tree.items():
+                edges.add((parent, node, relation))
+        self.round_trips = self.view.lookups
+        return nodes, list(edges)
+
+    def fetch_induced_edges(self, keys):
+        keys = set(keys)
+        edges = []
+        for u in keys:
+            for v, relation in self.view.neighbors(u):
+                # Each undirected edge is seen from both ends; keep one
+                if v in keys and (u < v or u == v):
+                    edges.append((u, v, relation))
+        self.round_trips = self.view.lookups
+        return edges
+
+
+class AqlRetriever(GraphRetriever):
+    """Server-side retrieval: the whole batch is expanded by a single AQL traversal query."""
+
+    name = "aql"
+
+    QUERY = """
+        FOR key IN @keys
+            LET start = DOCUMENT(@node_collection, key)
+            FILTER start != null
+            RETURN {
+                source: key,
+                source_type: start.type,
+                paths: (
+                    FOR v, e, p IN 1..@max_depth ANY start GRAPH @graph
+                        OPTIONS {order: "bfs", uniqueVertices: "global"}
+                        RETURN {
+                            target: v._key,
+                            target_name: v.name,
+                            target_type: v.type,
+                            relations: p.edges[* FILTER CURRENT.relation != null].relation
+                        }
+                )
+            }
+    """
+
+    def __init__(self, db, graph_name, node_collection=None, batch_size=1000):
+        super().__init__()
+        self.db = db
+        self.graph_name = graph_name
+        self.node_collection = node_collection or f"{graph_name}_node"
+        self.batch_size = batch_size
+
+    def execute(self, query, bind_vars):
+        """Runs an AQL query and returns all rows, counting one round trip per cursor batch."""
+        self.round_trips += 1
+        cursor = self.db.aql.execute(query, bind_vars=bind_vars, batch_size=self.batch_size)
+        rows = []
+        while True:
+            while not cursor.empty():
+                rows.append(cursor.pop())
+            if not cursor.has_more():
+                break
+            self.round_trips += 1
+            cursor.fetch()
+        return rows
+
+    def retrieve(self, place_keys, max_depth=3):
+        rows = self.execute(self.QUERY, {
+            "keys": list(dict.fromkeys(place_keys)),
+            "node_collection": self.node_collection,
+            "graph": self.graph_name,
+            "max_depth": max_depth,
+        })
+        records = {}
+        for row in rows:
+            source_type = row.get("source_type") or "unknown type"
+            records[row["source"]] = [
+                PathRecord(
+                    source=row["source"],
+                    source_type=source_type,
+                    target=path["target"],
+                    target_name=path.get("target_name") or "unknown",
+                    target_type=path.get("target_type") or "unknown type",
+                    relations=path.get("relations") or [],
+                )
+                for path in row["paths"]
+            ]
+        return records
+
+    SUBGRAPH_QUERY = """
+        FOR key IN @keys
+            LET start = DOCUMENT(@node_collection, key)
+            FILTER start != null
+            RETURN {
+                source: {key: key, name: start.name, type: start.type},
+                tree: (
+                    FOR v, e IN 1..@max_depth ANY start GRAPH @graph
+                        OPTIONS {order: "bfs", uniqueVertices: "global"}
+                        RETURN {key: v._key, name: v.name, type: v.type, from: e._from, to: e._to, relation: e.relation}
+                )
+            }
+    """
+
+    def fetch_subgraph(self, place_keys, max_depth=3):
+        rows = self.execute(self.SUBGRAPH_QUERY, {
+            "keys": list(dict.fromkeys(place_keys)),
+            "node_collection": self.node_collection,
+            "graph": self.graph_name,
+            "max_depth": max_depth,
+        })
+        nodes = {}
+        edges = set()
+        for row in rows:
+            for node in [row["source"], *row["tree"]]:
+                nodes[node["key"]] = {"name": node.get("name") or "unknown", "type": node.get("type") or "unknown type"}
+            for step in row["tree"]:
+                edges.add((step["from"].split("/", 1)[1], step["to"].split("/", 1)[1], step.get("relation")))
+        return nodes, list(edges)
+
+    INDUCED_EDGES_QUERY = """
+        LET ids = MERGE(FOR key IN @keys RETURN {[CONCAT(@node_collection, "/", key)]: true})
+        FOR key IN @keys
+            FOR v, e IN 1..1 OUTBOUND CONCAT(@node_collection, "/", key) GRAPH @graph
+                FILTER HAS(ids, v._id)
+                RETURN {from: e._from, to: e._to, relation: e.relation}
+    """
+
+    def fetch_induced_edges(self, keys):
+        # Following outbound edges only returns each edge once, from its _from node
+        rows = self.execute(self.INDUCED_EDGES_QUERY, {
+            "keys": list(dict.fromkeys(keys)),
+            "node_collection": self.node_collection,
+            "graph": self.graph_name,
+        })
+        return [(row["from"].split("/", 1)[1], row["to"].split("/", 1)[1], row.get("relation")) for row in rows]
+
+
+def get_retriever(G, backend: Optional[str] = None) -> GraphRetriever:
+    """
+    Picks a retrieval backend for `G`.
+
+    nxadb graphs use the AQL backend unless GRAPH_RETRIEVAL_BACKEND=networkx is set;
+    plain NetworkX graphs (e.g. in tests) always use the client-side backend.
+    """
+    backend = backend or os.getenv("GRAPH_RETRIEVAL_BACKEND", "aql")
+    db = getattr(G, "db", None)
+    if backend == "aql" and db is not None:
+        node_collection = getattr(G, "default_node_type", None)
+        return AqlRetriever(db, G.name, node_collection)
+    return NetworkXRetriever(G)
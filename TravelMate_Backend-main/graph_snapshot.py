@@ -0,0 +1,319 @@
+# Compact per-city in-memory snapshots of the knowledge graph (CSR adjacency + interned strings)
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from graph_retrieval import GraphRetriever, PathRecord
+
+
+class StringTable:
+    """Interns strings to dense integer ids."""
+
+    def __init__(self, values: Iterable[str] = ()):
+        self.values: List[str] = []
+        self.ids: Dict[str, int] = {}
+        for value in values:
+            self.intern(value)
+
+    def intern(self, value) -> int:
+        value = "" if value is None else str(value)
+        if value not in self.ids:
+            self.ids[value] = len(self.values)
+            self.values.append(value)
+        return self.ids[value]
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self.values) + sum(sys.getsizeof(value) for value in self.values)
+
+
+class GraphSnapshot:
+    """
+    Immutable CSR copy of a city's subgraph.
+
+    Node keys, names and types and edge relations are interned into string tables, and
+    adjacency is three flat int32 arrays, instead of nested dicts per node and edge.
+    """
+
+    def __init__(self, nodes: Dict[str, dict], edges: List[Tuple[str, str, Optional[str]]],
+                 sources: Iterable[str], version=None):
+        self.version = version
+        self.created_at = time.time()
+        self.sources = frozenset(sources)
+        self.keys = StringTable(nodes)
+        self.labels = StringTable()
+        self.relations = StringTable()
+        self.node_name = np.array([self.labels.intern(nodes[key].get("name")) for key in self.keys.values], dtype=np.int32)
+        self.node_type = np.array([self.labels.intern(nodes[key].get("type")) for key in self.keys.values], dtype=np.int32)
+
+        ids = self.keys.ids
+        edges = [(ids[u], ids[v], self.relations.intern(relation) if relation is not None else -1)
+                 for u, v, relation in edges if u in ids and v in ids]
+        edge_array = np.array(edges, dtype=np.int32).reshape(-1, 3)
+        # Undirected: store both directions, then group by source node
+        src = np.concatenate([edge_array[:, 0], edge_array[:, 1]])
+        dst = np.concatenate([edge_array[:, 1], edge_array[:, 0]])
+        rel = np.concatenate([edge_array[:, 2], edge_array[:, 2]])
+        order = np.argsort(src, kind="stable")
+        self.indices = dst[order]
+        self.edge_relation = rel[order]
+        self.indptr = np.zeros(len(self.keys.values) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(src, minlength=len(self.keys.values)), out=self.indptr[1:])
+
+    @property
+    def number_of_nodes(self):
+        return len(self.keys.values)
+
+    @property
+    def number_of_edges(self):
+        return len(self.indices) // 2
+
+    def nbytes(self) -> int:
+        """Approximate memory held by this snapshot."""
+        arrays = self.node_name.nbytes + self.node_type.nbytes + self.indices.nbytes + self.edge_relation.nbytes + self.indptr.nbytes
+        tables = self.keys.nbytes() + self.labels.nbytes() + self.relations.nbytes() + sys.getsizeof(self.keys.ids)
+        return arrays + tables
+
+    def node_data(self) -> Dict[str, dict]:
+        labels = self.labels.values
+        return {key: {"name": labels[self.node_name[i]], "type": labels[self.node_type[i]]}
+                for i, key in enumerate(self.keys.values)}
+
+    def edge_list(self) -> List[Tuple[str, str, Optional[str]]]:
+        """The undirected edges as (u, v, relation), read back from the CSR arrays."""
+        src = np.repeat(np.arange(self.number_of_nodes, dtype=np.int32), np.diff(self.indptr))
+        # Every edge is stored in both directions; keep the one from the lower id
+        keep = src < self.indices
+        keys, relations = self.keys.values, self.relations.values
+        return [(keys[u], keys[v], relations[r] if r >= 0 else None)
+                for u, v, r in zip(src[keep].tolist(), self.indices[keep].tolist(), self.edge_relation[keep].tolist())]
+
+    def path_records(self, source: str, max_depth: int = 3) -> Optional[List[PathRecord]]:
+        """Bounded BFS from `source`; returns None if the source is not in the snapshot."""
+        start = self.keys.ids.get(source)
+        if start is None:
+            return None
+        parents = {start: (-1, -1)}
+        frontier = [start]
+        for _ in range(max_depth):
+            next_frontier = []
+            for node in frontier:
+                lo, hi = self.indptr[node], self.indptr[node + 1]
+                for nbr, relation in zip(self.indices[lo:hi].tolist(), self.edge_relation[lo:hi].tolist()):
+                    if nbr not in parents:
+                        parents[nbr] = (node, relation)
+                        next_frontier.append(nbr)
+            frontier = next_frontier
+
+        labels = self.labels.values
+        source_type = labels[self.node_type[start]] or "unknown type"
+        records = []
+        for node in parents:
+            if node == start:
+                continue
+            relations = []
+            step = node
+            while step != start:
+                step, relation = parents[step]
+                if relation >= 0:
+                    relations.append(self.relations.values[relation])
+            relations.reverse()
+            records.append(PathRecord(
+                source=source,
+                source_type=source_type,
+                target=self.keys.values[node],
+                target_name=labels[self.node_name[node]] or "unknown",
+                target_type=labels[self.node_type[node]] or "unknown type",
+                relations=relations,
+            ))
+        return records
+
+    def with_delta(self, nodes: Dict[str, dict], edges: List[Tuple[str, str, Optional[str]]], version=None):
+        """Returns a new snapshot with extra nodes and edges added."""
+        all_nodes = self.node_data()
+        for key, data in nodes.items():
+            all_nodes.setdefault(key, data)
+        return GraphSnapshot(all_nodes, self.edge_list() + list(edges), self.sources, version)
+
+
+class SnapshotRetriever(GraphRetriever):
+    """Serves retrieval from a local GraphSnapshot, with no graph store round trips."""
+
+    name = "snapshot"
+
+    def __init__(self, snapshot: GraphSnapshot):
+        super().__init__()
+        self.snapshot = snapshot
+
+    def retrieve(self, place_keys, max_depth=3):
+        records = {}
+        for key in dict.fromkeys(place_keys):
+            source_records = self.snapshot.path_records(key, max_depth)
+            if source_records is not None:
+                records[key] = source_records
+        return records
+
+    def fetch_subgraph(self, place_keys, max_depth=3):
+        return self.snapshot.node_data(), self.snapshot.edge_list()
+
+
+def delta_edges(ids: Dict[str, int], nodes: Dict[str, dict],
+                edges: List[Tuple[str, str, Optional[str]]]) -> Optional[List[Tuple[str, str, Optional[str]]]]:
+    """
+    The delta edges to add to a snapshot with node ids `ids`, or None if they cannot be added
+    without changing existing distances.
+
+    New nodes are grouped into connected components. A component attached to the snapshot is
+    added with all of its edges if it hangs off exactly one snapshot node and nothing outside the
+    snapshot. An edge between two existing nodes rules the delta out.
+    """
+    parent = {key: key for key in nodes if key not in ids}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for u, v, _ in edges:
+        if u in parent and v in parent:
+            parent[find(u)] = find(v)
+        elif u not in parent and v not in parent and (u in ids or v in ids):
+            return None
+
+    inside = {}
+    outside = set()
+    for u, v, _ in edges:
+        if (u in parent) != (v in parent):
+            new_key, old = (u, v) if u in parent else (v, u)
+            if old in ids:
+                inside.setdefault(find(new_key), set()).add(old)
+            else:
+                outside.add(find(new_key))
+    for group, anchors in inside.items():
+        if len(anchors) > 1 or group in outside:
+            return None
+    return [(u, v, relation) for u, v, relation in edges
+            if (u in parent or v in parent) and find(u if u in parent else v) in inside]
+
+
+class SnapshotCache:
+    """
+    LRU of per-city snapshots, bounded by the total bytes they hold.
+
+    A snapshot is reused while its version matches the city's registry version, it covers all
+    requested place keys and it is younger than `max_age` seconds (builds of other cities can
+    touch shared nodes without bumping this city's version).
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, max_age: float = 600, max_depth: int = 3):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_depth = max_depth
+        self._snapshots: "OrderedDict[str, GraphSnapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+
+    def _fresh(self, snapshot, version, place_keys):
+        return (snapshot.version == version
+                and snapshot.sources.issuperset(place_keys)
+                and time.time() - snapshot.created_at < self.max_age)
+
+    def get_retriever(self, city: str, version, place_keys: List[str], base: GraphRetriever) -> SnapshotRetriever:
+        """
+        Returns a retriever over the city's snapshot, loading it through `base` if needed.
+
+        Args:
+            city (str): Sanitized city key.
+            version: The city's current version; a mismatch forces a reload.
+            place_keys (list): Place keys the caller is about to retrieve.
+            base (GraphRetriever): Retriever over the live graph, used to load the subgraph.
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(city)
+            if snapshot is not None and self._fresh(snapshot, version, place_keys):
+                self._snapshots.move_to_end(city)
+                self.hits += 1
+                return SnapshotRetriever(snapshot)
+
+        sources = set(place_keys) | (snapshot.sources if snapshot is not None and snapshot.version == version else set())
+        nodes, edges = base.fetch_subgraph(sources, self.max_depth)
+        snapshot = GraphSnapshot(nodes, edges, sources, version)
+        with self._lock:
+            self.loads += 1
+            self._snapshots[city] = snapshot
+            self._snapshots.move_to_end(city)
+            self._evict()
+        retriever = SnapshotRetriever(snapshot)
+        retriever.round_trips = base.round_trips
+        return retriever
+
+    def _evict(self):
+        total = sum(snapshot.nbytes() for snapshot in self._snapshots.values())
+        while total > self.max_bytes and len(self._snapshots) > 1:
+            _, snapshot = self._snapshots.popitem(last=False)
+            total -= snapshot.nbytes()
+
+    def invalidate(self, city: str):
+        with self._lock:
+            self._snapshots.pop(city, None)
+
+    def apply_delta(self, nodes: Dict[str, dict], edges: List[Tuple[str, str, Optional[str]]],
+                    city: Optional[str] = None, version=None):
+        """
+        Patches cached snapshots after an ingestion instead of dropping them.
+
+        A snapshot holds depth-bounded BFS trees, so its outer nodes have neighbours it never
+        loaded. Only new nodes hanging off a single existing node can be patched in without
+        changing any existing distance: a delta edge between two existing nodes, a group of
+        connected new nodes touching two or more existing nodes, or an edge to an existing node
+        outside the snapshot could all shorten paths into unloaded neighbourhoods, so such a
+        snapshot is dropped. Snapshots the delta does not touch are kept as they are; `city`'s
+        snapshot gets `version`.
+        """
+        with self._lock:
+            for key, snapshot in list(self._snapshots.items()):
+                ids = snapshot.keys.ids
+                patch = delta_edges(ids, nodes, edges)
+                if patch is None:
+                    del self._snapshots[key]
+                elif patch or key == city:
+                    new_version = version if key == city else snapshot.version
+                    patched_nodes = {node: nodes[node] for edge in patch for node in edge[:2] if node not in ids}
+                    self._snapshots[key] = snapshot.with_delta(patched_nodes, patch, new_version)
+            self._evict()
+
+    def get_stats(self) -> Dict[str, dict]:
+        """Returns {city: {"bytes", "nodes", "edges", "version"}} for every cached snapshot."""
+        with self._lock:
+            return {
+                city: {"bytes": snapshot.nbytes(), "nodes": snapshot.number_of_nodes,
+                       "edges": snapshot.number_of_edges, "version": snapshot.version}
+                for city, snapshot in self._snapshots.items()
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_snapshot_cache() -> SnapshotCache:
+    """
+    Returns the process-wide snapshot cache, configured from the environment:
+        SNAPSHOT_CACHE_MAX_BYTES  Total memory budget for snapshots (default 256 MiB)
+        SNAPSHOT_MAX_AGE_SECONDS  Reload snapshots older than this (default 600)
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SnapshotCache(
+                max_bytes=int(os.getenv("SNAPSHOT_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+                max_age=float(os.getenv("SNAPSHOT_MAX_AGE_SECONDS", 600)),
+            )
+        return _cache
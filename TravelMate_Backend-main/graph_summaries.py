@@ -0,0 +1,125 @@
+# Per-place relationship summaries, materialized on the graph at build time
+
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+from graph_ingest import invalidate_nodes
+from graph_retrieval import PathRecord, get_retriever
+
+SUMMARY_ATTRIBUTE = "relationship_summary"
+
+
+def summarize_records(records: List[PathRecord], limit: Optional[int] = None) -> dict:
+    """
+    Ranks and deduplicates a place's path records into a storable summary.
+
+    Paths are ranked by hop count, then by target name; a target reached under the same name
+    and relation chain through different node keys is kept once.
+    """
+    source_type = records[0].source_type if records else "unknown type"
+    paths = []
+    seen = set()
+    for record in sorted(records, key=lambda r: (len(r.relations), r.target_name)):
+        signature = (record.target_name, tuple(record.relations))
+        if signature in seen:
+            continue
+        seen.add(signature)
+        paths.append({"target": record.target, "name": record.target_name, "type": record.target_type,
+                      "relations": list(record.relations)})
+        if limit and len(paths) >= limit:
+            break
+    return {"source_type": source_type, "paths": paths, "updated_at": time.time()}
+
+
+def summary_records(key: str, summary: dict) -> List[PathRecord]:
+    """Expands a stored summary back into PathRecords."""
+    return [
+        PathRecord(source=key, source_type=summary.get("source_type", "unknown type"), target=path.get("target"),
+                   target_name=path["name"], target_type=path["type"], relations=path["relations"])
+        for path in summary.get("paths", [])
+    ]
+
+
+# ----------------------------------------------------------------Storage----------------------------------------------------------------------
+
+def _node_collection(G):
+    return G.default_node_type
+
+
+def write_summaries(G, summaries: Dict[str, dict]):
+    """Stores summaries as a node attribute: one AQL update for nxadb, attribute writes for NetworkX."""
+    if not summaries:
+        return
+    db = getattr(G, "db", None)
+    if db is None:
+        for key, summary in summaries.items():
+            G.nodes[key][SUMMARY_ATTRIBUTE] = summary
+        return
+    db.aql.execute(
+        "FOR doc IN @docs UPDATE {_key: doc.key} WITH {@attribute: doc.summary} IN @@collection"
+        " OPTIONS {mergeObjects: false}",
+        bind_vars={
+            "docs": [{"key": key, "summary": summary} for key, summary in summaries.items()],
+            "attribute": SUMMARY_ATTRIBUTE,
+            "@collection": _node_collection(G),
+        },
+    )
+    # Drop the updated nodes from nxadb's local cache so readers see the new attribute
+    invalidate_nodes(G, summaries)
+
+
+def load_summaries(G, keys: Iterable[str]) -> Dict[str, Optional[dict]]:
+    """
+    Fetches stored summaries with a single keyed lookup.
+
+    Returns:
+        dict: {key: summary} for keys in the graph; the value is None when the node exists
+              but has no summary yet. Keys not in the graph are absent.
+    """
+    keys = list(dict.fromkeys(keys))
+    db = getattr(G, "db", None)
+    if db is None:
+        return {key: G.nodes[key].get(SUMMARY_ATTRIBUTE) for key in keys if key in G}
+    rows = db.aql.execute(
+        "FOR key IN @keys LET doc = DOCUMENT(@collection, key) FILTER doc != null"
+        " RETURN {key: key, summary: doc[@attribute]}",
+        bind_vars={"keys": keys, "collection": _node_collection(G), "attribute": SUMMARY_ATTRIBUTE},
+    )
+    return {row["key"]: row["summary"] for row in rows}
+
+
+# ----------------------------------------------------------------Materialization----------------------------------------------------------------------
+
+def materialize_summaries(G, attraction_keys: Iterable[str], touched_keys: Iterable[str] = (),
+                          max_depth: int = 3, limit: Optional[int] = None) -> int:
+    """
+    Computes and stores summaries for new attractions and for existing summaries made stale.
+
+    A new edge changes the `max_depth`-hop neighbourhood of every node within `max_depth - 1`
+    hops of its endpoints, so those nodes' stored summaries are recomputed; nodes without a
+    stored summary are left alone.
+
+    Args:
+        G (nx.Graph): Knowledge graph (NetworkX or nxadb).
+        attraction_keys (iterable): Keys that should get a summary (e.g. the Node_1 entities just extracted).
+        touched_keys (iterable): Endpoints of newly added edges.
+        limit (int): Maximum number of paths kept per summary (default SUMMARY_MAX_PATHS, 0 for all).
+
+    Returns:
+        int: Number of summaries written.
+    """
+    limit = limit if limit is not None else int(os.getenv("SUMMARY_MAX_PATHS", 0))
+    retriever = get_retriever(G)
+    targets = set(attraction_keys)
+
+    touched_keys = list(dict.fromkeys(touched_keys))
+    if touched_keys:
+        nearby, _ = retriever.fetch_subgraph(touched_keys, max_depth - 1)
+        existing = load_summaries(G, set(nearby) - targets)
+        targets.update(key for key, summary in existing.items() if summary is not None)
+
+    records = retriever.retrieve(targets, max_depth)
+    summaries = {key: summarize_records(key_records, limit) for key, key_records in records.items()}
+    write_summaries(G, summaries)
+    return len(summaries)
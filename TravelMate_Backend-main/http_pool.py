@@ -0,0 +1,77 @@
+# Shared pooled HTTP session and bounded concurrent fan-out for outbound API calls
+
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Iterable, List, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Per-call (connect, read) timeout in seconds for Maps and Wikipedia requests.
+HTTP_TIMEOUT = (float(os.getenv("HTTP_CONNECT_TIMEOUT", 5)), float(os.getenv("HTTP_READ_TIMEOUT", 20)))
+# Gemini completions take much longer to produce than a page lookup.
+GEMINI_TIMEOUT = (float(os.getenv("HTTP_CONNECT_TIMEOUT", 5)), float(os.getenv("GEMINI_READ_TIMEOUT", 120)))
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the process-wide requests.Session, so outbound calls reuse keep-alive connections.
+
+    The connection pool per host is sized by HTTP_POOL_SIZE (default 20), which should be at
+    least the largest fan-out concurrency.
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            pool_size = int(os.getenv("HTTP_POOL_SIZE", 20))
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+
+def fan_out(func: Callable, items: Iterable, max_workers: int = 8, deadline: float = None) -> List[Tuple[bool, object]]:
+    """
+    Calls `func(item)` for every item with bounded concurrency, tolerating partial failure.
+
+    Args:
+        func (callable): Function applied to each item.
+        items (iterable): Inputs, one call each.
+        max_workers (int): Maximum number of calls in flight.
+        deadline (float): Optional overall wall-clock budget in seconds. Calls still running
+                          when it expires are reported as failed with a TimeoutError.
+
+    Returns:
+        list: One (ok, value) pair per item, in input order. `value` is the result when `ok`
+              is True and the raised exception otherwise.
+    """
+    items = list(items)
+    if not items:
+        return []
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))))
+    try:
+        # Workers run in a copy of the caller's context, so they keep its trace id and outbound priority
+        futures = [executor.submit(contextvars.copy_context().run, func, item) for item in items]
+        wait(futures, timeout=deadline)
+        results = []
+        for future in futures:
+            if not future.done():
+                future.cancel()
+                results.append((False, TimeoutError(f"Call did not finish within {deadline}s")))
+            elif future.exception() is not None:
+                results.append((False, future.exception()))
+            else:
+                results.append((True, future.result()))
+        return results
+    finally:
+        # Do not block the caller on stragglers that already missed the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
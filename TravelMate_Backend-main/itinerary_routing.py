@@ -0,0 +1,273 @@
+# Itinerary routing: visiting order, travel times and day split for places with Maps geometry
+
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Typical visit length in minutes by Google Maps place type; the first matching type wins
+VISIT_MINUTES = {
+    "amusement_park": 240, "zoo": 180, "aquarium": 150, "museum": 120, "art_gallery": 90,
+    "shopping_mall": 120, "park": 90, "natural_feature": 120, "tourist_attraction": 90,
+    "church": 45, "hindu_temple": 60, "mosque": 45, "place_of_worship": 45,
+}
+
+
+def haversine_matrix(lats, lngs) -> np.ndarray:
+    """Great-circle distances in km between every pair of points, as one broadcast operation."""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lng = np.radians(np.asarray(lngs, dtype=np.float64))
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def path_length(order: List[int], D: np.ndarray) -> float:
+    return float(D[order[:-1], order[1:]].sum()) if len(order) > 1 else 0.0
+
+
+def nearest_neighbor_order(D: np.ndarray, start: int = 0) -> List[int]:
+    """Greedy open path: always walk to the closest unvisited place."""
+    n = len(D)
+    visited = np.zeros(n, dtype=bool)
+    order = [start]
+    visited[start] = True
+    for _ in range(n - 1):
+        distances = np.where(visited, np.inf, D[order[-1]])
+        nxt = int(np.argmin(distances))
+        order.append(nxt)
+        visited[nxt] = True
+    return order
+
+
+def two_opt(order: List[int], D: np.ndarray, max_passes: int = 50) -> List[int]:
+    """
+    Improves an open path by reversing segments while that shortens it.
+
+    For each segment start i, the gain of every segment end j is computed at once with NumPy,
+    and the best improving reversal is applied.
+    """
+    route = np.asarray(order)
+    n = len(route)
+    if n < 4:
+        return list(route)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(n - 1):
+            j = np.arange(i + 1, n)
+            a, b = route[i], route[j]
+            # Edge into the segment (prev -> a) and out of it (b -> next); open ends cost nothing
+            before = D[route[i - 1], a] if i > 0 else 0.0
+            after_old = np.where(j < n - 1, D[b, route[np.minimum(j + 1, n - 1)]], 0.0)
+            after_new = np.where(j < n - 1, D[a, route[np.minimum(j + 1, n - 1)]], 0.0)
+            into_new = D[route[i - 1], b] if i > 0 else np.zeros(len(j))
+            delta = into_new + after_new - before - after_old
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                route[i:j[best] + 1] = route[i:j[best] + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return list(route)
+
+
+def exact_order(D: np.ndarray) -> List[int]:
+    """
+    Shortest open path through every place (Held-Karp), for small inputs only: O(2^n * n^2).
+
+    best[mask, j] is the length of the shortest path visiting the places in `mask` and ending
+    at j; each mask is extended to every place outside it with one broadcast minimum.
+    """
+    n = len(D)
+    full = (1 << n) - 1
+    best = np.full((1 << n, n), np.inf)
+    parent = np.full((1 << n, n), -1, dtype=np.int64)
+    best[1 << np.arange(n), np.arange(n)] = 0.0
+    for mask in range(1, full):
+        costs = best[mask][:, None] + D
+        previous = np.argmin(costs, axis=0)
+        for k in range(n):
+            if mask >> k & 1:
+                continue
+            extended = mask | 1 << k
+            if costs[previous[k], k] < best[extended, k]:
+                best[extended, k] = costs[previous[k], k]
+                parent[extended, k] = previous[k]
+    order = [int(np.argmin(best[full]))]
+    mask = full
+    while parent[mask, order[-1]] >= 0:
+        mask, order = mask ^ 1 << order[-1], order + [int(parent[mask, order[-1]])]
+    return order[::-1]
+
+
+def order_places(D: np.ndarray) -> List[int]:
+    """
+    Shortest visiting order of the places.
+
+    Up to ITINERARY_EXACT_MAX_PLACES (default 8) places the optimum is computed exactly. Larger
+    inputs take the nearest-neighbour path from the place farthest from the others, refined with
+    2-opt, or the given order refined with 2-opt if that is shorter, so the result is never
+    longer than the input order.
+    """
+    if len(D) <= int(os.getenv("ITINERARY_EXACT_MAX_PLACES", 8)):
+        return exact_order(D) if len(D) else []
+    start = int(np.argmax(D.sum(axis=1)))
+    candidates = [two_opt(nearest_neighbor_order(D, start), D), two_opt(list(range(len(D))), D)]
+    return min(candidates, key=lambda order: path_length(order, D))
+
+
+def place_location(place: dict):
+    location = (place.get("geometry") or {}).get("location") or {}
+    if location.get("lat") is None or location.get("lng") is None:
+        return None
+    return float(location["lat"]), float(location["lng"])
+
+
+def visit_minutes(place: dict, default: int) -> int:
+    for place_type in place.get("types") or []:
+        if place_type in VISIT_MINUTES:
+            return VISIT_MINUTES[place_type]
+    return default
+
+
+def trip_days(departure, return_date) -> Optional[List[date]]:
+    """The dates of the trip, both ends included, or None if either date does not parse."""
+    try:
+        start = date.fromisoformat(str(departure)[:10])
+        end = date.fromisoformat(str(return_date)[:10])
+    except ValueError:
+        return None
+    return [start + timedelta(days=i) for i in range(max(0, (end - start).days) + 1)]
+
+
+class Leg:
+    """Travel time and mode between two places, from a straight-line distance."""
+
+    def __init__(self, walking_max_km: float, walking_kmh: float, driving_kmh: float, detour: float):
+        self.walking_max_km = walking_max_km
+        self.walking_kmh = walking_kmh
+        self.driving_kmh = driving_kmh
+        self.detour = detour
+
+    def __call__(self, distance_km: float):
+        road_km = distance_km * self.detour
+        if road_km <= self.walking_max_km:
+            return "Walking", road_km / self.walking_kmh * 60
+        # Driving legs include a few minutes to find a taxi and park
+        return "Taxi", road_km / self.driving_kmh * 60 + 10
+
+
+def plan_route(places: List[dict], departure=None, return_date=None, day_minutes: int = None,
+               day_start: str = None) -> Dict:
+    """
+    Orders the places into a route and splits it into days.
+
+    The whole route is ordered once (order_places over a haversine matrix), then cut
+    into consecutive days of at most `day_minutes` of visits and travel, so each day covers a
+    compact stretch of the route. Places that do not fit in the trip are returned as unscheduled.
+
+    Args:
+        places (list): Google Maps places (name, place_id, types, geometry.location)
+        departure, return_date: Trip dates (ISO strings or datetimes); without them the route
+            takes as many days as it needs
+        day_minutes (int): Time budget per day (default ITINERARY_DAY_MINUTES=540)
+        day_start (str): Start of each day as HH:MM (default ITINERARY_DAY_START="09:00")
+
+    Returns:
+        dict: {"days": [{"day", "date", "stops": [...], "minutes"}], "unscheduled": [names],
+               "distance_km": total, "unlocated": [names without geometry]}
+    """
+    day_minutes = day_minutes or int(os.getenv("ITINERARY_DAY_MINUTES", 540))
+    day_start = datetime.strptime(day_start or os.getenv("ITINERARY_DAY_START", "09:00"), "%H:%M")
+    default_visit = int(os.getenv("ITINERARY_VISIT_MINUTES", 90))
+    leg = Leg(float(os.getenv("ITINERARY_WALKING_MAX_KM", 1.5)), float(os.getenv("ITINERARY_WALKING_KMH", 4.5)),
+              float(os.getenv("ITINERARY_DRIVING_KMH", 25)), float(os.getenv("ITINERARY_DETOUR_FACTOR", 1.3)))
+
+    located = [(place, place_location(place)) for place in places]
+    unlocated = [place["name"] for place, location in located if location is None]
+    located = [(place, location) for place, location in located if location is not None]
+    D = haversine_matrix([lat for _, (lat, _) in located], [lng for _, (_, lng) in located])
+    order = order_places(D)
+
+    dates = trip_days(departure, return_date)
+    days = []
+    unscheduled = []
+    current = None
+    previous = None
+    for index in order:
+        place, _ = located[index]
+        visit = visit_minutes(place, default_visit)
+        mode, travel = leg(D[previous, index]) if previous is not None else (None, 0.0)
+        if current is None or current["minutes"] + travel + visit > day_minutes:
+            if dates is not None and len(days) >= len(dates):
+                unscheduled.append(place["name"])
+                continue
+            # A new day starts at the place itself
+            current = {"day": len(days) + 1, "date": dates[len(days)].isoformat() if dates else None,
+                       "stops": [], "minutes": 0.0}
+            days.append(current)
+            mode, travel = None, 0.0
+        arrival = day_start + timedelta(minutes=current["minutes"] + travel)
+        departure_time = arrival + timedelta(minutes=visit)
+        current["stops"].append({
+            "place_id": place.get("place_id"),
+            "name": place["name"],
+            "arrival": arrival.strftime("%I:%M %p").lstrip("0"),
+            "departure": departure_time.strftime("%I:%M %p").lstrip("0"),
+            "visit_minutes": visit,
+            "travel_minutes": round(travel),
+            "distance_km": round(float(D[previous, index]), 2) if mode else 0.0,
+            "transport": mode,
+        })
+        current["minutes"] += travel + visit
+        previous = index
+
+    for day in days:
+        day["minutes"] = round(day["minutes"])
+    return {
+        "days": days,
+        "unscheduled": unscheduled,
+        "unlocated": unlocated,
+        "distance_km": round(path_length(order, D), 2),
+    }
+
+
+def format_route(route: Dict) -> str:
+    """The route as prompt text: one line per stop, grouped by day."""
+    lines = []
+    for day in route["days"]:
+        lines.append(f"Day {day['day']}" + (f" ({day['date']})" if day["date"] else "") + ":")
+        for stop in day["stops"]:
+            travel = (f", {stop['travel_minutes']} min by {stop['transport']} ({stop['distance_km']} km) from the previous stop"
+                      if stop["transport"] else "")
+            lines.append(f"  {stop['arrival']} to {stop['departure']}: {stop['name']}{travel}")
+    if route["unscheduled"]:
+        lines.append(f"Did not fit in the trip: {', '.join(route['unscheduled'])}")
+    return "\n".join(lines)
+
+
+def route_events(route: Dict) -> List[dict]:
+    """The route as event planner events, without any LLM-written details."""
+    events = []
+    for day in route["days"]:
+        for stop in day["stops"]:
+            hours = stop["visit_minutes"] / 60
+            events.append({
+                "place_id": len(events),
+                "name": stop["name"],
+                "details": f"Day {day['day']}" + (f" ({day['date']})" if day["date"] else "") + f": visit {stop['name']}.",
+                "timing": f"{stop['arrival']} to {stop['departure']}",
+                "Famous Activity": "Sightseeing",
+                "total_duration": f"{hours:g} hours" if hours != 1 else "1 hour",
+                "recommended_transport": stop["transport"] or "Start of the day",
+                "additional_notes": (f"{stop['travel_minutes']} min ({stop['distance_km']} km) from the previous stop."
+                                     if stop["transport"] else "First stop of the day."),
+                "day": day["day"],
+                "date": day["date"],
+                "maps_place_id": stop["place_id"],
+            })
+    return events
@@ -0,0 +1,100 @@
+# Incremental parsing of a streamed JSON array of objects (e.g. the event planner's itinerary)
+
+import json
+from typing import Iterable, Iterator, List, Optional
+
+from metrics import log
+
+
+class JsonArrayStream:
+    """
+    Feeds text chunks in, gets each top-level object of the first JSON array out as soon as its
+    closing brace arrives.
+
+    Text before the array (a ```json fence, a sentence of preamble) is skipped. Strings are
+    tracked with their escapes, so braces and brackets inside values do not confuse the depth
+    count. An object that fails to parse is reported in `errors` and skipped. Once the input
+    ends, close() raises unless a whole array was read.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.errors: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._item: List[str] = []
+
+    def feed(self, chunk: str) -> List[dict]:
+        items = []
+        for char in chunk:
+            if self.finished:
+                break
+            if not self.started:
+                if char == "[":
+                    self.started = True
+                continue
+
+            if self._depth > 0:
+                self._item.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0:
+                    self._item = [char]
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # The closing bracket of the array itself
+                    self.finished = True
+                    continue
+                self._depth -= 1
+                if self._depth == 0:
+                    text = "".join(self._item)
+                    try:
+                        items.append(json.loads(text))
+                    except json.JSONDecodeError as e:
+                        self.errors.append(f"{e}: {text[:200]}")
+        return items
+
+    @property
+    def complete(self) -> bool:
+        """True if the whole array was read and every item in it parsed."""
+        return self.started and self.finished and not self.errors
+
+    def close(self):
+        """Raises ValueError if the input ended before the array was opened or closed."""
+        if not self.started:
+            raise ValueError("Response does not contain a JSON array")
+        if not self.finished:
+            raise ValueError("Response ended before the end of the JSON array (truncated output or dropped connection)")
+
+
+def iter_json_array_items(chunks: Iterable[str], parser: Optional[JsonArrayStream] = None) -> Iterator[dict]:
+    """
+    Yields the objects of a streamed JSON array as they complete.
+
+    Raises ValueError once the chunks run out if the array was never opened or never closed.
+    Pass a `parser` to check afterwards whether items were skipped (parser.complete).
+    """
+    parser = parser or JsonArrayStream()
+    reported = 0
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+        for error in parser.errors[reported:]:
+            log.warning(f"Skipped malformed item in streamed JSON array: {error}")
+        reported = len(parser.errors)
+        if parser.finished:
+            return
+    parser.close()
@@ -3,20 +3,21 @@
 import networkx as nx
 import nx_arangodb as nxadb
 
-from arango import ArangoClient
-
 import pandas as pd
 import numpy as np
 import requests
 import urllib.parse
 import networkx as nx
-import matplotlib.pyplot as plt
 from random import randint
 import re
 import os
 import io
 from dotenv import load_dotenv
 import json
+import hashlib
+import logging
+import threading
+import time
 from typing import List, Dict, Any, Optional
 
 from langgraph.prebuilt import create_react_agent
@@ -26,81 +27,270 @@ from langchain_community.graphs import ArangoGraph
 from langchain_community.chains.graph_qa.arangodb import ArangoGraphQAChain
 from langchain_core.tools import tool
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+
+from graph_retrieval import get_retriever, format_path_sentence
+from arango_pool import get_graph_manager
+from api_cache import cached, get_response_cache, make_key
+from http_pool import get_session, fan_out, HTTP_TIMEOUT, GEMINI_TIMEOUT
+from build_jobs import get_build_queue
+from graph_ingest import sanitize_key, sanitize_keys, assign_source_places, bulk_ingest, retire_edges
+from prompt_cache import get_prompt_cache, budget_bracket, date_bucket, normalize_text
+from city_registry import get_city_registry
+from graph_snapshot import get_snapshot_cache
+from tsv_stream import KNOWLEDGE_COLUMNS, iter_tsv_records, iter_batches, iter_sse_texts
+from singleflight import coalesced, get_single_flight
+from json_stream import JsonArrayStream, iter_json_array_items
+from graph_summaries import materialize_summaries, load_summaries, summary_records
+from prompt_context import build_context, estimate_tokens
+from node_index import get_node_index
+from itinerary_routing import plan_route, format_route, route_events
+from graph_layout import export_graph, get_layout_cache, page
+from outbound import background, get_scheduler
+from metrics import configure_logging, get_metrics, inc, log, new_trace_id, span
 # Load environment variables from .env file
 load_dotenv()
+configure_logging()
 
 # ----------------------------------------------------------------WIKIPEDIA API----------------------------------------------------------------------
 
-def get_wikipedia_info(name):
-    # Step 1: Construct the API URL
-    search_title = "https://en.wikipedia.org/w/api.php?action=query&list=search&srsearch=" + \
-        urllib.parse.quote(name) + \
-        "&format=json&origin=*"
-    search_title_response = requests.get(search_title)
-    if search_title_response.status_code != 200:
-        raise Exception(
-            f"Failed to fetch search results. Received: {search_title_response.status_code} {search_title_response.reason}"
-        )
-    
-    search_title_data = search_title_response.json()
-    if len(search_title_data["query"]["search"]) == 0:
-        return "No information found on Wikipedia"
-    
-    title = search_title_data["query"]["search"][0]["title"]
+# Cache keys stay those of the former one-page-at-a-time fetch, so existing entries are still served
+WIKIPEDIA_CACHE_SOURCE = "wikipedia"
 
-    search_url = "https://en.wikipedia.org/w/api.php?action=query&format=json&prop=extracts&titles=" + \
-        urllib.parse.quote(title) + \
-        "&explaintext=1&origin=*"
-    
-    search_response = requests.get(search_url)
-    if search_response.status_code != 200:
+WIKIPEDIA_API_URL = "https://en.wikipedia.org/w/api.php"
+WIKI_TITLES_PER_REQUEST = 50    # MediaWiki limit for titles=A|B|... on anonymous requests
+WIKI_EXTRACTS_PER_REQUEST = 20  # TextExtracts limit (exlimit), and only for intro extracts
+
+
+def query_wikipedia(params):
+    """Runs one MediaWiki `action=query` request and returns its parsed JSON."""
+    params = dict(params, action="query", format="json", formatversion=2, origin="*")
+    inc("travelmate_outbound_requests_total", service="wikipedia")
+    response = get_scheduler().send("wikipedia", lambda: get_session().get(WIKIPEDIA_API_URL, params=params, timeout=HTTP_TIMEOUT))
+    if response.status_code != 200:
         raise Exception(
-            f"Failed to fetch search results. Received: {search_response.status_code} {search_response.reason}"
+            f"Failed to fetch search results. Received: {response.status_code} {response.reason}"
         )
+    return response.json()
 
-    # Parse the JSON response
-    search_data = search_response.json()
 
-    data = search_data['query']['pages']
-    page_number = list(data.keys())[0]
-    extracted_text = data[page_number]['extract']
-    return extracted_text
+def wiki_deadline(deadline=None):
+    return float(os.getenv("WIKI_BATCH_DEADLINE", 30)) if deadline is None else max(0.0, deadline)
+
+
+def resolve_wikipedia_titles(names, deadline=None):
+    """
+    Maps place names to existing Wikipedia page titles.
+
+    Names are first looked up as titles directly, 50 per request, following normalization and
+    redirects. Names that do not match a page, or only a disambiguation page (e.g. "Fort"),
+    fall back to a full-text search, run concurrently since `list=search` takes one query per
+    request. The searches give up once `deadline` seconds (default WIKI_BATCH_DEADLINE) have passed
+    since the call started.
+
+    Returns:
+        dict: {name: title} for every name that resolved to a page.
+    """
+    titles = {}
+    started = time.monotonic()
+    unique_names = list(dict.fromkeys(names))
+    for i in range(0, len(unique_names), WIKI_TITLES_PER_REQUEST):
+        chunk = unique_names[i:i + WIKI_TITLES_PER_REQUEST]
+        try:
+            data = query_wikipedia({"titles": "|".join(chunk), "redirects": 1,
+                                    "prop": "pageprops", "ppprop": "disambiguation"})
+        except Exception as e:
+            log.warning(f"Error resolving Wikipedia titles: {str(e)}")
+            continue
+        query = data.get("query", {})
+        aliases = {entry["from"]: entry["to"] for entry in query.get("normalized", [])}
+        redirects = {entry["from"]: entry["to"] for entry in query.get("redirects", [])}
+        existing = {page["title"] for page in query.get("pages", [])
+                    if not page.get("missing") and not page.get("invalid")
+                    and "disambiguation" not in page.get("pageprops", {})}
+        for name in chunk:
+            title = aliases.get(name, name)
+            title = redirects.get(title, title)
+            if title in existing:
+                titles[name] = title
+
+    def search_title(name):
+        results = query_wikipedia({"list": "search", "srsearch": name, "srlimit": 1})["query"]["search"]
+        return results[0]["title"] if results else None
+
+    unresolved = [name for name in unique_names if name not in titles]
+    searched = fan_out(search_title, unresolved, max_workers=int(os.getenv("WIKI_MAX_WORKERS", 8)),
+                       deadline=wiki_deadline(wiki_deadline(deadline) - (time.monotonic() - started)))
+    for name, (ok, title) in zip(unresolved, searched):
+        if ok and title:
+            titles[name] = title
+        elif not ok:
+            log.warning(f"Error searching Wikipedia for '{name}': {str(title)}")
+    return titles
+
+
+def fetch_wikipedia_extracts(titles, intro_only=False, deadline=None):
+    """
+    Fetches plain-text extracts for a list of page titles.
+
+    Intro extracts are pulled 20 titles per request. The API returns at most one full-article
+    extract per request, so full extracts are fetched one title per request, concurrently,
+    giving up after `deadline` seconds (default WIKI_BATCH_DEADLINE).
+
+    Returns:
+        dict: {title: extract} for every title that returned text.
+    """
+    titles = list(dict.fromkeys(titles))
+    per_request = WIKI_EXTRACTS_PER_REQUEST if intro_only else 1
+    chunks = [titles[i:i + per_request] for i in range(0, len(titles), per_request)]
+
+    def fetch_chunk(chunk):
+        params = {"prop": "extracts", "explaintext": 1, "exlimit": len(chunk), "titles": "|".join(chunk)}
+        if intro_only:
+            params["exintro"] = 1
+        extracts = {}
+        while True:
+            data = query_wikipedia(params)
+            for page in data.get("query", {}).get("pages", []):
+                if page.get("extract"):
+                    extracts[page["title"]] = page["extract"]
+            if "continue" not in data:
+                return extracts
+            params.update(data["continue"])
+
+    extracts = {}
+    fetched = fan_out(fetch_chunk, chunks, max_workers=int(os.getenv("WIKI_MAX_WORKERS", 8)),
+                      deadline=wiki_deadline(deadline))
+    for chunk, (ok, result) in zip(chunks, fetched):
+        if ok:
+            extracts.update(result)
+        else:
+            log.warning(f"Error fetching Wikipedia extracts for {chunk}: {str(result)}")
+    return extracts
+
+
+def truncate_extract(text, max_chars):
+    """Truncates an extract to at most `max_chars`, preferring to cut at a sentence boundary."""
+    if not max_chars or len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    boundary = cut.rfind(". ")
+    if boundary >= max_chars // 2:
+        return cut[:boundary + 1]
+    return cut
+
+
+def get_wikipedia_info_batch(names, max_chars=None, intro_only=False, refresh=False):
+    """
+    Fetches the Wikipedia extracts of place names in bulk, through the response cache.
+
+    Args:
+        names (list): Place names, e.g. from get_maps_places.
+        max_chars (int): Optional limit on the length of each returned extract.
+        intro_only (bool): Only fetch the lead section, which allows 20 extracts per request.
+        refresh (bool): Fetch every extract, bypassing the response cache, and store the fresh
+            ones. Names that cannot be fetched fall back to their cached extract.
+
+    Returns:
+        dict: {name: extract} for every name; names without a page map to
+              "No information found on Wikipedia".
+    """
+    cache = get_response_cache()
+    source = WIKIPEDIA_CACHE_SOURCE
+
+    def cache_key(name):
+        return make_key("get_wikipedia_intro" if intro_only else "get_wikipedia_info", name=name)
+
+    extracts = {}
+    cached_extracts = {}
+    for name in dict.fromkeys(names):
+        hit, value = cache.get(source, cache_key(name))
+        if hit:
+            cached_extracts[name] = value
+    if not refresh:
+        extracts.update(cached_extracts)
+
+    missing = [name for name in dict.fromkeys(names) if name not in extracts]
+    if missing:
+        with span("wikipedia_fetch", names=len(missing), cached=len(extracts)):
+            # One WIKI_BATCH_DEADLINE covers title resolution and extract fetches together
+            deadline = wiki_deadline()
+            start = time.monotonic()
+            titles = resolve_wikipedia_titles(missing, deadline)
+            pages = fetch_wikipedia_extracts(titles.values(), intro_only, deadline - (time.monotonic() - start))
+        for name in missing:
+            text = pages.get(titles.get(name))
+            if text is None:
+                extracts[name] = cached_extracts.get(name, "No information found on Wikipedia")
+                continue
+            extracts[name] = text
+            cache.set(source, cache_key(name), text)
+
+    return {name: truncate_extract(extracts[name], max_chars) for name in names}
 
 # ----------------------------------------------------------------MAPS API----------------------------------------------------------------------
 
-def get_maps_places(location, search_text="Most Popular places in "):
+MAPS_API_BASE = os.getenv("MAPS_API_BASE", "https://maps.googleapis.com/maps/api")
+
+def maps_search_url(location, search_text="Most Popular places in "):
     api_key = os.getenv("GEMINI_API_KEY")
     # Step 1: Construct the API URL for Google Maps Places API
     search_query = search_text + location
-    search_url = "https://maps.googleapis.com/maps/api/place/textsearch/json?query=" + \
+    return f"{MAPS_API_BASE}/place/textsearch/json?query=" + \
         urllib.parse.quote(search_query) + \
         f"&radius=20000&key={api_key}"  # Replace with your actual API key
+
+# Places API errors (OVER_QUERY_LIMIT, REQUEST_DENIED, INVALID_REQUEST) come back as HTTP 200
+# with no results and the reason in the body's "status"
+MAPS_OK_STATUSES = ("OK", "ZERO_RESULTS")
+
+def maps_results(search_data):
+    """Returns the results of a Places text search response, raising if the API reported an error."""
+    status = search_data.get("status")
+    if status not in MAPS_OK_STATUSES:
+        raise Exception(
+            f"Failed to fetch search results. Received: {status} {search_data.get('error_message', '')}".rstrip()
+        )
+    return search_data["results"]
+
+@cached("maps")
+@coalesced("maps")
+def get_maps_places(location, search_text="Most Popular places in "):
+    search_url = maps_search_url(location, search_text)
     
-    search_response = requests.get(search_url)
+    inc("travelmate_outbound_requests_total", service="maps")
+    with span("maps_fetch", location=location):
+        search_response = get_scheduler().send("maps", lambda: get_session().get(search_url, timeout=HTTP_TIMEOUT))
     if search_response.status_code != 200:
         raise Exception(
             f"Failed to fetch search results. Received: {search_response.status_code} {search_response.reason}"
         )
 
     # Parse the JSON response
-    search_data = search_response.json()
-    return search_data["results"]
+    return maps_results(search_response.json())
 
 
 # -------------------------------------------------Wiki details of Maps recommended places Function-------------------------------------------------------
 
+@coalesced("wikipedia")
 def get_wiki_desc_for_places(destination_location, sz = 2):
     places = get_maps_places(destination_location, "Most Popular places in ")
-    place_descriptors = []
-    
-    for i in range(min(sz, len(places))):
-        description = get_wikipedia_info(places[i]["name"])
+    names = [place["name"] for place in places[:sz]]
+
+    # Resolve all titles and extracts in as few bulk requests as the API allows.
+    # WIKI_EXTRACT_MAX_CHARS keeps the Gemini extraction prompt small (0 disables truncation).
+    descriptions = get_wikipedia_info_batch(
+        names,
+        max_chars=int(os.getenv("WIKI_EXTRACT_MAX_CHARS", 0)),
+        intro_only=os.getenv("WIKI_INTRO_ONLY", "0") == "1",
+    )
 
+    place_descriptors = []
+    for name in names:
         place_descriptor = {
-            "place": places[i]["name"],
-            "description": description,
+            "place": name,
+            "description": descriptions[name],
             "destination": destination_location
         }
         place_descriptors.append(place_descriptor)
@@ -108,25 +298,11 @@ def get_wiki_desc_for_places(destination_location, sz = 2):
     return place_descriptors
 
 # ----------------------------------------------------------------GEMINI API----------------------------------------------------------------------
-def call_gemini_api(prompt):
-    """
-    Call the Gemini API with the given prompt.
-    """
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("No Gemini API key provided. Set the GEMINI_API_KEY environment variable")
-    
-    url = "https://generativelanguage.googleapis.com/v1/models/gemini-1.5-pro:generateContent"
-    
-    headers = {
-        "Content-Type": "application/json",
-    }
-    
-    params = {
-        "key": api_key
-    }
-    
-    data = {
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1")
+GEMINI_MODEL = "gemini-1.5-pro"
+
+def gemini_request_body(prompt):
+    return {
         "contents": [
             {
                 "parts": [
@@ -143,14 +319,8 @@ def call_gemini_api(prompt):
             "maxOutputTokens": 8192
         }
     }
-    
-    response = requests.post(url, headers=headers, params=params, json=data)
-    
-    if response.status_code != 200:
-        raise Exception(f"Failed to call Gemini API. Received: {response.status_code} {response.reason} - {response.text}")
-    
-    response_json = response.json()
-    
+
+def gemini_response_text(response_json):
     # Extract the text from the response
     if "candidates" in response_json and len(response_json["candidates"]) > 0:
         if "content" in response_json["candidates"][0] and "parts" in response_json["candidates"][0]["content"]:
@@ -158,17 +328,99 @@ def call_gemini_api(prompt):
     
     return "No response generated."
 
+def count_prompt(prompt):
+    """Counts one outbound Gemini call and the size of its prompt."""
+    inc("travelmate_outbound_requests_total", service="gemini")
+    inc("travelmate_prompt_tokens_total", estimate_tokens(prompt))
+    inc("travelmate_prompt_bytes_total", len(prompt.encode("utf-8")))
+
+@cached("gemini", case_sensitive=True, cache_if=lambda text: text != "No response generated.")
+@coalesced("gemini", case_sensitive=True)
+def call_gemini_api(prompt):
+    """
+    Call the Gemini API with the given prompt.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("No Gemini API key provided. Set the GEMINI_API_KEY environment variable")
+    
+    url = f"{GEMINI_API_BASE}/models/{GEMINI_MODEL}:generateContent"
+    
+    headers = {
+        "Content-Type": "application/json",
+    }
+    
+    params = {
+        "key": api_key
+    }
+    
+    data = gemini_request_body(prompt)
+    count_prompt(prompt)
+    
+    response = get_scheduler().send(
+        "gemini", lambda: get_session().post(url, headers=headers, params=params, json=data, timeout=GEMINI_TIMEOUT))
+    
+    if response.status_code != 200:
+        raise Exception(f"Failed to call Gemini API. Received: {response.status_code} {response.reason} - {response.text}")
+    
+    return gemini_response_text(response.json())
+
+def stream_gemini_api(prompt):
+    """
+    Call the Gemini API with streamGenerateContent and yield the generated text as it arrives.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("No Gemini API key provided. Set the GEMINI_API_KEY environment variable")
+
+    url = f"{GEMINI_API_BASE}/models/{GEMINI_MODEL}:streamGenerateContent"
+    params = {
+        "key": api_key,
+        "alt": "sse"
+    }
+
+    count_prompt(prompt)
+    # The scheduler holds the Gemini concurrency slot until the stream is fully read
+    with get_scheduler().request("gemini", lambda: get_session().post(
+            url, headers={"Content-Type": "application/json"}, params=params,
+            json=gemini_request_body(prompt), timeout=GEMINI_TIMEOUT, stream=True)) as response:
+        if response.status_code != 200:
+            raise Exception(f"Failed to call Gemini API. Received: {response.status_code} {response.reason} - {response.text}")
+        yield from iter_sse_texts(response.iter_lines(decode_unicode=True))
+
 # ----------------------------------------------------------------Knowledge Extraction with Gemini----------------------------------------------------------------------
-def extract_knowledge_from_gemini(destination):
+def extract_knowledge_from_gemini(destination, place_descriptors=None):
     """
     Extract structured knowledge about a destination using Gemini API.
     Returns a list of dictionaries with relationship triples.
+
+    `place_descriptors` restricts the extraction to the given places (as returned by
+    get_wiki_desc_for_places); by default the destination's most popular places are described.
     """
     # First, get descriptive information about the places
-    place_descriptors = get_wiki_desc_for_places(destination)
+    if place_descriptors is None:
+        place_descriptors = get_wiki_desc_for_places(destination)
     
     # Now ask Gemini to structure this into a TSV format
-    extraction_prompt = f"""Based on the following information about tourist attractions in {destination}, extract a highly detailed knowledge graph in TSV format that captures diverse relationships between attractions, their history, significance, and travel-related insights.
+    extraction_prompt = build_extraction_prompt(destination, place_descriptors)
+
+    with span("gemini_extraction", destination=destination):
+        tsv_content = call_gemini_api(extraction_prompt)
+    
+    # Clean up the response to ensure it's just TSV content
+    if "```" in tsv_content:
+        # Extract content between triple backticks if present
+        tsv_content = tsv_content.split("```")[1].strip()
+        if tsv_content.startswith("tsv"):
+            tsv_content = tsv_content[3:].strip()
+    
+    return tsv_content
+
+def build_extraction_prompt(destination, place_descriptors):
+    """
+    Builds the prompt asking Gemini for a TSV knowledge graph of the described places.
+    """
+    return f"""Based on the following information about tourist attractions in {destination}, extract a highly detailed knowledge graph in TSV format that captures diverse relationships between attractions, their history, significance, and travel-related insights.
     {place_descriptors}
 
     Format:
@@ -200,32 +452,29 @@ def extract_knowledge_from_gemini(destination):
     Just return the TSV content without markdown formatting or extra text.
     The first line should be the header row."""
 
-    tsv_content = call_gemini_api(extraction_prompt)
-    
-    # Clean up the response to ensure it's just TSV content
-    if "```" in tsv_content:
-        # Extract content between triple backticks if present
-        tsv_content = tsv_content.split("```")[1].strip()
-        if tsv_content.startswith("tsv"):
-            tsv_content = tsv_content[3:].strip()
-    
-    return tsv_content
-
 # ----------------------------------------------------------------Knowledge Pandas Dataframe----------------------------------------------------------------------
 
-def create_travel_knowledge_dataframe(destination_location: str) -> pd.DataFrame:
+def create_travel_knowledge_dataframe(destination_location: str, place_descriptors=None) -> pd.DataFrame:
     """
     Create a DataFrame containing travel knowledge about places in the specified destination
     using the Gemini API.
     """
-    print(f"Creating travel knowledge graph for {destination_location}...")
+    log.info(f"Creating travel knowledge graph for {destination_location}...")
     
     # Get TSV content from Gemini
-    tsv_content = extract_knowledge_from_gemini(destination_location)
+    tsv_content = extract_knowledge_from_gemini(destination_location, place_descriptors)
     
     # Convert TSV string to DataFrame
-    df = pd.read_csv(io.StringIO(tsv_content), sep='\t')
+    with span("tsv_parse") as fields:
+        df = clean_knowledge_dataframe(pd.read_csv(io.StringIO(tsv_content), sep='\t'))
+        fields["rows"] = len(df)
     
+    return df
+
+def clean_knowledge_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normalizes the Attributes column to valid JSON strings and drops duplicate triples.
+    """
     # Handle any necessary data cleaning
     if 'Attributes' in df.columns:
         # Ensure Attributes is a valid JSON string
@@ -251,71 +500,178 @@ def create_travel_knowledge_dataframe(destination_location: str) -> pd.DataFrame
     
     return df
 
-def sanitize_key(name):
-    """Converts a name into a valid _key for ArangoDB."""
-    name = name.lower().strip()  # Ensure consistent casing and remove trailing spaces
-    name = re.sub(r'[^a-z0-9_-]', '_', name)  # Replace invalid characters
-    return name
-
 # ----------------------------------------------------------------Knowledge Graph from Dataframe----------------------------------------------------------------------
 
-def generate_knowledge_graph(G, destination):
+# Concurrent builds of the same city, streaming or not, share one extraction and ingestion
+def knowledge_graph_key(G, destination, *args, **kwargs):
+    return sanitize_key(destination)
+
+def place_keys(place_descriptors):
+    """Node keys of the places an extraction was asked about, which its edges are attributed to."""
+    return [sanitize_key(descriptor["place"].replace('"', '')) for descriptor in place_descriptors]
+
+@coalesced("knowledge_graph", key=knowledge_graph_key)
+def generate_knowledge_graph(G, destination, report=None):
     # Debug statement: Print the number of nodes and edges in the input graph
-    print(f"\nInput graph before modification: {G.number_of_nodes()} nodes and {G.number_of_edges()} edges")
+    log.info(f"Input graph before modification: {G.number_of_nodes()} nodes and {G.number_of_edges()} edges")
     
     # destination = "Varanasi"  # Change this to any destination you want
-    df = create_travel_knowledge_dataframe(destination)
+    place_descriptors = get_wiki_desc_for_places(destination)
+    df = create_travel_knowledge_dataframe(destination, place_descriptors)
+    df, _ = assign_source_places(df, place_keys(place_descriptors))
     
     # Display the first few rows of the DataFrame
-    print("\nSample of the knowledge graph data:")
-    print(df.head(2).to_string())
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Sample of the knowledge graph data:\n" + df.head(2).to_string())
     
-    # Track how many new elements we're adding
-    nodes_added = 0
-    edges_added = 0
+    # Dedupe nodes and edges column-wise, then insert only the new ones in bulk
+    result = ingest_frame(G, df)
+    nodes_added = len(result.nodes)
+    edges_added = len(result.edges)
+    summaries = materialize_place_summaries(G, [df], [result])
+    index_city_nodes(destination, [df])
+    if report is not None:
+        report.update(nodes_added=nodes_added, edges_added=edges_added, results=[result], summaries=summaries)
     
-    for _, row in df.iterrows():
-        # Sanitize keys for ArangoDB
-        node1_key = sanitize_key(row['Node_1'])
-        node2_key = sanitize_key(row['Node_2'])
+    log.info(f"Added {nodes_added} new nodes and {edges_added} new edges")
+    log.info(f"Output graph after modification: {G.number_of_nodes()} nodes and {G.number_of_edges()} edges")
+    
+    return G
 
-        # Check if nodes already exist before adding them
-        if not G.has_node(node1_key):
-            G.add_node(node1_key, key=node1_key, name=row['Node_1'], type=row['Node_1_Type'])
-            nodes_added += 1
-        
-        if not G.has_node(node2_key):
-            G.add_node(node2_key, key=node2_key, name=row['Node_2'], type=row['Node_2_Type'])
-            nodes_added += 1
+@coalesced("knowledge_graph", key=knowledge_graph_key)
+def generate_knowledge_graph_streaming(G, destination, batch_rows=None, report=None):
+    """
+    Streaming variant of generate_knowledge_graph.
+
+    The Gemini extraction is streamed and every `batch_rows` complete TSV rows (default
+    KG_STREAM_BATCH_ROWS=25) are ingested as soon as they arrive, so the first nodes land in
+    the graph long before the completion ends. If `report` is a dict, the number of added
+    nodes and edges and the per-batch IngestResults are stored in it.
+    """
+    batch_rows = batch_rows or int(os.getenv("KG_STREAM_BATCH_ROWS", 25))
+    log.info(f"Input graph before modification: {G.number_of_nodes()} nodes and {G.number_of_edges()} edges")
+    log.info(f"Creating travel knowledge graph for {destination}...")
+
+    place_descriptors = get_wiki_desc_for_places(destination)
+    places = place_keys(place_descriptors)
+    records = iter_tsv_records(stream_gemini_api(build_extraction_prompt(destination, place_descriptors)))
+
+    nodes_added = 0
+    edges_added = 0
+    results = []
+    frames = []
+    seen = set()
+    source_place = None
+    # The extraction span covers the whole stream, so it contains the per-batch parse and ingest spans
+    with span("gemini_extraction", destination=destination, streaming=True):
+        for batch in iter_batches(records, batch_rows):
+            with span("tsv_parse", rows=len(batch)):
+                df = pd.DataFrame(batch).reindex(columns=KNOWLEDGE_COLUMNS)
+                df = clean_knowledge_dataframe(df.dropna(subset=['Node_1', 'Relation', 'Node_2']))
+                # Triples already ingested from an earlier micro-batch are skipped
+                triples = list(zip(df['Node_1'], df['Relation'], df['Node_2']))
+                df = df[[triple not in seen for triple in triples]]
+                seen.update(triples)
+                df, source_place = assign_source_places(df, places, source_place)
+            if df.empty:
+                continue
+            result = ingest_frame(G, df)
+            results.append(result)
+            frames.append(df)
+            nodes_added += len(result.nodes)
+            edges_added += len(result.edges)
+            log.info(f"Ingested {len(df)} rows: {len(result.nodes)} new nodes and {len(result.edges)} new edges")
+
+    summaries = materialize_place_summaries(G, frames, results)
+    index_city_nodes(destination, frames)
+    if report is not None:
+        report.update(nodes_added=nodes_added, edges_added=edges_added, results=results, summaries=summaries)
+    log.info(f"Added {nodes_added} new nodes and {edges_added} new edges")
+    log.info(f"Output graph after modification: {G.number_of_nodes()} nodes and {G.number_of_edges()} edges")
 
-        # Check if edge already exists before adding it
-        if not G.has_edge(node1_key, node2_key):
-            G.add_edge(node1_key, node2_key, relation=row['Relation'], attributes=row['Attributes'])
-            edges_added += 1
-    
-    print(f"\nAdded {nodes_added} new nodes and {edges_added} new edges")
-    print(f"Output graph after modification: {G.number_of_nodes()} nodes and {G.number_of_edges()} edges")
-    
     return G
 
-# ----------------------------------------------------------------Knowledge Graph Plot----------------------------------------------------------------------
+def ingest_frame(G, df):
+    """bulk_ingest wrapped in a graph_ingest span."""
+    with span("graph_ingest", rows=len(df)) as fields:
+        result = bulk_ingest(G, df)
+        fields.update(nodes_added=len(result.nodes), edges_added=len(result.edges))
+    return result
+
+# ----------------------------------------------------------------Relationship Summaries----------------------------------------------------------------------
+
+def materialize_place_summaries(G, frames, results, touched_keys=()):
+    """
+    Stores the ranked 1-3 hop relationship summary of every extracted attraction (Node_1) on its node,
+    and recomputes stored summaries within reach of the newly added edges.
+
+    Args:
+        G (nx.Graph): Knowledge graph the frames were ingested into
+        frames (list): Ingested knowledge DataFrames
+        results (list): IngestResults of those ingestions
+        touched_keys (iterable): Further changed nodes, e.g. endpoints of removed edges
+
+    Returns:
+        int: Number of summaries written (0 when GRAPH_SUMMARIES is "0" or on failure)
+    """
+    if os.getenv("GRAPH_SUMMARIES", "1") != "1" or not (frames or touched_keys):
+        return 0
+    attraction_keys = set()
+    for df in frames:
+        attraction_keys.update(sanitize_keys(df['Node_1']))
+    touched_keys = set(touched_keys)
+    for result in results:
+        touched_keys.update(result.edges['source'])
+        touched_keys.update(result.edges['target'])
+    try:
+        count = materialize_summaries(G, attraction_keys, touched_keys)
+    except Exception as e:
+        log.warning(f"Error materializing relationship summaries: {str(e)}")
+        return 0
+    log.info(f"Materialized {count} relationship summaries")
+    return count
 
-def plot_knowledge_graph(destination):
-    G = generate_knowledge_graph(G,destination)
-    plt.figure(figsize=(20, 15))
+def index_city_nodes(destination, frames):
+    """Adds the extracted nodes to the city's vector index used to pre-filter places."""
+    try:
+        count = get_node_index().add(sanitize_key(destination), frames)
+    except Exception as e:
+        log.warning(f"Error indexing nodes for {destination}: {str(e)}")
+        return
+    log.info(f"Indexed {count} nodes for {destination}")
 
-    # Define node positions
-    pos = nx.spring_layout(G, seed=42)
+# ----------------------------------------------------------------Knowledge Graph Export----------------------------------------------------------------------
 
-    # Draw nodes with labels
-    nx.draw(G, pos, with_labels=True, node_size=1000, node_color="lightblue", edge_color="gray")
+def city_graph_export(city_name):
+    """
+    Lays out a registered city's subgraph for the frontend, once per graph version.
 
-    # Draw edge labels (relationship types)
-    edge_labels = {(u, v): d['relation'] for u, v, d in G.edges(data=True)}
-    nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=10)
+    The subgraph holds the nodes within GRAPH_EXPORT_DEPTH hops (default 2) of the city's Google
+    Maps places and every edge between them, laid out radially around the places (see graph_layout.py).
 
-    plt.title("Knowledge Graph from LLM-Generated Table")
-    plt.show()
+    Returns:
+        dict: The columnar export from graph_layout.export_graph, or None if the city is not registered
+    """
+    city = city_registry().get(city_name)
+    if city is None:
+        return None
+    depth = int(os.getenv("GRAPH_EXPORT_DEPTH", 2))
+    cache_key = (city["key"], city["version"], depth)
+    export = get_layout_cache().get(cache_key)
+    if export is not None:
+        return export
+
+    G = get_graph_manager().graph
+    places = get_maps_places(city_name, "Most Popular places in ")
+    place_keys = list(dict.fromkeys(sanitize_key(place["name"].replace('"', '')) for place in places))
+    with span("graph_export", city=city["key"], places=len(place_keys)):
+        retriever = get_retriever(G)
+        nodes, _ = retriever.fetch_subgraph(place_keys, max_depth=depth)
+        # The BFS trees hold one path per node; the frontend needs all edges among the nodes
+        edges = retriever.fetch_induced_edges(nodes)
+        export = export_graph(nodes, edges, place_keys)
+    get_layout_cache().set(cache_key, export)
+    return export
 
 # --------------------------------------------------------Gateway to Create KG if not Exists------------------------------------------------------
 def fetch_or_create_city(city_name, existing_city_names, G):
@@ -324,11 +680,11 @@ def fetch_or_create_city(city_name, existing_city_names, G):
     """
     try:
         if city_name in existing_city_names:
-            print("City already exists in the database")
+            log.debug(f"City {city_name} already exists in the database")
             return G
         else:
             G = generate_knowledge_graph(G, city_name)
-            print("City created successfully")
+            log.info(f"City {city_name} created successfully")
             return G
     except Exception as e:
         raise Exception(f"Error executing graph operation: {str(e)}")
@@ -354,79 +710,183 @@ def add_selected_key_to_places(places_google_maps, extracted_list):
             modified_places.append(modified_place)
     return modified_places
 
+# ----------------------------------------------------------------Knowledge Graph Retriever for a City----------------------------------------------------------------------
+
+def get_city_retriever(G, city_name, place_keys):
+    """
+    Returns the retriever for a city's places: a local in-memory snapshot of the city's subgraph
+    if the city is registered (and GRAPH_SNAPSHOTS is not "0"), otherwise the live graph.
+    """
+    base = get_retriever(G)
+    city = city_registry().get(city_name)
+    if city is None or os.getenv("GRAPH_SNAPSHOTS", "1") != "1":
+        return base
+    return get_snapshot_cache().get_retriever(city["key"], city["version"], place_keys, base)
+
+def get_place_summaries(G, place_keys):
+    """
+    Looks up the materialized relationship summaries of places in one keyed lookup.
+
+    Returns:
+        tuple: ({place_key: [PathRecord]} for places with a summary,
+                keys that still need a traversal). With GRAPH_SUMMARIES="0" every key is pending.
+    """
+    if os.getenv("GRAPH_SUMMARIES", "1") != "1":
+        return {}, list(place_keys)
+    try:
+        summaries = load_summaries(G, place_keys)
+    except Exception as e:
+        log.warning(f"Error loading relationship summaries: {str(e)}")
+        return {}, list(place_keys)
+    path_records = {key: summary_records(key, summary) for key, summary in summaries.items() if summary is not None}
+    # Places absent from the graph have nothing to traverse; only nodes without a summary fall back
+    pending_keys = [key for key, summary in summaries.items() if summary is None]
+    log.info(f"Served {len(path_records)} places from stored summaries, {len(pending_keys)} need a traversal")
+    return path_records, pending_keys
+
+def score_places_by_interest(destination, description, place_keys):
+    """
+    Cosine similarity of the user's description to each place's node in the city's vector index.
+
+    Returns:
+        list: Scores aligned with place_keys (0 for places not in the index), or None if the
+              city has not been indexed or NODE_INDEX is "0"
+    """
+    if os.getenv("NODE_INDEX", "1") != "1" or not str(description).strip():
+        return None
+    try:
+        city = city_registry().get(destination)
+        index = get_node_index().get(sanitize_key(destination), city["version"] if city else None)
+    except Exception as e:
+        log.warning(f"Error loading the node index: {str(e)}")
+        return None
+    if index is None:
+        return None
+    scores = index.scores(description, place_keys)
+    return [scores[key] for key in place_keys]
+
 # ----------------------------------------------------------------Use User Input to filter places----------------------------------------------------------------------
 
-def get_top_k_places(input_data, existing_city_names, G):
+def plan_top_k_places(input_data, G, places_google_maps):
     """
-    Retrieves the top K places based on the user's input data.
+    Runs every step of the place ranking up to the Gemini call: prompt cache lookup, node index
+    pre-filtering and knowledge graph retrieval.
 
     Args:
         input_data (dict): The user's input data containing destination, budget, interests, etc.
-        existing_city_names (list): List of existing city names in the database
-        G (nx.Graph): NetworkX graph representing the knowledge graph
-    
+        G (nx.Graph): Knowledge graph, or None while the city's graph is being built
+        places_google_maps (list): Google Maps places for the destination
+
     Returns:
-        list: A list of modified places recommended for the user.
+        dict: The plan. "result" holds the ranked places if no LLM call is needed (cache hit or
+              fast mode); otherwise "prompt" is the ranking prompt to send to Gemini.
     """
-    # Check if the city exists in the database, and the Knowledge Graph has substantial knowledge about it.
-    G = fetch_or_create_city(input_data["destination"], existing_city_names, G)
-
-    # Fetch all places based on the city, country, state.
-    places_google_maps = get_maps_places(input_data["destination"], "Most Popular places in ")
     sz = len(places_google_maps)
     places_ext = []
     results_retrieved = []
 
+    place_keys = []
     for i in range(sz):
         place_name = places_google_maps[i]["name"].replace('"', '')
-        place_key = sanitize_key(place_name)  # Use sanitized key
-        print(place_key)
+        place_keys.append(sanitize_key(place_name))  # Use sanitized key
         places_ext.append(place_name)
 
-        # For nxadb graphs, use this approach
-        try:
-            # Try to get node data - this will raise an exception if the node doesn't exist
-            node_data = G.nodes[place_key]
-            print(f"Found node {place_key} in graph")
-        except (KeyError, ValueError) as e:
-            print(f"Node {place_key} not found in graph: {str(e)}")
-            results_retrieved.append(f'Node "{place_name}" was not found in the knowledge graph.')
-            continue
-        # Query the graph for relationships
-        try:
-            for path_length in range(1, 4):
+    # Near-identical requests (same destination, date and budget brackets, candidate places) reuse an earlier ranking
+    prompt_cache = get_prompt_cache()
+    cache_inputs = {
+        "destination": normalize_text(input_data["destination"]),
+        "source": normalize_text(input_data["source"]),
+        "dates": date_bucket(input_data["departureDate"], input_data["returnDate"]),
+        "budget": budget_bracket(input_data["budget"]),
+        "places": sorted(places_ext),
+        "graph_ready": G is not None,
+    }
+    plan = {"places_google_maps": places_google_maps, "places_ext": places_ext, "cache_inputs": cache_inputs,
+            "description": input_data["description"], "result": None, "prompt": None}
+    hit, cached_list = prompt_cache.get("top_places", cache_inputs, input_data["description"])
+    if hit:
+        log.info("Serving place ranking from the prompt cache")
+        plan["result"] = add_selected_key_to_places(places_google_maps, cached_list)
+        return plan
+
+    # Pre-rank places against the city's node index, so the LLM ranks fewer candidates (or none in fast mode)
+    scores = score_places_by_interest(input_data["destination"], input_data["description"], place_keys)
+    if scores is not None and any(score > 0 for score in scores):
+        order = sorted(range(len(scores)), key=lambda i: -scores[i])
+        if input_data.get("mode", os.getenv("RANKING_MODE", "llm")) == "fast":
+            top_k = int(os.getenv("FAST_TOP_K", 5))
+            extracted_list = [places_ext[i] for i in order[:top_k] if scores[i] > 0]
+            log.info(f"Fast mode: ranked {len(places_ext)} places from the node index without the LLM")
+            plan["result"] = add_selected_key_to_places(places_google_maps, extracted_list)
+            return plan
+        matched = sum(1 for score in scores if score > 0)
+        keep = min(len(order), int(os.getenv("PREFILTER_TOP_K", 10)), max(matched, int(os.getenv("PREFILTER_MIN", 5))))
+        kept = sorted(order[:keep])
+        log.info(f"Pre-filtered {len(places_ext)} places to {len(kept)} candidates using the node index")
+        places_ext = [places_ext[i] for i in kept]
+        place_keys = [place_keys[i] for i in kept]
+        plan["places_ext"] = places_ext
+
+    if G is None:
+        place_keys = []
+        path_records = None
+        results_retrieved.append(f'The knowledge graph for "{input_data["destination"]}" is still being built.')
+    else:
+        with span("graph_traversal", places=len(place_keys)) as fields:
+            path_records, pending_keys = get_place_summaries(G, place_keys)
+            fields["pending"] = len(pending_keys)
+            if pending_keys:
+                # Expand places without a stored summary in one batch: from the city's local snapshot, a single AQL traversal or a client-side multi-source BFS
+                retriever = get_city_retriever(G, input_data["destination"], pending_keys)
                 try:
-                    for node in nx.single_source_shortest_path_length(G, place_key, cutoff=path_length):
-                        if node != place_key:
-                            try:
-                                path = nx.shortest_path(G, place_key, node)
-                                
-                                relationships = []
-                                for j in range(len(path) - 1):
-                                    edge_data = G.get_edge_data(path[j], path[j+1])
-                                    if edge_data and 'relation' in edge_data:
-                                        relationships.append(edge_data['relation'])
-                                
-                                start_node_type = G.nodes.get(place_key, {}).get('type', 'unknown type')
-                                end_node_name = G.nodes.get(node, {}).get('name', 'unknown')
-                                end_node_type = G.nodes.get(node, {}).get('type', 'unknown type')
-
-                                sentence = (f'Node "{place_name}, a {start_node_type}" is connected to '
-                                            f'Node "{end_node_name}, a {end_node_type}" by the '
-                                            f'relationships: "{", ".join(relationships)}".')
-                                print(sentence)
-                                results_retrieved.append(sentence)
-                            except nx.NetworkXNoPath:
-                                continue
-                except nx.NodeNotFound:
-                    continue
-        except Exception as e:
-            print(f"Error processing place '{place_name}': {str(e)}")
-            results_retrieved.append(f'Error processing relationships for "{place_name}": {str(e)}')
+                    path_records.update(retriever.retrieve(pending_keys, max_depth=3))
+                except Exception as e:
+                    log.warning(f"Error retrieving relationships from the knowledge graph: {str(e)}")
+                inc("travelmate_db_round_trips_total", retriever.round_trips, backend=retriever.name)
+                fields.update(backend=retriever.name, round_trips=retriever.round_trips)
+                log.info(f"Retrieved relationships via {retriever.name} backend in {retriever.round_trips} round trips")
+
+    with span("prompt_build") as fields:
+        plan["prompt"] = build_ranking_prompt(input_data, places_ext, place_keys, path_records, results_retrieved)
+        fields["tokens"] = estimate_tokens(plan["prompt"])
+    return plan
+
+def build_ranking_prompt(input_data, places_ext, place_keys, path_records, results_retrieved):
+    """
+    Builds the Gemini ranking prompt from the retrieved knowledge graph paths.
+
+    Args:
+        input_data (dict): The user's input data
+        places_ext (list): Candidate place names
+        place_keys (list): Node keys aligned with places_ext
+        path_records (dict): {place_key: [PathRecord]}, or None while the graph is being built
+        results_retrieved (list): Sentences already collected (e.g. the graph-is-building notice)
+
+    Returns:
+        str: The prompt
+    """
+    if path_records is not None:
+        for place_name, place_key in zip(places_ext, place_keys):
+            if place_key not in path_records:
+                log.debug(f"Node {place_key} not found in graph")
+                results_retrieved.append(f'Node "{place_name}" was not found in the knowledge graph.')
+                continue
+            for record in path_records[place_key]:
+                results_retrieved.append(format_path_sentence(place_name, record))
 
     if not results_retrieved:
         results_retrieved.append("No relationship data could be retrieved from the knowledge graph for the given places.")
 
+    knowledge_context = results_retrieved
+    if path_records and os.getenv("PROMPT_CONTEXT_BUDGET", "1") == "1":
+        # Keep only the most relevant paths, grouped per place, within PROMPT_CONTEXT_TOKENS
+        knowledge_context, context_stats = build_context(places_ext, place_keys, path_records,
+                                                         input_data["description"], input_data["budget"])
+        baseline_tokens = estimate_tokens(str(results_retrieved))
+        log.info(f"Knowledge graph context: {context_stats['selected']}/{context_stats['candidates']} paths, "
+                 f"{context_stats['tokens']} tokens instead of {baseline_tokens} "
+                 f"({max(0, baseline_tokens - context_stats['tokens'])} saved)")
+
     retriever = f"""You are given a list of places and related details extracted from a Knowledge Graph. Your task is to recommend specific places based on the user's destination, budget, and interests. 
                     Filter the relevant places from the data and return a JSON list containing only the exact names of the places, ensuring that the recommendations align with the user's preferences.
 
@@ -440,64 +900,121 @@ def get_top_k_places(input_data, existing_city_names, G):
                     Description of the user's interests: {input_data["description"]}
 
                     Knowledge Graph Data:
-                    {results_retrieved}
+                    {knowledge_context}
                     """
 
-    try:
-        json_list_of_places = call_gemini_api("You are a travel expert and your task is to recommend specific places based on the user's destination, budget, and interests." + retriever)
+    return "You are a travel expert and your task is to recommend specific places based on the user's destination, budget, and interests." + retriever
 
-        # Handle potential format issues with the API response
-        try:
-            extracted_list_string = json_list_of_places.strip()
-            
-            if "```" in json_list_of_places:
-                extracted_list_string = json_list_of_places.split("```")[1].strip()
-                if extracted_list_string.startswith("json"):
-                    extracted_list_string = extracted_list_string[4:].strip()
-            else:
-                json_pattern = r'\[\s*"[^"]*"(?:\s*,\s*"[^"]*")*\s*\]'
-                match = re.search(json_pattern, json_list_of_places)
-                if match:
-                    extracted_list_string = match.group(0)
-            
-            extracted_list = json.loads(extracted_list_string)
-        except (json.JSONDecodeError, IndexError) as e:
-            print(f"Error parsing API response: {str(e)}")
-            extracted_list = places_ext  # Fallback to all places if parsing fails
-
-        modified_places = add_selected_key_to_places(places_google_maps, extracted_list)
-        return modified_places, G
-    except Exception as e:
-        print(f"Error calling Gemini API: {str(e)}")
-        return places_ext, G  # Return all places if API call fails
 
+def finish_top_k_places(plan, json_list_of_places):
+    """
+    Parses Gemini's ranking response, caches it and marks the selected places.
 
-# ------------------------------------------------------ Event Planner ------------------------------------------------------ 
+    Args:
+        plan (dict): Plan returned by plan_top_k_places
+        json_list_of_places (str): Gemini's response text
 
-def event_planner(selected_places, user_input):
+    Returns:
+        list: A list of modified places recommended for the user.
     """
-    Plans a series of events for a group of tourists based on selected places and user input.
+    # Handle potential format issues with the API response
+    try:
+        extracted_list_string = json_list_of_places.strip()
+        
+        if "```" in json_list_of_places:
+            extracted_list_string = json_list_of_places.split("```")[1].strip()
+            if extracted_list_string.startswith("json"):
+                extracted_list_string = extracted_list_string[4:].strip()
+        else:
+            json_pattern = r'\[\s*"[^"]*"(?:\s*,\s*"[^"]*")*\s*\]'
+            match = re.search(json_pattern, json_list_of_places)
+            if match:
+                extracted_list_string = match.group(0)
+        
+        extracted_list = json.loads(extracted_list_string)
+        get_prompt_cache().set("top_places", plan["cache_inputs"], extracted_list, plan["description"])
+    except (json.JSONDecodeError, IndexError) as e:
+        log.warning(f"Error parsing API response: {str(e)}")
+        extracted_list = plan["places_ext"]  # Fallback to all places if parsing fails
+
+    return add_selected_key_to_places(plan["places_google_maps"], extracted_list)
+
+def get_top_k_places(input_data, existing_city_names, G):
+    """
+    Retrieves the top K places based on the user's input data.
 
     Args:
-        selected_places (str): A string containing the list of places selected by the user.
-        user_input (str): Additional user input to customize the event plan.
+        input_data (dict): The user's input data containing destination, budget, interests, etc.
+            An optional "mode": "fast" ranks from the node index alone, without calling Gemini.
+        existing_city_names (list): Existing city names in the database (a list or the CityRegistry)
+        G (nx.Graph): NetworkX graph representing the knowledge graph, or None to rank from
+            Google Maps results alone while the city's graph is built in the background
     
     Returns:
-        list: A list of event plan dictionaries containing details such as place ID, name, 
-              details, timing, famous activities, total duration, recommended transport, 
-              and additional notes.
+        list: A list of modified places recommended for the user.
+    """
+    # Check if the city exists in the database, and the Knowledge Graph has substantial knowledge about it.
+    if G is not None:
+        G = fetch_or_create_city(input_data["destination"], existing_city_names, G)
 
-    The function generates a prompt combining the user input and selected places, then uses 
-    an AI text generation function to create a detailed event plan. The response is parsed 
-    into a list of event plans and returned.
+    # Fetch all places based on the city, country, state.
+    places_google_maps = get_maps_places(input_data["destination"], "Most Popular places in ")
+    plan = plan_top_k_places(input_data, G, places_google_maps)
+    if plan["result"] is not None:
+        return plan["result"], G
+
+    try:
+        with span("gemini_ranking", candidates=len(plan["places_ext"])):
+            json_list_of_places = call_gemini_api(plan["prompt"])
+        return finish_top_k_places(plan, json_list_of_places), G
+    except Exception as e:
+        log.warning(f"Error calling Gemini API: {str(e)}")
+        return plan["places_ext"], G  # Return all places if API call fails
+
+
+# ------------------------------------------------------ Event Planner ------------------------------------------------------ 
+
+EVENT_PLANNER_ROLE = "You are an event planner and your task is to plan a series of events for a group of tourists."
+
+def event_planner_cache_inputs(selected_places, user_input, route=None):
+    # The order in which places were selected does not matter
+    return {
+        "places": sorted(normalize_text(line) for line in selected_places.splitlines() if line.strip()),
+        "user_input": normalize_text(user_input),
+        "route": format_route(route) if route else None,
+    }
+
+def plan_event_route(data):
     """
+    Orders the structured `places` of an event planner request (Google Maps places with geometry)
+    into days between its `departureDate` and `returnDate`.
 
+    Returns:
+        dict: The route from itinerary_routing.plan_route, or None if the request has no located
+              places or ITINERARY_ROUTING is "0"
+    """
+    places = data.get("places") or []
+    if not places or os.getenv("ITINERARY_ROUTING", "1") != "1":
+        return None
+    with span("route_planning", places=len(places)):
+        route = plan_route(places, data.get("departureDate"), data.get("returnDate"))
+    return route if route["days"] else None
+
+def event_planner_mode(data):
+    return data.get("mode", os.getenv("ITINERARY_MODE", "llm"))
+
+def build_event_planner_prompt(selected_places, user_input, route=None):
+    """
+    Builds the event planner prompt for the selected places and the user's input. With a route,
+    the prompt fixes the visiting order, days, timings and transport, and Gemini only writes the
+    details of each visit.
+    """
     demo = '''[
                 {
                   "place_id": 0,
                   "name": "Burj Khalifa",
                   "details": "The Burj Khalifa is the tallest building in the world and a major attraction. Start your day early to avoid long queues for the observation deck.",
-                  "timing": "9:00 AM to 10:30 AM"
+                  "timing": "9:00 AM to 10:30 AM",
                   "Famous Activity": "Photoshoots",
                   "total_duration": "1-2 hours",
                   "recommended_transport": "Taxi",
@@ -515,71 +1032,408 @@ def event_planner(selected_places, user_input):
                   "additional_notes": "Grab a snack or lunch at Dubai Mall or nearby cafes. Dress comfortably and bring water, especially for outdoor activities."
                 } 
               ]'''
-    prompt = (user_input + "Plan a series of events that will provide a memorable experience for the group. The group is interested in exploring the places listed below.\n Selected Places:" + selected_places + "\nReturn a smart plan in the form of a 'JSON list of the same structure' containing the events and activities that the group should participate in. Ensure that the plan includes the total number of places to visit, the locations, details, timings, famous activities, total duration, recommended transport, and additional notes." + demo)
-              
-    response = call_gemini_api("You are an event planner and your task is to plan a series of events for a group of tourists.", prompt)
+    schedule = ""
+    if route:
+        schedule = ("\nThe visiting order, days, timings and travel between stops are already computed from the places' locations. "
+                    "Keep exactly this order and these timings, use the given transport, and return one event per stop:\n"
+                    + format_route(route) + "\n")
+    return (user_input + "Plan a series of events that will provide a memorable experience for the group. The group is interested in exploring the places listed below.\n Selected Places:" + selected_places + schedule + "\nReturn a smart plan in the form of a 'JSON list of the same structure' containing the events and activities that the group should participate in. Ensure that the plan includes the total number of places to visit, the locations, details, timings, famous activities, total duration, recommended transport, and additional notes." + demo)
+
+def parse_event_plan(response):
+    """
+    Parses the fenced JSON list of events out of Gemini's response.
+    """
     resp = response.split("```")[1].strip()
-    event_list = json.loads(resp)
+    if resp.startswith("json"):
+        resp = resp[4:].strip()
+    return json.loads(resp)
+
+def plan_event_planner(selected_places, user_input, route=None, mode="llm"):
+    """
+    Runs every step of the event planner up to the Gemini call: fast-mode routing and the
+    prompt cache lookup. Shared by the Flask and ASGI apps, which only differ in how they call Gemini.
+
+    Returns:
+        dict: The plan. "result" holds the events if no LLM call is needed (fast mode or cache
+              hit); otherwise "prompt" is the prompt to send to Gemini.
+    """
+    if route and mode == "fast":
+        return {"result": route_events(route)}
+
+    # Identical requests skip the LLM call
+    cache_inputs = event_planner_cache_inputs(selected_places, user_input, route)
+    hit, cached_plan = get_prompt_cache().get("event_planner", cache_inputs)
+    if hit:
+        return {"result": cached_plan}
+    prompt = build_event_planner_prompt(selected_places, user_input, route)
+    return {"result": None, "prompt": EVENT_PLANNER_ROLE + "\n" + prompt, "cache_inputs": cache_inputs}
+
+def finish_event_planner(plan, response):
+    """Parses Gemini's response to a plan_event_planner prompt and caches the events."""
+    event_list = parse_event_plan(response)
+    get_prompt_cache().set("event_planner", plan["cache_inputs"], event_list)
     return event_list
 
+def finish_streamed_event_planner(plan, event_list, parser):
+    """
+    Caches the events streamed for a plan_event_planner prompt, once `parser` has seen the end of
+    the stream. Raises if the plan was truncated or some events did not parse, so that it is
+    reported to the client and never cached.
+    """
+    parser.close()
+    if not parser.complete:
+        raise ValueError(f"Skipped {len(parser.errors)} malformed events in the generated plan")
+    get_prompt_cache().set("event_planner", plan["cache_inputs"], event_list)
+
+def event_planner(selected_places, user_input, route=None, mode="llm"):
+    """
+    Plans a series of events for a group of tourists based on selected places and user input.
+
+    Args:
+        selected_places (str): A string containing the list of places selected by the user.
+        user_input (str): Additional user input to customize the event plan.
+        route (dict): Optional route from plan_event_route, which fixes the order and timings.
+        mode (str): "fast" returns the route as events directly, without calling Gemini.
+    
+    Returns:
+        list: A list of event plan dictionaries containing details such as place ID, name, 
+              details, timing, famous activities, total duration, recommended transport, 
+              and additional notes.
+
+    The function generates a prompt combining the user input and selected places, then uses 
+    an AI text generation function to create a detailed event plan. The response is parsed 
+    into a list of event plans and returned.
+    """
+    plan = plan_event_planner(selected_places, user_input, route, mode)
+    if plan["result"] is not None:
+        return plan["result"]
+    return finish_event_planner(plan, call_gemini_api(plan["prompt"]))
+
+def stream_event_planner(selected_places, user_input, route=None, mode="llm"):
+    """
+    Streaming variant of event_planner: yields each event of the plan as soon as Gemini has
+    generated it, and caches the complete plan once the stream ends.
+    """
+    plan = plan_event_planner(selected_places, user_input, route, mode)
+    if plan["result"] is not None:
+        yield from plan["result"]
+        return
+
+    parser = JsonArrayStream()
+    event_list = []
+    for event in iter_json_array_items(stream_gemini_api(plan["prompt"]), parser):
+        event_list.append(event)
+        yield event
+    finish_streamed_event_planner(plan, event_list, parser)
+
 # ## MAIN CODE
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 PLACES_FILE  = "existing_places.json"
+MAX_BUILD_WAIT_SECONDS = 60
+
+# Cache, coalescing and snapshot statistics, exposed as gauges on /metrics
+def cache_metric_samples():
+    for source, stats in get_response_cache().get_stats().items():
+        for name in ("hits", "disk_hits", "misses"):
+            yield f"travelmate_response_cache_{name}", {"source": source}, stats[name]
+    for namespace, stats in get_prompt_cache().get_stats().items():
+        for name in ("exact_hits", "similar_hits", "misses"):
+            yield f"travelmate_prompt_cache_{name}", {"namespace": namespace}, stats[name]
+    single_flight = get_single_flight()
+    for group, stats in single_flight.get_stats().items():
+        for name in ("leaders", "coalesced", "timeouts"):
+            yield f"travelmate_singleflight_{name}", {"group": group}, stats[name]
+    yield "travelmate_singleflight_in_flight", {}, single_flight.in_flight()
+    for city, stats in get_snapshot_cache().get_stats().items():
+        yield "travelmate_snapshot_bytes", {"city": city}, stats["bytes"]
+
+get_metrics().register_collector(cache_metric_samples)
+
+@app.before_request
+def start_trace():
+    new_trace_id()
+
+# Registry of cities with a knowledge graph, seeded once from the legacy existing_places.json
+def city_registry():
+    return get_city_registry(seed_file=PLACES_FILE)
+
+# Builds the knowledge graph of a new city in the background and registers it once done.
+# Its Maps, Wikipedia and Gemini calls yield to interactive ones in the outbound scheduler.
+@background()
+def build_city(city_name):
+    new_trace_id()
+    G = get_graph_manager().graph
+    report = {}
+    if os.getenv("KG_STREAMING", "1") == "1":
+        generate_knowledge_graph_streaming(G, city_name, report=report)
+    else:
+        generate_knowledge_graph(G, city_name, report=report)
+    if "results" not in report:
+        # This build was coalesced onto one already in flight, which registers the city and
+        # patches the snapshots itself; marking it again would erase its counts and bump the version twice
+        return
+    registry = city_registry()
+    registry.mark_built(city_name, report.get("nodes_added"), report.get("edges_added"))
+
+    # Patch this worker's cached city snapshots with what was just added
+    nodes = {}
+    edges = []
+    for result in report["results"]:
+        nodes.update((row.key, {"name": row.name, "type": row.type}) for row in result.nodes.itertuples(index=False))
+        edges.extend(zip(result.edges["source"], result.edges["target"], result.edges["relation"]))
+    city = registry.get(city_name)
+    get_snapshot_cache().apply_delta(nodes, edges, city=city["key"], version=city["version"])
+
+def build_queue():
+    return get_build_queue(build_city, key_fn=sanitize_key)
+
+# Enqueue warm-up builds for the comma-separated PREFETCH_CITIES that are not registered yet.
+# Called at server startup; the registry claim keeps workers starting together from building a city twice.
+def prefetch_cities():
+    cities = [city.strip() for city in os.getenv("PREFETCH_CITIES", "").split(",")]
+    claimed = city_registry().claim_prefetch(cities, float(os.getenv("PREFETCH_CLAIM_SECONDS", 600)))
+    return build_queue().prefetch(claimed)
+
+# ----------------------------------------------------------------Incremental City Refresh----------------------------------------------------------------------
+
+def place_fingerprint(text):
+    """Short hash of a place's Wikipedia extract, insensitive to whitespace and case."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()[:16]
+
+def refresh_key(city_name):
+    return sanitize_key(city_name)
+
+@coalesced("city_refresh", key=refresh_key)
+@background()
+def refresh_city(city_name):
+    """
+    Incrementally refreshes a registered city's knowledge graph.
 
-# Function to load places from JSON
-def load_places():
-    with open(PLACES_FILE, "r") as file:
-        return json.load(file)
+    The city's current Google Maps places are diffed by key against the graph, and each
+    place's Wikipedia extract is fingerprinted; both are fetched fresh, bypassing (and updating)
+    the response cache. Only
+    places that are new to the graph or whose extract changed are sent to Gemini. The edges of
+    changed places, and of places Maps no longer returns, are removed before the new extraction
+    is ingested. Places already extracted (with a stored summary) but without a recorded
+    fingerprint are only fingerprinted; places the graph only mentions are extracted.
 
-# Function to add a new place and save
-def add_place(name):
-    places = load_places()
-    if({"name": name} not in places):
-        places.append({"name": name})
+    Returns:
+        dict: Per-city report: place counts by outcome, nodes and edges added and retired, and
+              the work avoided compared to a full rebuild
+    """
+    start = time.perf_counter()
+    G = get_graph_manager().graph
+    registry = city_registry()
+    stored = registry.fingerprints(city_name)
+
+    # A build extracts the top places of the Maps results (see get_wiki_desc_for_places); refresh the same ones
+    places = get_maps_places.uncached(city_name, "Most Popular places in ")
+    if not places:
+        # Every stored place would look retired; an empty answer is far more likely an API problem
+        raise Exception(f"Google Maps returned no places for {city_name}; not refreshing it")
+    get_response_cache().set(get_maps_places.cache_source,
+                             get_maps_places.cache_key(city_name, "Most Popular places in "), places)
+    names = {}
+    for place in places[:int(os.getenv("REFRESH_TOP_PLACES", 2))]:
+        names.setdefault(sanitize_key(place["name"].replace('"', '')), place["name"])
+    listed_keys = {sanitize_key(place["name"].replace('"', '')) for place in places}
+
+    # A place is known once it has been extracted: it has a summary or a fingerprint. A node that
+    # other places' extractions only mention (e.g. a NEARBY_ATTRACTION) has neither, and is extracted
+    summaries = load_summaries(G, names)
+    in_graph = {key for key, summary in summaries.items() if summary is not None or key in stored}
+    # Fetched fresh like the Maps places, so an edited article is noticed before its cache entry expires
+    descriptions = get_wikipedia_info_batch(
+        list(names.values()),
+        max_chars=int(os.getenv("WIKI_EXTRACT_MAX_CHARS", 0)),
+        intro_only=os.getenv("WIKI_INTRO_ONLY", "0") == "1",
+        refresh=True,
+    )
+    fingerprints = {key: (name, place_fingerprint(descriptions[name])) for key, name in names.items()}
+
+    added = [key for key in names if key not in in_graph]
+    changed = [key for key in names if key in in_graph and key in stored and stored[key] != fingerprints[key][1]]
+    baseline = [key for key in names if key in in_graph and key not in stored]
+    retired = [key for key in stored if key not in listed_keys]
+
+    report = {"city": city_name, "places": len(names), "added": len(added), "changed": len(changed),
+              "unchanged": len(names) - len(added) - len(changed) - len(baseline), "baseline": len(baseline),
+              "retired": len(retired), "nodes_added": 0, "edges_added": 0, "edges_retired": 0, "gemini_calls": 0}
+
+    targets = added + changed
+    descriptors = {key: {"place": names[key], "description": descriptions[names[key]], "destination": city_name}
+                   for key in names}
+    frames = []
+    results = []
+    if targets:
+        # Extract before retiring anything, so a failed extraction leaves the graph as it was
+        df = create_travel_knowledge_dataframe(city_name, [descriptors[key] for key in targets])
+        df, _ = assign_source_places(df, targets)
+        report["gemini_calls"] = 1
+        frames.append(df)
+
+    removed = retire_edges(G, changed + retired) if changed or retired else pd.DataFrame(columns=["source", "target"])
+    if frames:
+        results.append(ingest_frame(G, frames[0]))
+    report["edges_retired"] = len(removed)
+    report["nodes_added"] = sum(len(result.nodes) for result in results)
+    report["edges_added"] = sum(len(result.edges) for result in results)
+
+    graph_changed = bool(report["nodes_added"] or report["edges_added"] or report["edges_retired"])
+    if graph_changed:
+        touched = set(removed["source"]) | set(removed["target"])
+        report["summaries"] = materialize_place_summaries(G, frames, results, touched)
+        if frames:
+            index_city_nodes(city_name, frames)
+        # Removed edges cannot be patched into cached snapshots; the version bump below also makes them stale
+        get_snapshot_cache().invalidate(sanitize_key(city_name))
+    registry.set_fingerprints(city_name, fingerprints, retired)
+    registry.mark_refreshed(city_name, report["nodes_added"], report["edges_added"] - report["edges_retired"],
+                            changed=graph_changed)
+
+    skipped = [descriptors[key] for key in names if key not in targets]
+    report["extractions_avoided"] = len(skipped)
+    report["prompt_tokens_avoided"] = estimate_tokens(json.dumps(skipped)) if skipped else 0
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    log.info(f"Refreshed {city_name}: {len(targets)}/{len(names)} places re-extracted, "
+             f"{report['edges_added']} edges added, {report['edges_retired']} retired")
+    return report
+
+def refresh_stale_cities(cities=None, max_age_seconds=None, max_workers=None):
+    """
+    Refreshes registered cities not refreshed within `max_age_seconds` (default
+    REFRESH_MAX_AGE_SECONDS, one day), at most `max_workers` at a time (default REFRESH_CONCURRENCY=2).
 
-    with open(PLACES_FILE, "w") as file:
-        json.dump(places, file, indent=4)
+    Args:
+        cities (list): Cities to consider (default all registered cities)
+
+    Returns:
+        list: One refresh_city report per city; failed cities get {"city", "error"}
+    """
+    registry = city_registry()
+    max_age_seconds = float(max_age_seconds if max_age_seconds is not None else os.getenv("REFRESH_MAX_AGE_SECONDS", 86400))
+    cities = [city for city in (cities or registry.names()) if city in registry and registry.is_stale(city, max_age_seconds)]
+    reports = []
+    for city, (ok, value) in zip(cities, fan_out(refresh_city, cities, max_workers=int(max_workers or os.getenv("REFRESH_CONCURRENCY", 2)))):
+        if ok:
+            reports.append(value)
+        else:
+            log.warning(f"Error refreshing knowledge graph for '{city}': {str(value)}")
+            reports.append({"city": city, "error": str(value)})
+    return reports
+
+def start_refresh_scheduler(interval_seconds):
+    """Runs refresh_stale_cities every `interval_seconds` on a daemon thread."""
+    def run():
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                refresh_stale_cities()
+            except Exception as e:
+                log.warning(f"Error in scheduled city refresh: {str(e)}")
+
+    thread = threading.Thread(target=run, name="city-refresh", daemon=True)
+    thread.start()
+    return thread
 
 # Endpoint to get all places
 @app.route("/api/places", methods=["GET"])
 def get_places():
-    with open(PLACES_FILE, "r") as file:
-        places = json.load(file)
-    city_names = [place["name"] for place in places]  # Extract city names
-    return jsonify(city_names)
+    return jsonify(city_registry().names())
 
 @app.route('/api/top-places', methods=['POST'])
 def top_places():
-
-    db = ArangoClient(hosts="https://72f3bc481376.arangodb.cloud:8529").db(username="root", password="jznyCFlCYCwMCH5q2wV8", verify=True)
-    G = nxadb.Graph(name="TravelMate", db=db)
-    # existing_city_names = ["Varanasi", "Bombay", "Kolkata"]
-    places = load_places()
-    existing_city_names = [place["name"] for place in places]
-    print(existing_city_names)
     """
-    REST API endpoint to get top places based on user data
+    REST API endpoint to get top places based on user data.
+
+    If the destination has no knowledge graph yet, a background build is started and the request
+    waits for it for at most `waitSeconds` (default BUILD_WAIT_SECONDS). If the build is not done by
+    then, places are ranked from Google Maps results alone and the build job is returned as `buildJob`.
     """
     # Get user data from request
     user_data = request.json
-    destination_name = user_data['destination']
 
     if not user_data:
         return jsonify({"error": "No user data provided"}), 400
+
+    destination_name = user_data['destination']
+
+    # Reuse the worker's pooled ArangoDB connection and graph handle
+    G = get_graph_manager().graph
+    # The registry matches names by sanitized key, so it can be used directly for membership checks
+    existing_city_names = city_registry()
+
+    build_job = None
+    if destination_name not in existing_city_names:
+        build_job = build_queue().submit(destination_name)
+        wait_seconds = float(user_data.get("waitSeconds", os.getenv("BUILD_WAIT_SECONDS", 0)))
+        if not build_queue().wait(build_job, min(wait_seconds, MAX_BUILD_WAIT_SECONDS)):
+            G = None
     
     # Get top places based on user data
-    places, updated_G = get_top_k_places(user_data, existing_city_names, G)
-    add_place(destination_name)
-    G = updated_G
+    places, _ = get_top_k_places(user_data, existing_city_names, G)
     
     # Return the places
-    return jsonify({"places": places})
+    response = {"places": places}
+    if build_job is not None:
+        response["buildJob"] = build_job.to_dict()
+    return jsonify(response)
+
+@app.route("/api/graph/<city_name>", methods=["GET"])
+def api_city_graph(city_name):
+    """
+    Knowledge graph of a registered city with layout coordinates, as columnar JSON.
+
+    Query parameters: `level` keeps nodes up to that many hops from the city's places, and
+    `offset`/`limit` page through the nodes (places first). Each page carries the edges whose
+    endpoints are both on it or on earlier pages.
+    """
+    try:
+        level = request.args.get("level", type=int)
+        offset = max(0, request.args.get("offset", 0, type=int))
+        limit = request.args.get("limit", type=int)
+        export = city_graph_export(city_name)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    if export is None:
+        return jsonify({"error": "Unknown city"}), 404
+    return jsonify(page(export, level, offset, limit))
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint: stage durations, outbound calls, prompt sizes and cache statistics"""
+    return Response(get_metrics().render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/build-jobs", methods=["POST"])
+def api_create_build_job():
+    """Enqueue a knowledge graph build for a destination, e.g. to warm it up ahead of users"""
+    data = request.get_json()
+
+    if not data or not data.get("destination"):
+        return jsonify({"error": "Missing required parameter: destination"}), 400
+
+    job = build_queue().submit(data["destination"])
+    return jsonify(job.to_dict()), 202
+
+@app.route("/api/build-jobs/<job_id>", methods=["GET"])
+def api_build_job_status(job_id):
+    """Return the status of a knowledge graph build job"""
+    job = build_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown build job"}), 404
+    return jsonify(job.to_dict())
 
 @app.route("/api/event-planner", methods=["POST"])
 def api_event_planner():
-    """Handle event planner requests"""
+    """
+    Handle event planner requests.
+
+    Besides `selectedPlaces` and `userInput`, the body may carry the selected Google Maps place
+    objects as `places`, with `departureDate` and `returnDate`: they are then routed into days
+    before planning, and `"mode": "fast"` returns that routed plan without calling Gemini.
+    """
     data = request.get_json()
     
     if not data:
@@ -592,16 +1446,49 @@ def api_event_planner():
         return jsonify({"error": "Missing required parameters: selectedPlaces or userInput"}), 400
     
     try:
-        print(selected_places)
-        print(user_input)
-        result = event_planner(selected_places, user_input)
-        print(result)
+        log.debug(f"Event planner request: {selected_places} {user_input}")
+        result = event_planner(selected_places, user_input, plan_event_route(data), event_planner_mode(data))
+        log.debug(f"Event planner result: {result}")
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/event-planner/stream", methods=["POST"])
+def api_event_planner_stream():
+    """
+    Streaming event planner: same request body as /api/event-planner, answered as NDJSON with
+    one event object per line as soon as it is generated. A failure mid-stream is sent as a
+    final {"error": ...} line.
+    """
+    data = request.get_json()
+    
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    selected_places = data.get("selectedPlaces", "")
+    user_input = data.get("userInput", "")
+    
+    if not selected_places or not user_input:
+        return jsonify({"error": "Missing required parameters: selectedPlaces or userInput"}), 400
+
+    def generate():
+        try:
+            for event in stream_event_planner(selected_places, user_input, plan_event_route(data), event_planner_mode(data)):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Enable in a single process (or run refresh_cities.py from cron) to keep registered cities up to date
+if os.getenv("REFRESH_INTERVAL_SECONDS"):
+    start_refresh_scheduler(float(os.getenv("REFRESH_INTERVAL_SECONDS")))
+
 if __name__ == '__main__':
+    if os.getenv("PREFETCH_CITIES"):
+        prefetch_cities()
     port = 5000
-    print(f"Starting Flask server on port {port}")
+    log.info(f"Starting Flask server on port {port}")
     app.run(debug=True, port=port, host='0.0.0.0')
 
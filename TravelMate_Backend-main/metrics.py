@@ -0,0 +1,186 @@
+# Process-local instrumentation: stage timing spans, counters, structured logs and a
+# Prometheus text exposition, with no dependency beyond the standard library
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Tuple
+
+log = logging.getLogger("travelmate")
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf"))
+
+# Request-scoped trace id, attached to every span logged while serving that request
+trace_id = contextvars.ContextVar("trace_id", default=None)
+
+
+def configure_logging():
+    """
+    Sets up the "travelmate" logger from LOG_LEVEL (default INFO). Spans are logged as one JSON
+    object per line at INFO; per-node and per-row details are logged at DEBUG.
+    """
+    if log.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(handler)
+    log.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    log.propagate = False
+
+
+def _labels_key(labels: dict) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Metrics:
+    """
+    Counters and histograms keyed by metric name and label set.
+
+    Collectors are callables returning (name, labels dict, value) gauge samples; they expose
+    statistics kept elsewhere (response cache, prompt cache, ...) at scrape time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+        self._histograms: Dict[str, Dict[tuple, list]] = defaultdict(dict)
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, dict, float]]]] = []
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[name][_labels_key(labels)] += value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._histograms[name].get(key)
+            if series is None:
+                # Per-bucket counts, then sum and count
+                series = self._histograms[name][key] = [0] * len(BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, dict, float]]]):
+        self._collectors.append(collector)
+
+    @contextlib.contextmanager
+    def span(self, stage: str, **fields):
+        """
+        Times a pipeline stage: records its duration in travelmate_stage_duration_seconds and logs
+        it as a JSON line. The yielded dict can be filled with extra fields for the log line.
+        """
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield fields
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.observe("travelmate_stage_duration_seconds", duration, stage=stage, status=status)
+            if log.isEnabledFor(logging.INFO):
+                record = {"event": "span", "stage": stage, "status": status, "duration_ms": round(duration * 1000, 2)}
+                if trace_id.get():
+                    record["trace_id"] = trace_id.get()
+                record.update(fields)
+                log.info(json.dumps(record, default=str))
+
+    def get_stats(self) -> dict:
+        """Returns {"counters": {name: total over labels}, "stages": {stage: {"count", "seconds"}}}."""
+        with self._lock:
+            counters = {name: sum(series.values()) for name, series in self._counters.items()}
+            stages = defaultdict(lambda: {"count": 0, "seconds": 0.0})
+            for labels, values in self._histograms.get("travelmate_stage_duration_seconds", {}).items():
+                stage = dict(labels)["stage"]
+                stages[stage]["count"] += values[-1]
+                stages[stage]["seconds"] += values[-2]
+        return {"counters": counters, "stages": dict(stages)}
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{name}{_format_labels(labels)} {value:g}" for labels, value in sorted(series.items()))
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, values in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, values):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]:g}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+
+        gauges = defaultdict(list)
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    gauges[name].append((_labels_key(labels), value))
+            except Exception as e:
+                log.warning(f"Metrics collector failed: {str(e)}")
+        for name, samples in sorted(gauges.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(f"{name}{_format_labels(labels)} {value:g}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+_metrics = Metrics()
+_metrics.describe("travelmate_stage_duration_seconds", "Duration of recommendation pipeline stages")
+_metrics.describe("travelmate_outbound_requests_total", "HTTP requests sent to Maps, Wikipedia and Gemini")
+_metrics.describe("travelmate_db_round_trips_total", "Graph store round trips")
+_metrics.describe("travelmate_prompt_tokens_total", "Estimated tokens sent to Gemini")
+_metrics.describe("travelmate_prompt_bytes_total", "Bytes of prompt text sent to Gemini")
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+def span(stage: str, **fields):
+    return _metrics.span(stage, **fields)
+
+
+def inc(name: str, value: float = 1, **labels):
+    _metrics.inc(name, value, **labels)
+
+
+def new_trace_id() -> str:
+    """Starts a trace for the current request and returns its id."""
+    value = uuid.uuid4().hex[:16]
+    trace_id.set(value)
+    return value
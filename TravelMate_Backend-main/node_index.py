@@ -0,0 +1,181 @@
+# Per-city vector index over knowledge graph nodes, for interest-based place pre-filtering
+
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from graph_ingest import sanitize_keys
+from text_vectors import hash_vectorize, cosine_similarities
+
+
+def _attribute_values(attributes) -> List[str]:
+    try:
+        parsed = json.loads(attributes) if isinstance(attributes, str) else attributes
+    except ValueError:
+        return [str(attributes)]
+    if isinstance(parsed, dict):
+        return [f"{key} {value}" for key, value in parsed.items()]
+    return [str(parsed)] if parsed else []
+
+
+def node_documents(df: pd.DataFrame) -> Dict[str, dict]:
+    """
+    Builds one text document per node of an extraction DataFrame.
+
+    A node's document holds its name and type plus, for every row it appears in, the relation,
+    the other node's name and type and the edge attributes, so an attraction matches the
+    interests its neighbourhood describes ("street food", "art") and not just its own name.
+
+    Returns:
+        dict: {key: {"name", "type", "phrases": set of phrases}}
+    """
+    documents = {}
+    keys_1 = sanitize_keys(df['Node_1'])
+    keys_2 = sanitize_keys(df['Node_2'])
+    attributes = df['Attributes'] if 'Attributes' in df.columns else pd.Series("{}", index=df.index)
+    for key_1, key_2, row, attribute in zip(keys_1, keys_2, df.itertuples(index=False), attributes):
+        context = [str(row.Relation).replace("_", " ")] + _attribute_values(attribute)
+        for key, name, node_type, other_name, other_type in (
+            (key_1, row.Node_1, row.Node_1_Type, row.Node_2, row.Node_2_Type),
+            (key_2, row.Node_2, row.Node_2_Type, row.Node_1, row.Node_1_Type),
+        ):
+            document = documents.setdefault(key, {"name": name, "type": node_type, "phrases": {str(name), str(node_type)}})
+            document["phrases"].update(context)
+            document["phrases"].update((str(other_name), str(other_type)))
+    return documents
+
+
+class VectorIndex:
+    """
+    Dense matrix of L2-normalized node vectors, searched with one batched matrix product.
+
+    Brute force stays well under a millisecond per query at the size of a city graph (hundreds
+    to a few thousand nodes); memory is len(keys) * dim * 4 bytes.
+    """
+
+    def __init__(self, keys: List[str], names: List[str], texts: List[str], dim: int = 512):
+        self.keys = keys
+        self.names = names
+        self.positions = {key: i for i, key in enumerate(keys)}
+        self.dim = dim
+        self.matrix = hash_vectorize(texts, dim)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def scores(self, query: str, keys: Iterable[str]) -> Dict[str, float]:
+        """Cosine similarity of `query` to each of `keys`; keys not in the index score 0."""
+        similarities = cosine_similarities(hash_vectorize([query], self.dim)[0], self.matrix)
+        return {key: float(similarities[self.positions[key]]) if key in self.positions else 0.0 for key in keys}
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k (key, similarity) pairs with a positive similarity."""
+        similarities = cosine_similarities(hash_vectorize([query], self.dim)[0], self.matrix)
+        if similarities.size == 0:
+            return []
+        k = min(k, similarities.size)
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top], kind="stable")]
+        return [(self.keys[i], float(similarities[i])) for i in top if similarities[i] > 0]
+
+
+class NodeIndexStore:
+    """
+    Node documents persisted in SQLite (so every worker sees what a build wrote), with an LRU of
+    per-city VectorIndexes in memory. An index is rebuilt when the caller's city version changes.
+
+    Args:
+        path (str): SQLite database file.
+        dim (int): Hashed vector dimension.
+        max_cities (int): Number of city indexes kept in memory.
+    """
+
+    def __init__(self, path: str, dim: int = 512, max_cities: int = 32):
+        self.dim = dim
+        self.max_cities = max_cities
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS node_documents ("
+            " city TEXT NOT NULL, key TEXT NOT NULL, name TEXT, type TEXT, phrases TEXT NOT NULL,"
+            " PRIMARY KEY (city, key))"
+        )
+        self._indexes: "OrderedDict[str, Tuple[object, VectorIndex]]" = OrderedDict()
+
+    def add(self, city: str, frames: Iterable[pd.DataFrame]) -> int:
+        """Merges the node documents of freshly ingested frames into the city's documents."""
+        documents = {}
+        for df in frames:
+            for key, document in node_documents(df).items():
+                merged = documents.setdefault(key, {"name": document["name"], "type": document["type"], "phrases": set()})
+                merged["phrases"].update(document["phrases"])
+        if not documents:
+            return 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                keys = list(documents)
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    rows = self._conn.execute(
+                        f"SELECT key, phrases FROM node_documents WHERE city = ? AND key IN ({','.join('?' * len(chunk))})",
+                        [city] + chunk,
+                    )
+                    for key, phrases in rows:
+                        documents[key]["phrases"].update(json.loads(phrases))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO node_documents (city, key, name, type, phrases) VALUES (?, ?, ?, ?, ?)",
+                    [(city, key, str(document["name"]), str(document["type"]), json.dumps(sorted(document["phrases"])))
+                     for key, document in documents.items()],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._indexes.pop(city, None)
+        return len(documents)
+
+    def get(self, city: str, version=None) -> Optional[VectorIndex]:
+        """The city's index, or None if nothing has been indexed for it."""
+        with self._lock:
+            cached = self._indexes.get(city)
+            if cached is not None and cached[0] == version:
+                self._indexes.move_to_end(city)
+                return cached[1]
+            rows = self._conn.execute("SELECT key, name, phrases FROM node_documents WHERE city = ?", (city,)).fetchall()
+            if not rows:
+                return None
+            index = VectorIndex([row[0] for row in rows], [row[1] for row in rows],
+                                [" ".join(json.loads(row[2])) for row in rows], self.dim)
+            self._indexes[city] = (version, index)
+            self._indexes.move_to_end(city)
+            while len(self._indexes) > self.max_cities:
+                self._indexes.popitem(last=False)
+            return index
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_node_index() -> NodeIndexStore:
+    """
+    Returns the process-wide node index, configured from the environment:
+        NODE_INDEX_PATH  SQLite file holding node documents (default "node_index.sqlite3")
+        NODE_INDEX_DIM   Hashed vector dimension (default 512)
+    """
+    global _store, _store_pid
+    with _store_lock:
+        if _store is None or _store_pid != os.getpid():
+            _store = NodeIndexStore(os.getenv("NODE_INDEX_PATH", "node_index.sqlite3"),
+                                    dim=int(os.getenv("NODE_INDEX_DIM", 512)))
+            _store_pid = os.getpid()
+        return _store
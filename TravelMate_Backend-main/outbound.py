@@ -0,0 +1,462 @@
+# Outbound call scheduler: per-provider rate limits, concurrency caps, priority lanes and retries
+#
+# Every request to Maps, Wikipedia and Gemini goes through a provider lane. A lane admits calls in
+# priority order (interactive before background), at most `rate` per second with bursts of
+# `burst`, and at most `concurrency` at a time, of which background calls may take only
+# `background_concurrency`. Calls failing with 429, 5xx or a connection error are retried with
+# jittered exponential backoff, honouring Retry-After.
+
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+import requests
+
+from metrics import get_metrics, inc, log
+from singleflight import register_call_hook
+
+INTERACTIVE = 0
+BACKGROUND = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+# Providers that report an exhausted quota in the JSON body of an HTTP 200 response, with those
+# body statuses; such a response is retried, and pauses the provider, like a 429
+QUOTA_BODY_STATUSES = {"maps": ("OVER_QUERY_LIMIT",)}
+
+# (rate per second, burst, concurrency) by provider; OUTBOUND_<PROVIDER>_RATE/_BURST/_CONCURRENCY override them
+DEFAULT_LIMITS = {"gemini": (5, 10, 16), "maps": (10, 20, 16), "wikipedia": (20, 40, 8)}
+
+
+class Priority:
+    """
+    Lane of the calls made in one context (a request, a build job, one coalesced call...), shared
+    with its fan_out workers. It can be promoted to interactive while its calls wait, e.g. when a
+    user request coalesces onto a call a background build started.
+    """
+
+    def __init__(self, value: int):
+        self.value = value
+        self._lock = threading.Lock()
+        # Tickets of this context queued in a lane, by id
+        self._waiting: Dict[int, tuple] = {}
+
+    def _track(self, lane, ticket):
+        with self._lock:
+            self._waiting[id(ticket)] = (lane, ticket)
+
+    def _untrack(self, ticket):
+        with self._lock:
+            self._waiting.pop(id(ticket), None)
+
+    def promote(self):
+        """Moves this context, and the calls it has queued, to the interactive lane."""
+        with self._lock:
+            if self.value == INTERACTIVE:
+                return
+            self.value = INTERACTIVE
+            waiting = list(self._waiting.values())
+        for lane, ticket in waiting:
+            lane._promote(ticket)
+
+
+_INTERACTIVE = Priority(INTERACTIVE)
+
+# Priority of the calls made in the current context (request, build job or fan-out worker)
+_priority = contextvars.ContextVar("outbound_priority", default=_INTERACTIVE)
+
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def background():
+    """Runs the calls made inside the block, including from fan_out workers, in the background lane."""
+    token = _priority.set(Priority(BACKGROUND))
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `burst`; a rate of 0 means unlimited."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available; takes it and returns 0 if one is available now."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.rate <= 0:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float):
+        """Stops handing out tokens for `seconds`, e.g. after the provider answered 429."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class Lane:
+    """Admission control for one provider: a priority queue in front of a token bucket and a concurrency cap."""
+
+    def __init__(self, name: str, rate: float, burst: float, concurrency: int, background_concurrency: int):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = max(1, concurrency)
+        self.background_concurrency = max(1, min(background_concurrency, self.concurrency))
+        self.cond = threading.Condition()
+        self.waiting = []
+        self.in_flight = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._seq = itertools.count()
+
+    def _enqueue(self, priority: Priority) -> list:
+        with self.cond:
+            # [lane, sequence, context]: the lane can change while the ticket waits, see _promote
+            ticket = [priority.value, next(self._seq), priority]
+            heapq.heappush(self.waiting, ticket)
+            if priority.value != INTERACTIVE:
+                priority._track(self, ticket)
+            return ticket
+
+    def _promote(self, ticket: list):
+        with self.cond:
+            if any(waiting is ticket for waiting in self.waiting):
+                ticket[0] = INTERACTIVE
+                heapq.heapify(self.waiting)
+                self.cond.notify_all()
+
+    def _try_admit(self, ticket: list) -> Optional[float]:
+        """
+        Admits `ticket` if it is first in line, under the concurrency caps and a token is available.
+
+        Returns:
+            float: 0 if admitted, the seconds until a token is available, or None if the ticket
+                   has to wait for another call to be admitted or to finish
+        """
+        priority = ticket[0]
+        if self.waiting[0] is not ticket or sum(self.in_flight.values()) >= self.concurrency:
+            return None
+        if priority == BACKGROUND and self.in_flight[BACKGROUND] >= self.background_concurrency:
+            return None
+        delay = self.bucket.delay(time.monotonic())
+        if delay > 0:
+            return delay
+        heapq.heappop(self.waiting)
+        ticket[2]._untrack(ticket)
+        self.in_flight[priority] += 1
+        # The next ticket in line may be admissible too
+        self.cond.notify_all()
+        return 0.0
+
+    def _cancel(self, ticket: list):
+        with self.cond:
+            ticket[2]._untrack(ticket)
+            if any(waiting is ticket for waiting in self.waiting):
+                self.waiting = [waiting for waiting in self.waiting if waiting is not ticket]
+                heapq.heapify(self.waiting)
+                self.cond.notify_all()
+
+    def acquire(self, priority: Priority) -> int:
+        """Blocks until a call of this context may be sent; returns the lane it was admitted to."""
+        start = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            with self.cond:
+                while True:
+                    delay = self._try_admit(ticket)
+                    if delay == 0:
+                        break
+                    self.cond.wait(delay)
+        except BaseException:
+            self._cancel(ticket)
+            raise
+        return self._record_wait(ticket[0], time.monotonic() - start)
+
+    async def acquire_async(self, priority: Priority, poll_interval: float = 0.02) -> int:
+        """acquire() for the event loop: polls for admission instead of blocking a thread."""
+        start = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                with self.cond:
+                    delay = self._try_admit(ticket)
+                if delay == 0:
+                    break
+                await asyncio.sleep(min(delay, poll_interval) if delay else poll_interval)
+        except BaseException:
+            self._cancel(ticket)
+            raise
+        return self._record_wait(ticket[0], time.monotonic() - start)
+
+    def release(self, priority: int):
+        with self.cond:
+            self.in_flight[priority] -= 1
+            self.cond.notify_all()
+
+    def _record_wait(self, priority: int, waited: float) -> int:
+        get_metrics().observe("travelmate_outbound_wait_seconds", waited, service=self.name, lane=LANE_NAMES[priority])
+        return priority
+
+    def get_stats(self) -> dict:
+        with self.cond:
+            queued = {INTERACTIVE: 0, BACKGROUND: 0}
+            for priority, _, _ in self.waiting:
+                queued[priority] += 1
+            return {LANE_NAMES[priority]: {"queued": queued[priority], "in_flight": self.in_flight[priority]}
+                    for priority in (INTERACTIVE, BACKGROUND)}
+
+
+def retry_after_seconds(response) -> Optional[float]:
+    """The Retry-After header of a response in seconds (it may be a number or an HTTP date)."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def response_status(response) -> int:
+    # requests responses have status_code, aiohttp responses have status
+    return getattr(response, "status_code", None) or response.status
+
+
+def _quota_status(provider: str, status: int, body: Callable) -> int:
+    """`status`, or 429 if the provider reported an exhausted quota in the body (read with body())."""
+    if status != 200 or provider not in QUOTA_BODY_STATUSES:
+        return status
+    try:
+        data = body()
+    except ValueError:
+        return status
+    if isinstance(data, dict) and data.get("status") in QUOTA_BODY_STATUSES[provider]:
+        return 429
+    return status
+
+
+class OutboundScheduler:
+    """
+    Provider lanes and the retry policy shared by all outbound calls of a process.
+
+    Args:
+        max_retries (int): Retries after the first attempt (default OUTBOUND_MAX_RETRIES=3)
+        backoff_base (float): First backoff ceiling in seconds, doubled on every retry (default
+            OUTBOUND_BACKOFF_BASE=0.5); the actual delay is drawn uniformly below it (full jitter)
+        backoff_max (float): Longest delay a call waits before a retry (default OUTBOUND_BACKOFF_MAX=30).
+            A Retry-After longer than this is not waited for and the failed response is returned.
+    """
+
+    def __init__(self, max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 30.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lanes: Dict[str, Lane] = {}
+        self._lock = threading.Lock()
+
+    def lane(self, provider: str) -> Lane:
+        with self._lock:
+            lane = self._lanes.get(provider)
+            if lane is None:
+                rate, burst, concurrency = DEFAULT_LIMITS.get(provider, (0, 1, 8))
+                prefix = f"OUTBOUND_{provider.upper()}_"
+                concurrency = int(os.getenv(prefix + "CONCURRENCY", concurrency))
+                lane = self._lanes[provider] = Lane(
+                    provider,
+                    rate=float(os.getenv(prefix + "RATE", rate)),
+                    burst=float(os.getenv(prefix + "BURST", burst)),
+                    concurrency=concurrency,
+                    # By default background calls leave half of the slots to interactive ones
+                    background_concurrency=int(os.getenv(prefix + "BACKGROUND_CONCURRENCY", max(1, concurrency // 2))),
+                )
+            return lane
+
+    def backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    def _should_retry(self, lane: Lane, attempt: int, response, error, status: Optional[int] = None) -> Optional[float]:
+        """
+        Returns the delay before the next attempt, or None if the outcome is final. `status`
+        overrides the response's status code, e.g. for quota errors reported in the body.
+        """
+        if attempt >= self.max_retries:
+            return None
+        if error is None and status is None:
+            status = response_status(response)
+        if error is None and status not in RETRY_STATUSES:
+            return None
+        retry_after = retry_after_seconds(response)
+        if retry_after is not None and retry_after > self.backoff_max:
+            return None
+        delay = self.backoff(attempt, retry_after)
+        reason = type(error).__name__ if error is not None else str(status)
+        if error is None and status == 429:
+            # The quota is shared, so every call to this provider backs off, not just this one
+            lane.bucket.pause(delay)
+        inc("travelmate_outbound_retries_total", service=lane.name, reason=reason)
+        log.warning(f"Retrying {lane.name} call in {delay:.2f}s after {reason} (attempt {attempt + 1})")
+        return delay
+
+    @contextlib.contextmanager
+    def request(self, provider: str, send: Callable, retry_on=RETRY_ERRORS):
+        """
+        Sends `send()` through the provider's lane, retrying it if needed, and yields the final response.
+
+        The concurrency slot is held until the block exits, so streamed responses count as in
+        flight while they are being read.
+        """
+        lane = self.lane(provider)
+        context = current_priority()
+        for attempt in itertools.count():
+            priority = lane.acquire(context)
+            try:
+                response, error, status = None, None, None
+                try:
+                    response = send()
+                except retry_on as e:
+                    error = e
+                if response is not None and provider in QUOTA_BODY_STATUSES:
+                    status = _quota_status(provider, response_status(response), response.json)
+                delay = self._should_retry(lane, attempt, response, error, status)
+                if delay is None:
+                    if error is not None:
+                        raise error
+                    yield response
+                    return
+                if response is not None:
+                    response.close()
+            finally:
+                lane.release(priority)
+            time.sleep(delay)
+
+    def send(self, provider: str, send: Callable, retry_on=RETRY_ERRORS):
+        """request() for non-streamed calls, whose body is read before the slot is released."""
+        with self.request(provider, send, retry_on) as response:
+            return response
+
+    @contextlib.asynccontextmanager
+    async def request_async(self, provider: str, send: Callable, retry_on=(asyncio.TimeoutError,)):
+        """
+        request() for coroutines: `send` is a coroutine function returning an aiohttp response,
+        and `retry_on` should include the client's connection errors.
+        """
+        lane = self.lane(provider)
+        context = current_priority()
+        for attempt in itertools.count():
+            priority = await lane.acquire_async(context)
+            try:
+                response, error, status = None, None, None
+                try:
+                    response = await send()
+                except retry_on as e:
+                    error = e
+                if response is not None and provider in QUOTA_BODY_STATUSES:
+                    text = await response.text()
+                    status = _quota_status(provider, response_status(response), lambda: json.loads(text))
+                delay = self._should_retry(lane, attempt, response, error, status)
+                if delay is None:
+                    if error is not None:
+                        raise error
+                    try:
+                        yield response
+                    finally:
+                        response.release()
+                    return
+                if response is not None:
+                    response.release()
+            finally:
+                lane.release(priority)
+            await asyncio.sleep(delay)
+
+    def get_stats(self) -> dict:
+        """Queued and in-flight calls per provider and lane."""
+        with self._lock:
+            lanes = dict(self._lanes)
+        return {provider: lane.get_stats() for provider, lane in lanes.items()}
+
+    def metric_samples(self):
+        for provider, stats in self.get_stats().items():
+            for lane, values in stats.items():
+                yield "travelmate_outbound_queue_depth", {"service": provider, "lane": lane}, values["queued"]
+                yield "travelmate_outbound_in_flight", {"service": provider, "lane": lane}, values["in_flight"]
+
+
+_scheduler = None
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> OutboundScheduler:
+    """
+    Returns the process-wide scheduler. Limits are per process, so with several workers the
+    OUTBOUND_<PROVIDER>_RATE of each should be the provider quota divided by the worker count.
+    """
+    global _scheduler, _scheduler_pid
+    with _scheduler_lock:
+        if _scheduler is None or _scheduler_pid != os.getpid():
+            _scheduler = OutboundScheduler(
+                max_retries=int(os.getenv("OUTBOUND_MAX_RETRIES", 3)),
+                backoff_base=float(os.getenv("OUTBOUND_BACKOFF_BASE", 0.5)),
+                backoff_max=float(os.getenv("OUTBOUND_BACKOFF_MAX", 30)),
+            )
+            _scheduler_pid = os.getpid()
+        return _scheduler
+
+
+get_metrics().describe("travelmate_outbound_wait_seconds", "Time outbound calls waited for a rate limit or concurrency slot")
+get_metrics().describe("travelmate_outbound_retries_total", "Outbound calls retried, by status code or error")
+get_metrics().describe("travelmate_outbound_queue_depth", "Outbound calls waiting to be sent")
+get_metrics().describe("travelmate_outbound_in_flight", "Outbound calls sent and not yet finished")
+get_metrics().register_collector(lambda: get_scheduler().metric_samples())
+
+
+@contextlib.contextmanager
+def _call_scope():
+    # A coalesced background call gets its own context, so a follower can promote just that call
+    parent = current_priority()
+    if parent.value == INTERACTIVE:
+        yield None
+        return
+    token = _priority.set(Priority(parent.value))
+    try:
+        yield _priority.get()
+    finally:
+        _priority.reset(token)
+
+
+def _join_in_flight(call: Optional[Priority]):
+    # An interactive caller waiting on a call started in the background must not wait behind the
+    # background cap; the rest of the background job keeps its lane
+    if call is not None and current_priority().value == INTERACTIVE:
+        call.promote()
+
+
+register_call_hook(_call_scope, _join_in_flight)
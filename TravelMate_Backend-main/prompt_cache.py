@@ -0,0 +1,158 @@
+# Result cache for the Gemini ranking and event-planner prompts, keyed on normalized user inputs
+
+import json
+import math
+import os
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import date
+from typing import Callable, Optional
+
+import numpy as np
+
+from text_vectors import hash_vectorize
+
+
+# First number of a budget ("Rs. 5,00,000", "$1000-$2000", "1.5 lakh"), with an optional multiplier suffix
+BUDGET_AMOUNT = re.compile(
+    r"(\d[\d,]*(?:\.\d+)?)\s*(k|thousand|lakhs?|lacs?|l|crores?|cr|mn|million|m)?\b", re.IGNORECASE)
+BUDGET_MULTIPLIERS = {"k": 1e3, "thousand": 1e3, "lakh": 1e5, "lakhs": 1e5, "lac": 1e5, "lacs": 1e5, "l": 1e5,
+                      "crore": 1e7, "crores": 1e7, "cr": 1e7, "m": 1e6, "mn": 1e6, "million": 1e6}
+
+
+def parse_budget(budget) -> Optional[float]:
+    """
+    The amount of a free-text budget, or None if it has no number. A range ("$1000-$2000")
+    gives its lower end; thousands separators and k/lakh/crore/million suffixes are applied.
+    """
+    match = BUDGET_AMOUNT.search(str(budget))
+    if match is None:
+        return None
+    amount = float(match.group(1).replace(",", ""))
+    suffix = (match.group(2) or "").casefold()
+    return amount * BUDGET_MULTIPLIERS.get(suffix, 1)
+
+
+def budget_bracket(budget) -> str:
+    """Buckets a budget into power-of-two brackets, so 48000 and 52000 share a key."""
+    amount = parse_budget(budget)
+    if amount is None:
+        return re.sub(r"\s+", " ", str(budget)).strip().casefold()
+    if amount <= 0:
+        return "0"
+    return f"2^{int(math.log2(amount))}"
+
+
+def date_bucket(departure, return_date) -> str:
+    """Buckets a trip by departure month and length in days."""
+    try:
+        start = date.fromisoformat(str(departure)[:10])
+        end = date.fromisoformat(str(return_date)[:10])
+    except ValueError:
+        return f"{departure}:{return_date}".casefold()
+    return f"{start:%Y-%m}:{max(0, (end - start).days)}d"
+
+
+def normalize_text(text) -> str:
+    return re.sub(r"\s+", " ", str(text)).strip().casefold()
+
+
+class PromptCache:
+    """
+    LRU cache of LLM results.
+
+    Every entry has an exact key built from normalized structured inputs, plus optional free text
+    (the user's description). On an exact miss, entries sharing the same structured key are
+    compared by embedding similarity of their free text, and the best match above
+    `similarity_threshold` is served. A threshold of None disables the similarity lookup.
+
+    Args:
+        max_entries (int): Number of entries kept before the least recently used are evicted.
+        similarity_threshold (float): Minimum cosine similarity for a near-duplicate hit.
+        embed (callable): Maps a list of texts to an (n, d) matrix of L2-normalized vectors.
+    """
+
+    def __init__(self, max_entries: int = 512, similarity_threshold: Optional[float] = None,
+                 embed: Callable = hash_vectorize):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed
+        self._entries = OrderedDict()
+        self._groups = defaultdict(set)
+        self._lock = threading.Lock()
+        self.stats = defaultdict(lambda: {"exact_hits": 0, "similar_hits": 0, "misses": 0})
+
+    @staticmethod
+    def _key(namespace, structured):
+        return namespace, json.dumps(structured, sort_keys=True, default=str)
+
+    def get(self, namespace: str, structured: dict, text: str = ""):
+        """Returns (True, value) on a hit and (False, None) on a miss."""
+        group = self._key(namespace, structured)
+        text = normalize_text(text)
+        with self._lock:
+            entry = self._entries.get((group, text))
+            if entry is not None:
+                self._entries.move_to_end((group, text))
+                self.stats[namespace]["exact_hits"] += 1
+                return True, entry[0]
+
+            if self.similarity_threshold is not None and text and self._groups.get(group):
+                candidates = list(self._groups[group])
+                vectors = np.stack([self._entries[candidate][1] for candidate in candidates])
+                scores = vectors @ self.embed([text])[0]
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    self._entries.move_to_end(candidates[best])
+                    self.stats[namespace]["similar_hits"] += 1
+                    return True, self._entries[candidates[best]][0]
+
+            self.stats[namespace]["misses"] += 1
+            return False, None
+
+    def set(self, namespace: str, structured: dict, value, text: str = ""):
+        group = self._key(namespace, structured)
+        text = normalize_text(text)
+        vector = self.embed([text])[0] if self.similarity_threshold is not None else None
+        with self._lock:
+            self._entries[(group, text)] = (value, vector)
+            self._entries.move_to_end((group, text))
+            self._groups[group].add((group, text))
+            while len(self._entries) > self.max_entries:
+                (old_group, old_text), _ = self._entries.popitem(last=False)
+                self._groups[old_group].discard((old_group, old_text))
+                if not self._groups[old_group]:
+                    del self._groups[old_group]
+
+    def get_stats(self):
+        """Returns {namespace: {"exact_hits", "similar_hits", "misses", "hit_rate"}}."""
+        with self._lock:
+            stats = {}
+            for namespace, counters in self.stats.items():
+                hits = counters["exact_hits"] + counters["similar_hits"]
+                total = hits + counters["misses"]
+                stats[namespace] = dict(counters, hit_rate=hits / total if total else 0.0)
+            return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_prompt_cache() -> PromptCache:
+    """
+    Returns the process-wide prompt cache, configured from the environment:
+        PROMPT_CACHE_SIZE        Maximum number of cached results (default 512)
+        PROMPT_CACHE_SIMILARITY  Cosine threshold for near-duplicate descriptions, e.g. 0.9
+                                 (unset or empty disables the similarity lookup)
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            threshold = os.getenv("PROMPT_CACHE_SIMILARITY")
+            _cache = PromptCache(
+                max_entries=int(os.getenv("PROMPT_CACHE_SIZE", 512)),
+                similarity_threshold=float(threshold) if threshold else None,
+            )
+        return _cache
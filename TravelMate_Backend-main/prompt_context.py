@@ -0,0 +1,148 @@
+# Relevance-ranked, token-budgeted knowledge graph context for the recommendation prompt
+
+import math
+import os
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from graph_retrieval import PathRecord
+from prompt_cache import parse_budget
+from text_vectors import tokenize
+
+# Words that hint at the user's spending level, added to the query for budget-aware relations
+BUDGET_TERMS = {
+    "low": "free cheap affordable budget local street market",
+    "high": "luxury premium fine dining resort heritage hotel",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token), good enough for budgeting."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def path_line(record: PathRecord) -> str:
+    """Compact one-line rendering of a path, e.g. "HAS_STYLE > Indo-Saracenic [Style]"."""
+    relations = " > ".join(str(relation) for relation in record.relations) or "RELATED_TO"
+    return f"{relations} > {record.target_name} [{record.target_type}]"
+
+
+def bm25_scores(query: List[str], documents: List[List[str]], k1: float = 1.2, b: float = 0.75) -> List[float]:
+    """Okapi BM25 score of every tokenized document for a tokenized query."""
+    if not documents or not query:
+        return [0.0] * len(documents)
+    doc_freq = Counter(token for document in documents for token in set(document))
+    avg_len = sum(len(document) for document in documents) / len(documents) or 1.0
+    n = len(documents)
+    idf = {token: math.log(1 + (n - doc_freq[token] + 0.5) / (doc_freq[token] + 0.5)) for token in set(query)}
+    scores = []
+    for document in documents:
+        counts = Counter(document)
+        norm = k1 * (1 - b + b * len(document) / avg_len)
+        scores.append(sum(idf[token] * counts[token] * (k1 + 1) / (counts[token] + norm)
+                          for token in idf if counts[token]))
+    return scores
+
+
+def budget_level(budget) -> Optional[str]:
+    """Maps a budget to "low" or "high" using BUDGET_LOW / BUDGET_HIGH thresholds, or None."""
+    amount = parse_budget(budget)
+    if amount is None:
+        return None
+    if amount <= float(os.getenv("BUDGET_LOW", 20000)):
+        return "low"
+    if amount >= float(os.getenv("BUDGET_HIGH", 150000)):
+        return "high"
+    return None
+
+
+def score_paths(candidates: List[Tuple[str, PathRecord]], description: str, budget=None) -> List[float]:
+    """
+    Scores (place_name, PathRecord) candidates by relevance to the user.
+
+    The score adds up a hop prior (1 / hops), the share of query terms found in the relation
+    chain, and BM25 of the query over the target's name, type and relations, normalized to [0, 1].
+    """
+    query = tokenize(description)
+    level = budget_level(budget) if budget is not None else None
+    if level:
+        query += tokenize(BUDGET_TERMS[level])
+    query_terms = set(query)
+
+    documents = [tokenize(f"{record.target_name} {record.target_type} {' '.join(map(str, record.relations))}".replace("_", " "))
+                 for _, record in candidates]
+    bm25 = bm25_scores(query, documents)
+    top = max(bm25, default=0.0) or 1.0
+
+    scores = []
+    for (_, record), text_score in zip(candidates, bm25):
+        relation_terms = set(tokenize(" ".join(map(str, record.relations)).replace("_", " ")))
+        relation_match = len(relation_terms & query_terms) / len(query_terms) if query_terms else 0.0
+        scores.append(1.0 / max(1, len(record.relations)) + relation_match + text_score / top)
+    return scores
+
+
+def build_context(places: List[str], place_keys: List[str], path_records: Dict[str, List[PathRecord]],
+                  description: str, budget=None, max_tokens: Optional[int] = None) -> Tuple[str, dict]:
+    """
+    Picks the most relevant paths under a token budget and renders them grouped per place.
+
+    Every place found in the graph gets its best path before any place gets a second one, so a
+    dense neighbourhood cannot crowd the others out; the rest of the budget goes to the highest
+    scores overall.
+
+    Args:
+        places (list): Place display names, in prompt order.
+        place_keys (list): Sanitized keys matching `places`.
+        path_records (dict): {place_key: [PathRecord]} from retrieval.
+        description (str): The user's description of their interests.
+        budget: The user's budget, used to favour budget-related relations.
+        max_tokens (int): Context budget (default PROMPT_CONTEXT_TOKENS=1500).
+
+    Returns:
+        tuple: (context text, stats dict with candidates, selected, tokens and budget)
+    """
+    max_tokens = max_tokens or int(os.getenv("PROMPT_CONTEXT_TOKENS", 1500))
+    candidates = []
+    missing = []
+    for place_name, place_key in zip(places, place_keys):
+        if place_key not in path_records:
+            missing.append(place_name)
+            continue
+        candidates.extend((place_name, record) for record in path_records[place_key])
+
+    scores = score_paths(candidates, description, budget)
+    order = sorted(range(len(candidates)), key=lambda i: -scores[i])
+    first_per_place = {}
+    for i in order:
+        first_per_place.setdefault(candidates[i][0], i)
+    firsts = set(first_per_place.values())
+    ranked = list(first_per_place.values()) + [i for i in order if i not in firsts]
+
+    headers = {}
+    for place_name, record in candidates:
+        headers.setdefault(place_name, f"{place_name} [{record.source_type}]")
+    footer = f"Not in the knowledge graph: {', '.join(missing)}" if missing else ""
+
+    used = estimate_tokens(footer)
+    selected = defaultdict(list)
+    for i in ranked:
+        place_name, record = candidates[i]
+        line = f"- {path_line(record)}"
+        cost = estimate_tokens(line) + (0 if place_name in selected else estimate_tokens(headers[place_name]))
+        if used + cost > max_tokens:
+            continue
+        selected[place_name].append(line)
+        used += cost
+
+    blocks = [headers[place_name] + "\n" + "\n".join(selected[place_name]) for place_name in dict.fromkeys(places) if place_name in selected]
+    if footer:
+        blocks.append(footer)
+    context = "\n".join(blocks)
+    stats = {
+        "candidates": len(candidates),
+        "selected": sum(len(lines) for lines in selected.values()),
+        "tokens": estimate_tokens(context),
+        "max_tokens": max_tokens,
+    }
+    return context, stats
@@ -0,0 +1,33 @@
+# Batch incremental refresh of registered cities, e.g. from cron
+#
+# Usage:
+#   python refresh_cities.py                       # cities not refreshed within REFRESH_MAX_AGE_SECONDS
+#   python refresh_cities.py --max-age 0 Goa Jaipur --concurrency 4
+
+import argparse
+import contextlib
+import json
+import sys
+
+import main
+
+
+def summarize(reports):
+    totals = {"cities": len(reports), "failed": sum(1 for report in reports if "error" in report)}
+    for name in ("places", "added", "changed", "unchanged", "retired", "gemini_calls", "extractions_avoided",
+                 "prompt_tokens_avoided", "edges_added", "edges_retired"):
+        totals[name] = sum(report.get(name, 0) for report in reports)
+    return totals
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Incrementally refresh the knowledge graphs of registered cities")
+    parser.add_argument("cities", nargs="*", help="Cities to refresh (default: all registered cities)")
+    parser.add_argument("--max-age", type=float, help="Only refresh cities not refreshed for this many seconds")
+    parser.add_argument("--concurrency", type=int, help="Cities refreshed at once")
+    args = parser.parse_args()
+
+    # Progress output goes to stderr, so stdout carries only the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        reports = main.refresh_stale_cities(args.cities or None, args.max_age, args.concurrency)
+    print(json.dumps({"cities": reports, "totals": summarize(reports)}, indent=2))
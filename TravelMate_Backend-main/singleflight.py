@@ -0,0 +1,188 @@
+# Single-flight coalescing: concurrent identical calls share one in-flight computation
+
+import asyncio
+import contextlib
+import functools
+import inspect
+import os
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from api_cache import make_key
+
+# Seconds a caller waits for another caller's in-flight computation before giving up
+DEFAULT_TIMEOUTS = {"maps": 30, "wikipedia": 60, "gemini": 180, "knowledge_graph": 900, "city_refresh": 900}
+
+
+# (scope, join) pairs: the leader runs its call inside the scope() context managers, and each
+# caller that coalesces onto the call runs join() with what they yielded, e.g. so a follower can
+# raise the outbound priority of the leader's call
+_call_hooks: List[Tuple[Callable, Callable]] = []
+
+
+def register_call_hook(scope: Callable, join: Callable):
+    _call_hooks.append((scope, join))
+
+
+def _enter_scopes(stack: contextlib.ExitStack) -> list:
+    return [stack.enter_context(scope()) for scope, _ in _call_hooks]
+
+
+def _join(scopes):
+    for (_, join), state in zip(_call_hooks, scopes):
+        join(state)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.scopes = []
+
+
+class SingleFlight:
+    """
+    Groups of in-flight calls keyed by name and key.
+
+    The first caller for a key (the leader) runs the computation; callers arriving while it runs
+    (followers) wait for it and receive the same result or exception. Nothing is remembered once
+    the call completes, so this complements the response cache rather than replacing it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[tuple, _Call] = {}
+        # (future, leader's call scopes) by (loop, name, key)
+        self._futures: Dict[tuple, Tuple[asyncio.Future, list]] = {}
+        self.stats = defaultdict(lambda: {"leaders": 0, "coalesced": 0, "timeouts": 0})
+
+    @staticmethod
+    def timeout(name) -> float:
+        return float(os.getenv(f"SINGLEFLIGHT_TIMEOUT_{name.upper()}", DEFAULT_TIMEOUTS.get(name, 60)))
+
+    def do(self, name: str, key: str, fn: Callable, timeout: Optional[float] = None):
+        """Runs fn() unless an identical call is already in flight, in which case its outcome is shared."""
+        scopes = contextlib.ExitStack()
+        with self._lock:
+            call = self._calls.get((name, key))
+            leader = call is None
+            if leader:
+                call = self._calls[(name, key)] = _Call()
+                # Entered before followers can see the call, so they always find its scopes
+                call.scopes = _enter_scopes(scopes)
+                self.stats[name]["leaders"] += 1
+            else:
+                self.stats[name]["coalesced"] += 1
+
+        if leader:
+            try:
+                with scopes:
+                    call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[(name, key)]
+                call.done.set()
+        else:
+            _join(call.scopes)
+            if not call.done.wait(timeout if timeout is not None else self.timeout(name)):
+                with self._lock:
+                    self.stats[name]["timeouts"] += 1
+                raise TimeoutError(f"Timed out waiting for in-flight {name} call {key}")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def do_async(self, name: str, key: str, fn: Callable, timeout: Optional[float] = None):
+        """Coroutine variant of do(); fn() returns an awaitable. Calls coalesce within one event loop."""
+        loop = asyncio.get_running_loop()
+        future_key = (id(loop), name, key)
+        future, scopes = self._futures.get(future_key, (None, None))
+        if future is None:
+            future = loop.create_future()
+            stack = contextlib.ExitStack()
+            self._futures[future_key] = (future, _enter_scopes(stack))
+            self.stats[name]["leaders"] += 1
+            try:
+                with stack:
+                    result = await fn()
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                future.set_exception(e)
+                # Mark the exception retrieved, so asyncio does not log it when there are no followers
+                future.exception()
+                raise
+            else:
+                future.set_result(result)
+                return result
+            finally:
+                del self._futures[future_key]
+
+        self.stats[name]["coalesced"] += 1
+        _join(scopes)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout if timeout is not None else self.timeout(name))
+        except asyncio.TimeoutError:
+            self.stats[name]["timeouts"] += 1
+            raise TimeoutError(f"Timed out waiting for in-flight {name} call {key}")
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._futures)
+
+    def get_stats(self) -> Dict[str, dict]:
+        """Returns {name: {"leaders", "coalesced", "timeouts", "coalesced_rate"}}."""
+        with self._lock:
+            stats = {}
+            for name, counters in self.stats.items():
+                total = counters["leaders"] + counters["coalesced"]
+                stats[name] = dict(counters, coalesced_rate=counters["coalesced"] / total if total else 0.0)
+            return stats
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    return _single_flight
+
+
+def _bound_key(func, signature, case_sensitive):
+    def key(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return make_key(func.__name__, case_sensitive=case_sensitive, **bound.arguments)
+    return key
+
+
+def coalesced(name: str, key: Callable = None, case_sensitive: bool = False):
+    """
+    Decorator that coalesces concurrent identical calls of a function (sync or async).
+
+    Args:
+        name (str): Metrics group, which also selects the follower timeout
+            (SINGLEFLIGHT_TIMEOUT_<NAME>, defaults in DEFAULT_TIMEOUTS).
+        key (callable): Maps the call's arguments to its key; by default all arguments,
+            normalized like response cache keys.
+        case_sensitive (bool): Whether string arguments keep their case in the default key.
+    """
+    def decorator(func):
+        key_fn = key or _bound_key(func, inspect.signature(func), case_sensitive)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await _single_flight.do_async(name, key_fn(*args, **kwargs), lambda: func(*args, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return _single_flight.do(name, key_fn(*args, **kwargs), lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,7 @@
+# Tests import the backend modules from the directory above, as the servers do
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "ERROR")
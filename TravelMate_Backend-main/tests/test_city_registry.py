@@ -0,0 +1,18 @@
+from city_registry import CityRegistry
+
+
+def test_prefetch_claims_each_unregistered_city_once(tmp_path):
+    path = str(tmp_path / "cities.sqlite3")
+    first, second = CityRegistry(path), CityRegistry(path)
+    first.add("Goa")
+
+    assert first.claim_prefetch(["Goa", "Jaipur", " jaipur", "", "Agra"]) == ["Jaipur", "Agra"]
+    # Another worker sharing the file finds both cities already claimed
+    assert second.claim_prefetch(["Jaipur", "Agra", "Pune"]) == ["Pune"]
+
+
+def test_expired_prefetch_claims_are_reclaimed(tmp_path):
+    registry = CityRegistry(str(tmp_path / "cities.sqlite3"))
+    assert registry.claim_prefetch(["Jaipur"], ttl_seconds=0) == ["Jaipur"]
+    assert registry.claim_prefetch(["Jaipur"], ttl_seconds=0) == ["Jaipur"]
+    assert registry.claim_prefetch(["Jaipur"]) == []
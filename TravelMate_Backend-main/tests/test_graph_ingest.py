@@ -0,0 +1,153 @@
+import random
+from types import SimpleNamespace
+
+import networkx as nx
+import pandas as pd
+
+from graph_ingest import (assign_source_places, bulk_ingest, ingest_arango, prepare_graph_frames, retire_edges,
+                          sanitize_key)
+from tsv_stream import KNOWLEDGE_COLUMNS
+
+
+def frame(rows):
+    return pd.DataFrame([row + ["Thing", "Thing", "{}"] for row in rows], columns=KNOWLEDGE_COLUMNS)
+
+
+def test_rows_belong_to_the_last_place_named():
+    df = frame([["Beach Shack", "SERVES", "Seafood"],
+                ["Baga Beach", "LOCATED_IN", "Goa"],
+                ["Goa", "PART_OF", "India"],
+                ["Portuguese", "BUILT", "Fort Aguada"],
+                ["Fort Aguada", "NEAR", "Sinquerim"]])
+    df, current = assign_source_places(df, ["baga_beach", "fort_aguada"])
+    owners = df["Source_Place"].tolist()
+    assert pd.isna(owners[0])
+    assert owners[1:] == ["baga_beach", "baga_beach", "fort_aguada", "fort_aguada"]
+    assert current == "fort_aguada"
+
+    more, _ = assign_source_places(frame([["Sinquerim", "HAS", "Lighthouse"]]), ["baga_beach", "fort_aguada"], current)
+    assert more["Source_Place"].tolist() == ["fort_aguada"]
+
+
+def test_retiring_a_place_keeps_edges_other_places_added():
+    G = nx.Graph()
+    baga, _ = assign_source_places(frame([["Baga Beach", "NEAR", "Titos Lane"],
+                                          ["Titos Lane", "KNOWN_FOR", "Nightlife"]]), ["baga_beach"])
+    fort, _ = assign_source_places(frame([["Fort Aguada", "NEARBY_ATTRACTION", "Baga Beach"],
+                                          ["Fort Aguada", "BUILT_BY", "Portuguese"]]), ["fort_aguada"])
+    bulk_ingest(G, baga)
+    bulk_ingest(G, fort)
+
+    removed = retire_edges(G, ["baga_beach"])
+
+    assert sorted(map(tuple, removed[["source", "target"]].values)) == [("baga_beach", "titos_lane"),
+                                                                      ("titos_lane", "nightlife")]
+    assert G.has_edge("fort_aguada", "baga_beach")
+    assert G.has_edge("fort_aguada", "portuguese")
+    assert "baga_beach" in G
+
+
+NAMES = ["Baga Beach", "baga beach ", "Fort Aguada", "FORT-AGUADA", "Goa", "India", "Titos Lane", "Calangute"]
+TYPES = ["Place", "City", "Country", "Street"]
+
+
+def random_frame(rng):
+    rows = [[rng.choice(NAMES), rng.choice(["NEAR", "PART_OF", "KNOWN_FOR"]), rng.choice(NAMES),
+             rng.choice(TYPES), rng.choice(TYPES), rng.choice(["{}", '{"rating": 4}'])]
+            for _ in range(rng.randint(0, 12))]
+    return pd.DataFrame(rows, columns=KNOWLEDGE_COLUMNS)
+
+
+def row_by_row_ingest(G, df):
+    """The has_node/has_edge loop bulk_ingest replaced."""
+    for _, row in df.iterrows():
+        key_1, key_2 = sanitize_key(row["Node_1"]), sanitize_key(row["Node_2"])
+        if not G.has_node(key_1):
+            G.add_node(key_1, key=key_1, name=row["Node_1"], type=row["Node_1_Type"])
+        if not G.has_node(key_2):
+            G.add_node(key_2, key=key_2, name=row["Node_2"], type=row["Node_2_Type"])
+        if not G.has_edge(key_1, key_2):
+            G.add_edge(key_1, key_2, relation=row["Relation"], attributes=row["Attributes"])
+
+
+def test_bulk_ingest_matches_the_row_by_row_loop():
+    rng = random.Random(8)
+    for _ in range(200):
+        expected, actual = nx.Graph(), nx.Graph()
+        # Some frames land on a graph that already holds nodes and edges from an earlier build
+        for G in (expected, actual) if rng.random() < 0.5 else ():
+            row_by_row_ingest(G, frame([["Goa", "PART_OF", "India"]]))
+        df = random_frame(rng)
+
+        row_by_row_ingest(expected, df)
+        bulk_ingest(actual, df)
+
+        assert dict(actual.nodes(data=True)) == dict(expected.nodes(data=True))
+        assert {frozenset((u, v)): data for u, v, data in actual.edges(data=True)} == \
+               {frozenset((u, v)): data for u, v, data in expected.edges(data=True)}
+
+
+class FakeCollection:
+    def __init__(self):
+        self.imports = []
+
+    def import_bulk(self, documents, **kwargs):
+        self.imports.append((documents, kwargs))
+
+
+class FakeDatabase:
+    """Answers the two lookups ingest_arango makes and records bulk imports."""
+
+    def __init__(self, keys, pairs):
+        self.keys, self.pairs = set(keys), pairs
+        self.collections = {}
+        self.aql = SimpleNamespace(execute=self.execute)
+
+    def execute(self, query, bind_vars):
+        if "d._key" in query:
+            return [key for key in bind_vars["keys"] if key in self.keys]
+        ids = set(bind_vars["ids"])
+        return [[edge_from, edge_to] for edge_from, edge_to in self.pairs if edge_from in ids and edge_to in ids]
+
+    def collection(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+
+def fake_cache(node_ids):
+    return SimpleNamespace(data={node_id: {} for node_id in node_ids}, FETCHED_ALL_DATA=True, FETCHED_ALL_IDS=True)
+
+
+def test_arango_ingest_imports_only_new_nodes_and_edges_and_invalidates_them():
+    db = FakeDatabase(keys={"goa", "india", "calangute"}, pairs=[["places/india", "places/goa"]])
+    cached = ["places/goa", "places/india", "places/calangute"]
+    G = SimpleNamespace(db=db, default_node_type="places", edge_type_func=lambda u, v: f"{u}_to_{v}",
+                        _node=fake_cache(cached), _adj=fake_cache(cached))
+    df, _ = assign_source_places(frame([["Goa", "PART_OF", "India"],
+                                        ["Baga Beach", "LOCATED_IN", "Goa"],
+                                        ["Baga Beach", "NEAR", "Titos Lane"]]), ["baga_beach"])
+
+    result = bulk_ingest(G, df, batch_size=50)
+
+    [(node_docs, node_kwargs)] = db.collections["places"].imports
+    assert [doc["_key"] for doc in node_docs] == ["baga_beach", "titos_lane"]
+    assert node_docs[0] == {"_key": "baga_beach", "key": "baga_beach", "name": "Baga Beach", "type": "Thing"}
+    assert node_kwargs == {"on_duplicate": "ignore", "batch_size": 50}
+
+    [(edge_docs, edge_kwargs)] = db.collections["places_to_places"].imports
+    # Goa-India already exists in reverse, so only the two Baga Beach edges are imported
+    assert [(doc["_from"], doc["_to"]) for doc in edge_docs] == [("baga_beach", "goa"), ("baga_beach", "titos_lane")]
+    assert edge_docs[0]["source_place"] == "baga_beach"
+    assert edge_kwargs == {"from_prefix": "places/", "to_prefix": "places/", "batch_size": 50}
+    assert result.nodes["key"].tolist() == ["baga_beach", "titos_lane"]
+
+    # Endpoints of the new edges are dropped from nxadb's cache; untouched nodes stay cached
+    for cache in (G._node, G._adj):
+        assert set(cache.data) == {"places/india", "places/calangute"}
+        assert not cache.FETCHED_ALL_DATA and not cache.FETCHED_ALL_IDS
+
+
+def test_arango_ingest_skips_imports_when_everything_exists():
+    db = FakeDatabase(keys={"goa", "india"}, pairs=[["places/goa", "places/india"]])
+    result = ingest_arango(db, "places", "places_to_places", *prepare_graph_frames(frame([["Goa", "PART_OF", "India"]])))
+    assert db.collections == {}
+    assert result.nodes.empty and result.edges.empty
@@ -0,0 +1,109 @@
+import networkx as nx
+import pytest
+
+from graph_retrieval import NetworkXRetriever
+from graph_snapshot import GraphSnapshot, SnapshotCache
+
+PLACES = ["baga_beach", "fort_aguada"]
+
+
+def build_graph():
+    """Two places, each with a short chain of neighbours, plus a node just beyond the snapshot depth."""
+    G = nx.Graph()
+    chain = [("baga_beach", "titos_lane", "near"), ("titos_lane", "nightlife", "known_for"),
+             ("fort_aguada", "portuguese", "built_by"), ("portuguese", "lisbon", "from"),
+             ("lisbon", "portugal", "in"), ("portugal", "europe", "in")]
+    for u, v, relation in chain:
+        for key in (u, v):
+            G.add_node(key, name=key.replace("_", " ").title(), type="Place" if key in PLACES else "Thing")
+        G.add_edge(u, v, relation=relation)
+    return G
+
+
+def distances(records):
+    return {(source, record.target, len(record.relations))
+            for source, source_records in records.items() for record in source_records}
+
+
+def cached_snapshot(G, cache=None, city="goa", version=1):
+    cache = cache or SnapshotCache(max_depth=3)
+    cache.get_retriever(city, version, PLACES, NetworkXRetriever(G))
+    return cache
+
+
+def ingest(G, nodes, edges):
+    for key, data in nodes.items():
+        G.add_node(key, **data)
+    for u, v, relation in edges:
+        G.add_edge(u, v, relation=relation)
+
+
+def node(key):
+    return {key: {"name": key.title(), "type": "Thing"}}
+
+
+def test_snapshot_matches_the_live_graph():
+    G = build_graph()
+    snapshot = cached_snapshot(G)._snapshots["goa"]
+    assert snapshot.path_records("missing") is None
+    assert distances({key: snapshot.path_records(key) for key in PLACES}) == \
+        distances(NetworkXRetriever(G).retrieve(PLACES))
+
+
+def test_edge_list_round_trips_through_the_csr_arrays():
+    nodes = {**node("a"), **node("b"), **node("c")}
+    edges = [("a", "b", "r1"), ("b", "c", None), ("a", "c", "r2")]
+    snapshot = GraphSnapshot(nodes, edges, ["a"])
+    assert sorted(snapshot.edge_list(), key=str) == sorted(edges, key=str)
+    assert snapshot.node_data() == nodes
+
+
+def test_new_nodes_hanging_off_one_snapshot_node_are_patched_in():
+    G = build_graph()
+    cache = cached_snapshot(G)
+    nodes = {**node("beach_shack"), **node("seafood")}
+    edges = [("titos_lane", "beach_shack", "has"), ("beach_shack", "seafood", "serves")]
+    ingest(G, nodes, edges)
+
+    cache.apply_delta(nodes, edges, city="goa", version=2)
+
+    snapshot = cache._snapshots["goa"]
+    assert snapshot.version == 2
+    assert "beach_shack" in snapshot.keys.ids
+    assert distances(cache.get_retriever("goa", 2, PLACES, NetworkXRetriever(G)).retrieve(PLACES, 3)) == \
+        distances(NetworkXRetriever(G).retrieve(PLACES, 3))
+    assert cache.loads == 1
+
+
+@pytest.mark.parametrize("nodes, edges", [
+    # A shortcut between two existing nodes
+    ({}, [("baga_beach", "lisbon", "flights_to")]),
+    # A new node bridging two snapshot nodes
+    (node("ferry"), [("titos_lane", "ferry", "has"), ("ferry", "fort_aguada", "to")]),
+    # A new node bridging a snapshot node and a node the snapshot never loaded
+    (node("museum"), [("baga_beach", "museum", "near"), ("museum", "europe", "about")]),
+])
+def test_deltas_that_can_shorten_paths_drop_the_snapshot(nodes, edges):
+    G = build_graph()
+    cache = cached_snapshot(G)
+    ingest(G, nodes, edges)
+
+    cache.apply_delta(nodes, edges, city="goa", version=2)
+
+    assert "goa" not in cache._snapshots
+    assert distances(cache.get_retriever("goa", 2, PLACES, NetworkXRetriever(G)).retrieve(PLACES, 3)) == \
+        distances(NetworkXRetriever(G).retrieve(PLACES, 3))
+
+
+def test_unrelated_deltas_leave_other_snapshots_untouched():
+    G = build_graph()
+    cache = cached_snapshot(G)
+    cached_snapshot(G, cache, city="jaipur", version=5)
+    goa = cache._snapshots["goa"]
+    nodes = {**node("amber_fort")}
+    edges = [("amber_fort", "jaipur_city", "in")]
+
+    cache.apply_delta(nodes, edges, city="jaipur", version=6)
+
+    assert cache._snapshots["goa"] is goa
+    assert cache._snapshots["jaipur"].version == 6
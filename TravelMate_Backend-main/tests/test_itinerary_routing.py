@@ -0,0 +1,62 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from itinerary_routing import haversine_matrix, order_places, path_length, plan_route, two_opt
+
+
+def random_matrix(rng, n):
+    # Places scattered over roughly 50 km, like one city's attractions
+    return haversine_matrix(15.2 + rng.random(n) * 0.5, 73.8 + rng.random(n) * 0.5)
+
+
+def test_haversine_matrix():
+    # Mumbai to Pune, about 120 km in a straight line
+    D = haversine_matrix([19.0760, 18.5204, 19.0760], [72.8777, 73.8567, 72.8777])
+    assert D[0, 1] == pytest.approx(119.8, abs=1)
+    assert np.allclose(D, D.T)
+    assert np.allclose(np.diag(D), 0) and D[0, 2] == 0
+
+
+@pytest.mark.parametrize("n, expected", [(0, []), (1, [0]), (2, [0, 1])])
+def test_trivial_inputs(n, expected):
+    D = haversine_matrix([15.5, 15.6][:n], [73.8, 73.9][:n])
+    assert sorted(order_places(D)) == expected
+    assert two_opt(list(range(n)), D) == list(range(n))
+
+
+def test_small_inputs_match_the_brute_force_optimum():
+    rng = np.random.default_rng(21)
+    for _ in range(100):
+        n = int(rng.integers(3, 8))
+        D = random_matrix(rng, n)
+        order = order_places(D)
+        optimum = min(path_length(list(route), D) for route in itertools.permutations(range(n)))
+        assert sorted(order) == list(range(n))
+        assert path_length(order, D) == pytest.approx(optimum)
+
+
+@pytest.mark.parametrize("n", [5, 12, 30])
+def test_order_is_never_longer_than_the_input_order(n):
+    rng = np.random.default_rng(n)
+    for _ in range(50):
+        D = random_matrix(rng, n)
+        order = order_places(D)
+        assert sorted(order) == list(range(n))
+        assert path_length(order, D) <= path_length(list(range(n)), D) + 1e-9
+
+
+def test_plan_route_handles_zero_one_and_two_stops():
+    def place(name, lat, lng):
+        return {"name": name, "place_id": name, "geometry": {"location": {"lat": lat, "lng": lng}}}
+
+    assert plan_route([])["days"] == []
+    [day] = plan_route([place("Fort Aguada", 15.49, 73.77)])["days"]
+    assert [stop["transport"] for stop in day["stops"]] == [None]
+
+    route = plan_route([place("Fort Aguada", 15.49, 73.77), place("Baga Beach", 15.55, 73.75)])
+    [day] = route["days"]
+    assert {stop["name"] for stop in day["stops"]} == {"Fort Aguada", "Baga Beach"}
+    assert day["stops"][1]["transport"] == "Taxi"
+    assert route["distance_km"] == pytest.approx(day["stops"][1]["distance_km"], abs=0.01)
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from json_stream import JsonArrayStream, iter_json_array_items
+
+EVENTS = [
+    {"time": "09:00", "place": "Fort {Aguada}", "note": "bring [water] and \"shoes\""},
+    {"time": "12:30", "place": "Cafe \\ Bar", "tags": ["lunch", {"budget": "low"}]},
+    {"time": "18:00", "place": "Baga Beach", "note": "sunset } ] {"},
+]
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", range(1, 40))
+def test_items_are_yielded_for_every_chunk_size(size):
+    text = json.dumps(EVENTS)
+    assert list(iter_json_array_items(chunked(text, size))) == EVENTS
+
+
+def test_braces_and_brackets_inside_strings_do_not_end_items():
+    text = json.dumps([{"a": "}]", "b": "[{\\\"", "c": "\\\\"}])
+    assert list(iter_json_array_items([text])) == json.loads(text)
+
+
+@pytest.mark.parametrize("reply", [
+    "```json\n{}\n```",
+    "Here is your itinerary:\n{}\nEnjoy your trip!",
+])
+def test_fences_and_preamble_are_skipped(reply):
+    text = reply.format(json.dumps(EVENTS, indent=2))
+    assert list(iter_json_array_items(chunked(text, 7))) == EVENTS
+
+
+def test_items_are_yielded_before_the_array_closes():
+    parser = JsonArrayStream()
+    assert parser.feed('[{"a": 1}, {"b"') == [{"a": 1}]
+    assert parser.feed(': 2}]') == [{"b": 2}]
+    assert parser.complete
+
+
+def test_truncated_array_raises_after_yielding_complete_items():
+    text = json.dumps(EVENTS)[:-40]
+    items = iter_json_array_items(chunked(text, 5))
+    assert next(items) == EVENTS[0]
+    assert next(items) == EVENTS[1]
+    with pytest.raises(ValueError, match="ended before"):
+        next(items)
+
+
+def test_reply_without_an_array_raises():
+    with pytest.raises(ValueError, match="does not contain"):
+        list(iter_json_array_items(["Sorry, I cannot plan this trip."]))
+
+
+def test_malformed_item_is_skipped_and_marks_the_stream_incomplete():
+    parser = JsonArrayStream()
+    items = list(iter_json_array_items(['[{"a": 1}, {"b": }, {"c": 3}]'], parser))
+    assert items == [{"a": 1}, {"c": 3}]
+    assert len(parser.errors) == 1
+    assert not parser.complete
+
+
+def test_text_after_the_array_is_ignored():
+    chunks = iter(['[{"a": 1}]', " trailing"])
+    assert list(iter_json_array_items(chunks)) == [{"a": 1}]
+    assert next(chunks) == " trailing"
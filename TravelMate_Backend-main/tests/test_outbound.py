@@ -0,0 +1,108 @@
+import threading
+import time
+
+from outbound import BACKGROUND, INTERACTIVE, Lane, OutboundScheduler, background, current_priority
+from singleflight import SingleFlight
+
+
+def blocked_lane():
+    """A lane whose only background slot is taken, so background calls queue and interactive ones do not."""
+    lane = Lane("test", rate=0, burst=1, concurrency=4, background_concurrency=1)
+    with background():
+        assert lane.acquire(current_priority()) == BACKGROUND
+    return lane
+
+
+def call_through(lane, lanes):
+    def fn():
+        priority = lane.acquire(current_priority())
+        lanes.append(priority)
+        lane.release(priority)
+        return priority
+    return fn
+
+
+def test_interactive_calls_skip_the_background_cap():
+    lane = blocked_lane()
+    assert lane.acquire(current_priority()) == INTERACTIVE
+    assert lane.get_stats()["interactive"]["in_flight"] == 1
+
+
+def test_interactive_follower_promotes_only_the_joined_call():
+    lane, flight = blocked_lane(), SingleFlight()
+    joined_lanes, later_lanes = [], []
+    queued = threading.Event()
+
+    def build():
+        with background():
+            flight.do("maps", "goa", call_through(lane, joined_lanes))
+            queued.set()
+            # The build's next call, after the joined one, must stay in the background lane
+            call_through(lane, later_lanes)()
+
+    worker = threading.Thread(target=build)
+    worker.start()
+    deadline = time.monotonic() + 5
+    while lane.get_stats()["background"]["queued"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+    assert flight.do("maps", "goa", call_through(lane, []), timeout=5) == INTERACTIVE
+    assert joined_lanes == [INTERACTIVE]
+    assert queued.wait(5)
+    time.sleep(0.05)
+    assert later_lanes == []
+    assert lane.get_stats()["background"]["queued"] == 1
+
+    lane.release(BACKGROUND)
+    worker.join(5)
+    assert later_lanes == [BACKGROUND]
+
+
+def test_background_follower_does_not_promote():
+    lane, flight = blocked_lane(), SingleFlight()
+    results = []
+
+    def build():
+        with background():
+            results.append(flight.do("maps", "goa", call_through(lane, [])))
+
+    workers = [threading.Thread(target=build) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    time.sleep(0.1)
+    assert results == []
+    lane.release(BACKGROUND)
+    for worker in workers:
+        worker.join(5)
+    assert results == [BACKGROUND, BACKGROUND]
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.headers = {}
+        self.body = body
+        self.closed = False
+
+    def json(self):
+        return self.body
+
+    def close(self):
+        self.closed = True
+
+
+def test_maps_quota_errors_in_the_body_are_retried_like_a_429():
+    scheduler = OutboundScheduler(max_retries=3, backoff_base=0.001, backoff_max=0.01)
+    responses = iter([FakeResponse(200, {"status": "OVER_QUERY_LIMIT", "results": []}),
+                      FakeResponse(200, {"status": "OK", "results": [{"name": "Baga Beach"}]})])
+
+    response = scheduler.send("maps", lambda: next(responses))
+
+    assert response.json()["status"] == "OK"
+    assert scheduler.lane("maps").bucket.paused_until > 0
+
+
+def test_other_body_statuses_are_final():
+    scheduler = OutboundScheduler(max_retries=3, backoff_base=0.001, backoff_max=0.01)
+    responses = iter([FakeResponse(200, {"status": "REQUEST_DENIED", "results": []})])
+    assert scheduler.send("maps", lambda: next(responses)).json()["status"] == "REQUEST_DENIED"
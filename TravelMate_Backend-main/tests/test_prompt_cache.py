@@ -0,0 +1,47 @@
+import pytest
+
+from prompt_cache import budget_bracket, date_bucket, parse_budget
+
+
+@pytest.mark.parametrize("budget, amount", [
+    ("5000", 5000),
+    ("Rs. 5000", 5000),
+    ("Rs. 50000", 50000),
+    ("Rs. 200000", 200000),
+    ("Rs. 5,00,000", 500000),
+    ("₹ 75,000.50", 75000.5),
+    ("$1000-$2000", 1000),
+    ("50k", 50000),
+    ("50 K", 50000),
+    ("1.5 lakh", 150000),
+    ("2 lakhs INR", 200000),
+    ("1 crore", 10000000),
+    (48000, 48000),
+    (1500.0, 1500),
+    ("no budget", None),
+    ("", None),
+])
+def test_parse_budget(budget, amount):
+    assert parse_budget(budget) == amount
+
+
+def test_brackets_separate_budgets_an_order_of_magnitude_apart():
+    assert budget_bracket("Rs. 5000") == "2^12"
+    assert budget_bracket("Rs. 50000") == "2^15"
+    assert budget_bracket("Rs. 200000") == "2^17"
+    assert budget_bracket("$1000-$2000") == "2^9"
+    assert budget_bracket("50k") == budget_bracket("Rs. 50,000") == budget_bracket(50000)
+
+
+def test_close_budgets_share_a_bracket():
+    assert budget_bracket("Rs. 40000") == budget_bracket("60000")
+
+
+def test_budgets_without_a_number_are_normalized_text():
+    assert budget_bracket("  Flexible   Budget ") == "flexible budget"
+    assert budget_bracket("0") == "0"
+
+
+def test_date_bucket():
+    assert date_bucket("2026-12-20", "2026-12-27") == "2026-12:7d"
+    assert date_bucket("soon", "later") == "soon:later"
@@ -0,0 +1,17 @@
+import pytest
+
+from prompt_context import budget_level
+
+
+@pytest.mark.parametrize("budget, level", [
+    ("Rs. 5000", "low"),
+    ("20k", "low"),
+    ("Rs. 50000", None),
+    ("$1000-$2000", "low"),
+    ("Rs. 200000", "high"),
+    ("2 lakh", "high"),
+    ("Rs. 1,50,000", "high"),
+    ("flexible", None),
+])
+def test_budget_level(budget, level):
+    assert budget_level(budget) == level
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, coalesced, get_single_flight
+
+
+def run_concurrently(fn, count):
+    """Calls fn() from `count` threads and returns their results (or exceptions) in order."""
+    outcomes = [None] * count
+
+    def worker(i):
+        try:
+            outcomes[i] = fn()
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def blocking_call(release, result=None, error=None):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        if error is not None:
+            raise error
+        return result
+    return fn, calls
+
+
+def release_when_coalesced(flight, name, followers, release):
+    def watch():
+        deadline = time.monotonic() + 5
+        while flight.stats[name]["coalesced"] < followers and time.monotonic() < deadline:
+            time.sleep(0.005)
+        release.set()
+    threading.Thread(target=watch).start()
+
+
+def test_followers_share_the_leaders_result():
+    flight, release = SingleFlight(), threading.Event()
+    result = {"places": ["Baga Beach"]}
+    fn, calls = blocking_call(release, result=result)
+    release_when_coalesced(flight, "maps", 7, release)
+
+    outcomes = run_concurrently(lambda: flight.do("maps", "goa", fn), 8)
+
+    assert calls == [1]
+    assert all(outcome is result for outcome in outcomes)
+    assert flight.stats["maps"] == {"leaders": 1, "coalesced": 7, "timeouts": 0}
+    assert flight.in_flight() == 0
+
+
+def test_followers_share_the_leaders_exception():
+    flight, release = SingleFlight(), threading.Event()
+    error = RuntimeError("quota exceeded")
+    fn, calls = blocking_call(release, error=error)
+    release_when_coalesced(flight, "gemini", 3, release)
+
+    outcomes = run_concurrently(lambda: flight.do("gemini", "prompt", fn), 4)
+
+    assert calls == [1]
+    assert all(outcome is error for outcome in outcomes)
+
+
+def test_nothing_is_remembered_after_the_call():
+    flight = SingleFlight()
+    assert flight.do("maps", "goa", lambda: 1) == 1
+    assert flight.do("maps", "goa", lambda: 2) == 2
+    assert flight.stats["maps"]["coalesced"] == 0
+
+
+def test_follower_times_out_without_cancelling_the_leader():
+    flight, release = SingleFlight(), threading.Event()
+    fn, calls = blocking_call(release, result="done")
+    leader = threading.Thread(target=lambda: flight.do("maps", "goa", fn))
+    leader.start()
+    while not calls:
+        time.sleep(0.005)
+
+    with pytest.raises(TimeoutError):
+        flight.do("maps", "goa", fn, timeout=0.05)
+    release.set()
+    leader.join()
+    assert flight.stats["maps"]["timeouts"] == 1
+    assert calls == [1]
+
+
+def test_async_followers_share_the_result_and_exception():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch(value):
+        calls.append(value)
+        await asyncio.sleep(0.05)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    async def main():
+        error = ValueError("bad response")
+        results = await asyncio.gather(*[flight.do_async("maps", "goa", lambda: fetch("ok")) for _ in range(5)])
+        errors = await asyncio.gather(*[flight.do_async("gemini", "p", lambda: fetch(error)) for _ in range(3)],
+                                      return_exceptions=True)
+        return results, errors, error
+
+    results, errors, error = asyncio.run(main())
+    assert results == ["ok"] * 5
+    assert all(outcome is error for outcome in errors)
+    assert len(calls) == 2
+
+
+def test_decorator_keys_ignore_case_by_default():
+    release = threading.Event()
+    calls = []
+
+    @coalesced("test_decorator")
+    def search(city, radius=5):
+        calls.append(city)
+        release.wait(5)
+        return city.title()
+
+    spellings = iter(["goa", "GOA", "Goa"])
+    release_when_coalesced(get_single_flight(), "test_decorator", 2, release)
+    outcomes = run_concurrently(lambda: search(next(spellings)), 3)
+
+    assert len(calls) == 1
+    assert outcomes == ["Goa"] * 3
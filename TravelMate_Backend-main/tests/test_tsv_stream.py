@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from tsv_stream import KNOWLEDGE_COLUMNS, iter_batches, iter_lines, iter_sse_texts, iter_tsv_records
+
+ROWS = [
+    ["Goa", "has_beach", "Baga Beach", "City", "Beach", '{"note": "tabs\\tand\\nnewlines"}'],
+    ["Baga Beach", "near", "Tito's Lane", "Beach", "Street", "{}"],
+    ["Fort Aguada", "built_by", "Portuguese", "Fort", "People", '{"year": 1612}'],
+]
+TABLE = "\n".join("\t".join(row) for row in [KNOWLEDGE_COLUMNS] + ROWS) + "\n"
+EXPECTED = [dict(zip(KNOWLEDGE_COLUMNS, row)) for row in ROWS]
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", range(1, 40))
+def test_rows_are_yielded_for_every_chunk_size(size):
+    assert list(iter_tsv_records(chunked(TABLE, size))) == EXPECTED
+
+
+@pytest.mark.parametrize("reply", [
+    "```tsv\n" + TABLE + "```\n",
+    "```\n" + TABLE + "```\nThese relationships cover the main attractions.\tNot a row\tat\tall\tok",
+    "Here is the knowledge graph:\n\n" + TABLE,
+])
+def test_fences_and_preamble_are_skipped(reply):
+    assert list(iter_tsv_records(chunked(reply, 9))) == EXPECTED
+
+
+def test_windows_line_endings():
+    assert list(iter_tsv_records([TABLE.replace("\n", "\r\n")])) == EXPECTED
+
+
+def test_truncated_last_row_is_dropped():
+    text = TABLE.rstrip("\n")
+    text = text[:text.rindex("\t")]
+    text = text[:text.rindex("\t")]
+    assert list(iter_tsv_records(chunked(text, 4))) == EXPECTED[:2]
+
+
+def test_stray_tabs_stay_in_the_attributes_column():
+    row = "\t".join(ROWS[1][:5] + ['{"a":', '1}'])
+    records = list(iter_tsv_records(["\t".join(KNOWLEDGE_COLUMNS) + "\n" + row]))
+    assert records[0]["Attributes"] == '{"a":\t1}'
+
+
+def test_lines_are_yielded_as_soon_as_complete():
+    lines = iter_lines(iter(["a\nb", "c\n", "d"]))
+    assert next(lines) == "a"
+    assert next(lines) == "bc"
+    assert next(lines) == "d"
+
+
+def test_batches():
+    assert list(iter_batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def test_sse_texts():
+    event = {"candidates": [{"content": {"parts": [{"text": "Node_1\t"}, {"text": "Relation"}]}}]}
+    lines = [b"data: " + json.dumps(event).encode(), b"", ": keep-alive"]
+    assert "".join(iter_sse_texts(lines)) == "Node_1\tRelation"
@@ -0,0 +1,51 @@
+# Offline text vectors: feature-hashed bag of words, no model download required
+
+import re
+import zlib
+from typing import Iterable, List
+
+import numpy as np
+
+DEFAULT_DIM = 1024
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have i in is it its of on or our the their to we with "
+    "looking want would like love prefer visit visiting trip".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric tokens without stopwords."""
+    return [token for token in re.findall(r"[a-z0-9]+", str(text).lower()) if token not in STOPWORDS]
+
+
+def _features(tokens):
+    yield from tokens
+    for first, second in zip(tokens, tokens[1:]):
+        yield f"{first} {second}"
+
+
+def hash_vectorize(texts: Iterable[str], dim: int = DEFAULT_DIM) -> np.ndarray:
+    """
+    Embeds texts as L2-normalized hashed unigram+bigram counts.
+
+    Returns:
+        np.ndarray: float32 matrix of shape (len(texts), dim). All-zero rows stay zero.
+    """
+    texts = list(texts)
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for feature in _features(tokenize(text)):
+            digest = zlib.crc32(feature.encode("utf-8"))
+            # The top bit picks a sign so that colliding features tend to cancel out
+            matrix[row, digest % dim] += 1.0 if digest & 0x80000000 else -1.0
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def cosine_similarities(query: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """Cosine similarity of one normalized vector against every row of a normalized matrix."""
+    if matrix.size == 0:
+        return np.zeros(0, dtype=np.float32)
+    return matrix @ query
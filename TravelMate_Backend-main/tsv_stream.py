@@ -0,0 +1,77 @@
+# Incremental parsing of a streamed TSV completion into complete rows
+
+import json
+from typing import Dict, Iterable, Iterator, List
+
+KNOWLEDGE_COLUMNS = ["Node_1", "Relation", "Node_2", "Node_1_Type", "Node_2_Type", "Attributes"]
+
+
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Reassembles arbitrary text chunks into complete lines, as soon as each newline arrives."""
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+def iter_tsv_records(chunks: Iterable[str], required: int = 5) -> Iterator[Dict[str, str]]:
+    """
+    Yields one dict per complete TSV row of a streamed completion.
+
+    Markdown code fences are stripped on the fly: any text before the header row is ignored,
+    and a closing fence after the table ends it. The header is the first line containing a tab.
+
+    Args:
+        chunks (iterable): Text fragments in arrival order.
+        required (int): Rows with fewer fields than this are skipped as truncated or malformed.
+    """
+    header: List[str] = None
+    for line in iter_lines(chunks):
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            if header is not None:
+                return
+            continue
+        if not stripped:
+            continue
+        if header is None:
+            if "\t" in line:
+                header = [column.strip() for column in line.split("\t")]
+            continue
+        fields = line.split("\t")
+        if len(fields) < required:
+            continue
+        # Keep stray tabs inside the trailing Attributes JSON rather than dropping data
+        if len(fields) > len(header):
+            fields = fields[:len(header) - 1] + ["\t".join(fields[len(header) - 1:])]
+        yield dict(zip(header, (field.strip() for field in fields)))
+
+
+def iter_batches(items: Iterable, size: int) -> Iterator[list]:
+    """Groups an iterator into lists of at most `size` items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_sse_texts(lines: Iterable) -> Iterator[str]:
+    """Extracts the generated text from Gemini `streamGenerateContent?alt=sse` events."""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.startswith("data:"):
+            continue
+        event = json.loads(line[len("data:"):].strip())
+        for candidate in event.get("candidates", [])[:1]:
+            for part in candidate.get("content", {}).get("parts", []):
+                if part.get("text"):
+                    yield part["text"]
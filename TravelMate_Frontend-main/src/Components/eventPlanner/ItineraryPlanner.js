@@ -34,16 +34,26 @@ const ItineraryPlanner = () => {
 
     const userInput = `You are an event planner and your task is to plan a series of events for a group of tourists visiting the region of ${userData.destination} between ${userData.departureDate} to ${userData.returnDate}. They have a budget of ${userData.budget}, so plan accordingly.`;
 
+    // Aborted on unmount (and on StrictMode's dev re-run), so only one stream feeds the plan
+    const controller = new AbortController();
+
     const fetchEventPlan = async () => {
       try {
-        const response = await fetch("http://localhost:5000/api/event-planner", {
+        setFetchedPlan([]); // Start from an empty plan; events are appended as they stream in
+        // Events are streamed as NDJSON, one per line, and shown as soon as each arrives
+        const response = await fetch("http://localhost:5000/api/event-planner/stream", {
           method: "POST",
+          signal: controller.signal,
           headers: {
             "Content-Type": "application/json",
           },
           body: JSON.stringify({
             selectedPlaces: statement,
             userInput: userInput,
+            // Maps places with their coordinates, so the backend can order visits into days
+            places: selectedPlaces,
+            departureDate: userData.departureDate,
+            returnDate: userData.returnDate,
           }),
         });
 
@@ -51,16 +61,33 @@ const ItineraryPlanner = () => {
           throw new Error(`HTTP error! Status: ${response.status}`);
         }
 
-        const data = await response.json();
-        setFetchedPlan(data || []); // Update state with fetched data
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        while (true) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const lines = buffer.split("\n");
+          buffer = lines.pop();
+          for (const line of lines) {
+            if (!line.trim()) continue;
+            const event = JSON.parse(line);
+            if (event.error) throw new Error(event.error);
+            setFetchedPlan((plan) => [...plan, event]); // Append each event as it arrives
+            setIsLoading(false);
+          }
+        }
       } catch (error) {
+        if (error.name === "AbortError") return; // Unmounted; a newer run owns the plan
         console.error("Error fetching event plan:", error);
       } finally {
-        setIsLoading(false); // Stop loading state
+        if (!controller.signal.aborted) setIsLoading(false); // Stop loading state
       }
     };
 
     fetchEventPlan(); // Fetch event plan when component mounts
+    return () => controller.abort();
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []); // Empty dependency array to run only once when mounted
 